@@ -0,0 +1,76 @@
+#----------------------------------------------------------------------------
+# Name:         ByteRing.py
+# Abstract:     Input buffer for the serial acquisition thread.  A fixed
+#               bytearray used as a ring: serial reads go straight into it
+#               with readinto(), and readers get memoryview chunks of it, so
+#               nothing is allocated or sliced per byte.
+#----------------------------------------------------------------------------
+import serial        # pip install -U pySerial
+
+
+# Chunks handed out by Peek() are views into the ring -- they're only good until the next Peek()/Fill(), so use
+# them (or copy them) straight away.  When Peek() is called the assumption is that there *should* be data coming,
+# so if nothing turns up before the serial port's timeout a SerialException is thrown.
+class ByteRing():
+
+    def __init__(self, serI, size=65536):
+        self.serI = serI
+        self.size = size
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.highWater = 0 # Most bytes ever held at once
+        self.Reset()
+
+    # Throw away anything buffered
+    def Reset(self):
+        self.rd = 0 # Where the next byte will be read from...
+        self.count = 0 # ...and how many there are
+
+    def __len__(self):
+        return self.count
+
+    # Read from the serial port into the free space: everything that's waiting (as much as fits, anyway) or, if
+    # block is set and nothing is waiting, hang for at least one byte.  Returns the number of bytes read.
+    def Fill(self, block=True):
+        if self.count == 0: # Start over at the beginning so chunks come out as long as possible
+            self.rd = 0
+        got = 0
+        while self.count < self.size:
+            wr = (self.rd + self.count) % self.size
+            end = self.size if wr >= self.rd else self.rd # Contiguous free space runs to here
+            btg = min(self.serI.in_waiting, end-wr)
+            if btg == 0:
+                if not block or got:
+                    break
+                btg = 1
+            n = self.serI.readinto(self.view[wr:wr+btg])
+            self.count += n
+            got += n
+            if n < btg: # Timed out
+                break
+        self.highWater = max(self.highWater, self.count)
+        return got
+
+    # Return a memoryview of the next contiguous chunk of buffered data (at least one byte), reading from the
+    # serial port first as needed.  Nothing is consumed until Consume() is called.
+    def Peek(self):
+        self.Fill(block=(self.count == 0))
+        if self.count == 0: # Nothing available
+            raise serial.SerialException
+        end = min(self.rd + self.count, self.size)
+        return self.view[self.rd:end]
+
+    # A copy of the first n bytes of buffered data (or as many as there are), running on round the end of the ring if
+    # need be.  Nothing is consumed or read from the port.
+    def PeekCopy(self, n):
+        n = min(n, self.count)
+        end = self.rd + n
+        if end <= self.size:
+            return bytes(self.view[self.rd:end])
+        return bytes(self.view[self.rd:]) + bytes(self.view[:end-self.size])
+
+    # Discard the first n bytes of buffered data
+    def Consume(self, n):
+        n = min(int(n), self.count) # (Decoders may count in NumPy integers, which mustn't end up in the stats)
+        self.rd = (self.rd + n) % self.size
+        self.count -= n
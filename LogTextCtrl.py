@@ -1,38 +1,132 @@
+import collections
+import logging
+import logging.handlers
+import queue
+import threading
+import time
 import wx
 
-# LogTextCtrl is just a regular text control that eventually deletes some data so that
-# the output doesn't grow without bounds
-class LogTextCtrl(wx.TextCtrl):
-    
-    MAX_LOG_LEN = 10000   # Maximum number of characters allowed
-    CULL_LEN = 2500 # Approximate number of characters to dischard when MAX_LOG_LEN exceeded
-    
+# Where log lines are kept: a bounded deque of (time, level, text) records, one per line, the oldest dropping off
+# the front once there are maxLines of them.  Log/LogWarning/LogError can be called from any thread -- adding a line
+# is just an append under a lock -- so the serial threads don't need a wx.CallAfter per message.  Optionally every
+# message is copied to a rotating log file too, written by a thread of its own.
+class LogBuffer():
+
+    PREFIX = {logging.INFO: "", logging.WARNING: "WARNING: ", logging.ERROR: "ERROR: "}
+
+    def __init__(self, maxLines=5000):
+        self.lines = collections.deque(maxlen=maxLines)
+        self.lock = threading.Lock()
+        self.count = 0 # Lines ever added, so a viewer can tell if anything's new
+        self.mirror = None # Queue of records for the log file's writer thread...
+        self.mirrorThread = None # ...which is this
+
+    def Add(self, level, text):
+        if text.endswith("\n"):
+            text = text[:-1]
+        now = time.time()
+        with self.lock:
+            for line in text.split("\n"):
+                self.lines.append((now, level, line))
+                self.count += 1
+        mirror = self.mirror # (Once -- CloseMirror may be clearing it on another thread)
+        if mirror is not None:
+            mirror.put_nowait(logging.makeLogRecord({"msg": text, "levelno": level,
+                "levelname": logging.getLevelName(level), "created": now}))
+
+    def Log(self, data):
+        self.Add(logging.INFO, data)
+
+    def LogWarning(self, data):
+        self.Add(logging.WARNING, data)
+
+    def LogError(self, data):
+        self.Add(logging.ERROR, data)
+
+    # (count, list of records) as things stand
+    def Snapshot(self):
+        with self.lock:
+            return self.count, list(self.lines)
+
+    # Also write everything to fileName from now on, starting a new file (and keeping that many old ones) whenever
+    # it reaches maxBytes
+    def MirrorTo(self, fileName, maxBytes=1<<20, backups=3):
+        self.CloseMirror()
+        handler = logging.handlers.RotatingFileHandler(fileName, maxBytes=maxBytes, backupCount=backups)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(message)s"))
+        self.mirror = queue.Queue() # (Unbounded, so logging never waits on the disk)
+        self.mirrorThread = logging.handlers.QueueListener(self.mirror, handler)
+        self.mirrorThread.start()
+
+    def CloseMirror(self):
+        if self.mirrorThread is not None:
+            self.mirror = None
+            self.mirrorThread.stop() # Writes out whatever's queued first
+            for handler in self.mirrorThread.handlers:
+                handler.close()
+            self.mirrorThread = None
+
+
+# LogTextCtrl shows a LogBuffer in a virtual list control: the control only ever asks for the lines it's displaying,
+# and a timer brings it up to date a few times a second, so the cost to the GUI doesn't depend on how much gets
+# logged.  It keeps the Log/LogWarning/LogError methods of the text control it replaces.
+class LogTextCtrl(wx.ListCtrl):
+
+    FLUSH_MS = 100 # How often new lines are shown
+    COLUMN_WIDTH = 1200 # Wide enough for any line; longer ones scroll
+
+    def __init__(self, parent, id=-1, pos=wx.DefaultPosition, size=wx.DefaultSize,
+        style=wx.LC_REPORT|wx.LC_VIRTUAL|wx.LC_NO_HEADER, buffer=None):
+        wx.ListCtrl.__init__(self, parent, id, pos, size, style)
+        self.buffer = buffer if buffer is not None else LogBuffer()
+        self.shown = [] # Records the control is currently showing
+        self.shownCount = 0
+        self.InsertColumn(0, "", width=self.COLUMN_WIDTH)
+
+        self.attrs = {}
+        for level, color in ((logging.WARNING, "YELLOW GREEN"), (logging.ERROR, "RED")):
+            self.attrs[level] = wx.ItemAttr()
+            self.attrs[level].SetTextColour(wx.Colour(color))
+
+        self.timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnFlush, self.timer)
+        self.timer.Start(self.FLUSH_MS)
+
     def Log(self,data):
-        self.AppendText(data)
-        
-        if (self.GetLastPosition() > self.MAX_LOG_LEN):
-            xy = self.PositionToXY(self.CULL_LEN) # Figure out what (X,Y) position we're at CULL_LEN characters into the text
-            cPos = self.XYToPosition(0,xy[1]+1) # Find character position of beginning of next line (might fail)
-            if cPos >= 0: # Didn't fail
-                self.Remove(0,cPos)
-    
+        self.buffer.Log(data)
+
     def LogWarning(self,data):
-        
-        sp = self.GetLastPosition()
-        self.AppendText("WARNING: ")
-        ep = self.GetInsertionPoint()-1
-        self.SetStyle(sp,ep,wx.TextAttr("YELLOW GREEN"))
-        self.Log(data)
-        
+        self.buffer.LogWarning(data)
+
     def LogError(self,data):
-        
-        sp = self.GetLastPosition()
-        self.AppendText("ERROR: ")
-        ep = self.GetInsertionPoint()-1
-        self.SetStyle(sp,ep,wx.TextAttr("RED"))
-        self.Log(data)
-        
-        wx.Bell()
-       
+        self.buffer.LogError(data)
+
+    def SetLogFile(self, fileName, maxBytes=1<<20, backups=3):
+        self.buffer.MirrorTo(fileName, maxBytes, backups)
+
+    def CloseLogFile(self):
+        self.buffer.CloseMirror()
+
+    # Show whatever's been logged since last time, all in one go.  The view only follows new lines if it was already
+    # showing the last one (so it doesn't jump away from something being read).
+    def OnFlush(self, event):
+        if self.buffer.count == self.shownCount:
+            return
+        count, lines = self.buffer.Snapshot()
+        new = lines[max(0, len(lines) - (count - self.shownCount)):]
+        atEnd = self.GetTopItem() + self.GetCountPerPage() >= self.GetItemCount()
+        self.shown = lines
+        self.shownCount = count
+        self.SetItemCount(len(lines))
+        self.Refresh()
+        if atEnd and lines:
+            self.EnsureVisible(len(lines) - 1)
+        if any(level >= logging.ERROR for t, level, line in new):
+            wx.Bell()
 
+    def OnGetItemText(self, item, col):
+        t, level, line = self.shown[item]
+        return self.buffer.PREFIX.get(level, "") + line
 
+    def OnGetItemAttr(self, item):
+        return self.attrs.get(self.shown[item][1])
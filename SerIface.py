@@ -0,0 +1,358 @@
+#----------------------------------------------------------------------------
+# Name:         SerIface.py
+# Abstract:     Serial port interface -- the thread that listens for the
+#               scope's hardcopy output and decodes it.  No wx in here: it
+#               reports back through the methods of the "gui" object it's
+#               given, via a post function (wx.CallAfter in the GUI) so they
+#               run on the right thread.  Pixels don't go that way: they're
+#               written straight into a shared IndexedFrame (self.frame, from
+#               a FramePool, sized to suit each capture), which the GUI reads
+#               from at its own pace.  Nor does logging: the log
+#               object's methods must be safe to call from this thread.
+#               Each capture's timings are collected in a CaptureStats and
+#               handed over with it.  If there's a stream (a TekStream
+#               channel), rows are queued to it as they complete.
+#----------------------------------------------------------------------------
+import serial        # pip install -U pySerial     
+import threading     # pip install -U pyThreading
+import time          # pip install -U pyTime
+
+from TekDecode import MakeDecoder, DetectFormat, DecodeError, HeaderParser, DEFAULT_FORMAT, DETECT_BYTES
+from ByteRing import ByteRing
+from TekReplay import RecordingSerial
+from TekFrame import FramePool, DEFAULT_PALETTE
+from TekStats import CaptureStats
+
+TEK_XRES=552 # Screen resolution of scope, X dimension
+TEK_YRES=704 # Ditto, Y
+STATUS_INTERVAL=0.25 # Seconds between progress updates during a capture
+
+
+# Dancing dots
+class DDots():
+    
+    def __init__(self, min=3, max=13, c='.'):
+        self.min = min
+        self.max = max
+        self.c = c
+        self.num = self.min
+        
+    def Dots(self):
+        dots = self.c*self.num
+        self.num += 1
+        if self.num>self.max:
+            self.num = self.min
+        return dots
+    
+    def Reset(self):
+        self.num = self.min
+    
+
+# Serial port interface
+class SerIface(threading.Thread):
+    
+    # Captures are decoded into frames from pool (one is made if not given).  fmt is the data format the scope's set
+    # to, if it's known; otherwise it's told from the start of each capture's data.
+    def __init__(self, gui, port="", recordDir=None, post=None, baud=19200, pool=None, stream=None, fmt=None):
+        threading.Thread.__init__(self)
+        
+        self.baud = baud
+        self.fixedFormat = fmt
+        self.recordDir = recordDir # If set, everything read from the port is saved to a session file in here
+        # Set up to "change to" initial port
+        self.newPort = port # We'll switch over to this port if it's not the same as self.port
+        self.newPortF = True # Flag set by GUI when self.newPort has been changed
+        self.gui = gui
+        self.ltc = gui.GetLogTextCtrl()
+        self.post = post # How to get a call over to the GUI's thread (None: just call it)
+        self.pool = pool if pool is not None else FramePool(DEFAULT_PALETTE)
+        self.frame = self.pool.Get(TEK_XRES,TEK_YRES) # The capture in progress, or the last one
+        self.stream = stream # Gets Begin(), Rows() and End() (or Abort()) calls for each capture, if set (none of them ever wait)
+        self.terminate = False # Exit thread when this becomes true
+        self.wake = threading.Event() # Cuts short any wait between states
+        self.portClosed = threading.Event() # Set whenever the port isn't open, so others can tell when it's free
+        self.portClosed.set()
+        self.serI = None
+        self.redo = None # Image data GetData is to go over again in another format (None unless it is)
+        self.carryOver = False # Set when a capture's just finished, so whatever came in after it is kept
+        self.stats = CaptureStats() # Timings for the capture in progress (from the end of the last one)
+        self.posted = 0 # Calls posted to the GUI's thread (only ever changed on this thread)...
+        self.delivered = 0 # ...and how many of them have run (only ever changed on the GUI's)
+        
+    # Ask the thread to finish (it doesn't wait for it to); any wait or read in progress is cut short
+    def Terminate(self):
+        self.terminate = True
+        self.Wake()
+        
+    # Switch over to another serial port (and/or baud rate) as soon as possible
+    def SetPort(self, port, baud=None):
+        if baud:
+            self.baud = baud
+        self.newPort = port
+        self.newPortF = True
+        self.Wake()
+        
+    def Wake(self):
+        self.wake.set()
+        serI = self.serI
+        if serI is not None and serI.is_open:
+            try:
+                serI.cancel_read() # Blocked reads return at once with whatever they have
+            except (AttributeError, serial.SerialException, OSError): # (Not all platforms can)
+                pass
+        
+    # Call f(*args) on the GUI's thread
+    def Post(self, f, *args):
+        if self.post is None:
+            f(*args)
+        else:
+            self.posted += 1
+            self.stats.maxBacklog = max(self.stats.maxBacklog, self.posted - self.delivered)
+            self.post(self.Deliver, f, args)
+            
+    # (On the GUI's thread)
+    def Deliver(self, f, args):
+        self.delivered += 1
+        f(*args)
+        
+    # Update status label in GUI
+    def SetStatus(self, text):
+        self.Post(self.gui.SetSerStatus,text)
+        
+    # Thread begins here when started
+    def run(self):
+        
+        self.state = self.OpenPort # F points to current function (state machine-like)
+        self.lastState = None
+        
+        #self.serI = serial.Serial(port=None, baudrate=9600, rtscts=1, timeout=0.25) # Defaults to 8-N-1
+        if self.recordDir:
+            self.serI = RecordingSerial(self.recordDir, port=None, baudrate=self.baud, rtscts=1, timeout=0.25)
+        else:
+            self.serI = serial.Serial(port=None, baudrate=self.baud, rtscts=1, timeout=0.25) # Defaults to 8-N-1
+        self.db = ByteRing(self.serI)
+        self.header = HeaderParser()
+        self.dd = DDots()
+        
+        delay = 0
+        while not(self.terminate):
+            if delay!=0:
+                t = time.perf_counter()
+                self.wake.wait(delay) # ...wait specified time (or until woken) before going to next state
+                self.wake.clear()
+                self.stats.AddState("Sleep", time.perf_counter() - t)
+            curState = self.state # Record current state...
+            self.stateStart = time.perf_counter()
+            delay = self.state() # Invoke current state...
+            self.stats.AddState(curState.__name__, time.perf_counter() - self.stateStart) # (Time spent in each, per capture)
+            self.lastState = curState # (...so that states can see where they came from)
+            
+        self.serI.close()
+        self.portClosed.set()
+        return # Exit thread
+    
+    # Try to open or change specified serial port        
+    def OpenPort(self):
+        
+        # Check if serial port has changed (GUI sets, we reset)
+        if self.newPortF:
+            self.newPortF = False;
+            if self.baud != self.serI.baudrate:
+                self.serI.baudrate = self.baud
+            if self.newPort != self.serI.port:
+                self.ltc.Log("Serial port set to '%s' (%d baud)\n" % (self.newPort, self.baud))
+                try:
+                    self.serI.port = self.newPort
+                except serial.SerialException:
+                    pass # Code below will catch the problem
+            
+        if self.serI.port=="" or self.serI.port==None:
+            self.SetStatus("No serial port specified" + self.dd.Dots())
+            return 0.5
+        
+        # Try to open serial port
+        try:
+            self.serI.open()
+            
+#        except serial.SerialException, err:
+        except IOError as e:
+            self.SetStatus("Unable to open specified port" + self.dd.Dots())
+            return 0.5
+        
+        # Port opened successfully
+        self.portClosed.clear()
+        if self.recordDir:
+            self.ltc.Log("Recording session to '%s'\n" % self.serI.session.fileName)
+        self.state = self.WaitForHeader
+        return 0
+    
+    def WaitForHeader(self):
+
+        # Check if serial port has changed (GUI sets, we reset)
+        if self.newPortF and (self.newPort != self.serI.port or self.baud != self.serI.baudrate): # Only attempt re-open if actual port name (or speed) has changed
+                self.serI.close()
+                self.portClosed.set()
+                self.state = self.OpenPort
+                return 0
+        self.newPortF = False
+        
+        # Check if this is the first time here
+        if self.lastState != self.WaitForHeader: # Yep
+            if not self.carryOver: # (After a whole capture, what follows may well be the next one's header)
+                self.serI.flushInput()
+                self.db.Reset()
+            self.carryOver = False
+            self.header.Reset()
+            self.SetStatus("Waiting for header" + self.dd.Dots())
+
+        # Scan whatever's arrived for the header; this only waits as long as the port's timeout if nothing has, so
+        # the header is picked up as soon as it's all in, and whatever follows it stays buffered for GetData
+        try:
+            while not self.header.done:
+                if self.terminate or self.newPortF: # (In case it's a steady stream of something else)
+                    return 0
+                chunk = self.db.Peek()
+                self.db.Consume(self.header.Feed(chunk))
+        except serial.SerialException: # Nothing doing -- come back round so a port change or quit gets noticed
+            self.SetStatus("Waiting for header" + self.dd.Dots())
+            return 0
+
+        # We're good to go!
+        self.xRes = self.header.xRes
+        self.yRes = self.header.yRes
+        self.header.Reset()
+            
+        self.state = self.WaitForData
+        return 0
+    
+    def WaitForData(self):
+        # The scope pauses for around a second before beginning the actual data block, so this state just provides a
+        # longer timeout than the port's own (which is too short)
+
+        self.SetStatus("Header received, waiting for data...")
+        deadline = time.monotonic() + 2.0
+        while len(self.db) == 0: # (The data may have come in with the header)
+            if self.terminate or self.newPortF or time.monotonic() > deadline:
+                self.state = self.WaitForHeader
+                return 0
+            self.db.Fill() # Waits up to the port's timeout for the first byte
+
+        # Enough to tell which data format the scope's been set to (a few ms' worth; if it stops short of that, it
+        # must be a very small compacted image) -- in one piece, even if it runs round the end of the ring
+        if self.fixedFormat is not None:
+            self.format = self.fixedFormat
+        else:
+            while len(self.db) < DETECT_BYTES and self.db.Fill() and not self.terminate:
+                pass
+            self.format = DetectFormat(self.db.PeekCopy(DETECT_BYTES))
+
+        self.state = self.GetData
+        return 0
+        
+    # Let anyone watching the capture in progress know there's no more of it coming
+    def StreamAbort(self):
+        if self.stream is not None:
+            self.stream.Abort()
+
+    def GetData(self):
+        
+        totPix = self.xRes * self.yRes # Total pixels we'll acquire
+        dec = MakeDecoder(self.format, self.xRes, self.yRes)
+        payload = bytearray() # The raw data, for anyone who wants to keep it
+        redo = self.redo # Data already taken from the ring, if this is a second go in another format
+        secondGo = self.redo is not None
+        self.redo = None
+        self.frame = self.pool.Get(self.xRes, self.yRes) # (Almost always the same one as last time)
+        self.frame.Reset() # New page -- the GUI sees this on its next update
+        if self.stream is not None:
+            self.stream.Begin(self.frame)
+        nextStatus = time.monotonic() + STATUS_INTERVAL
+        stats = self.stats
+        
+        self.SetStatus("Receiving data (0%)" + self.dd.Dots())
+        self.ltc.Log("Beginning screen capture (%dx%d%s%s).\n" % (self.xRes, self.yRes, ", vertical" if self.frame.turns else "",
+            "" if self.format == DEFAULT_FORMAT else ", " + self.format))
+        
+        try: # Try to get all the pixels
+            
+            while not dec.done:
+                
+                chunk = redo if redo else self.db.Peek()
+                t = time.perf_counter()
+                pix, used = dec.Feed(chunk)
+                stats.decodeSeconds += time.perf_counter() - t
+                payload += chunk[:used]
+                if redo:
+                    redo = redo[used:]
+                else:
+                    stats.AddBytes(used) # (What's gone over again was counted the first time)
+                    self.db.Consume(used) # Anything past the end of the image stays buffered
+                if len(pix) == 0: # Only part of a run so far
+                    continue
+                
+                if self.terminate: # Good time to check if we should quit the thread
+                    self.StreamAbort()
+                    return 0
+                
+                # Into the frame -- the GUI picks it up from there, so this costs it nothing however small the batch
+                t = time.perf_counter()
+                self.frame.Write(pix)
+                stats.writeSeconds += time.perf_counter() - t
+                stats.pixels += len(pix)
+                stats.batches += 1
+                if self.stream is not None:
+                    self.stream.Rows(self.frame)
+                if time.monotonic() >= nextStatus: # Progress goes over at a fixed rate, not once per batch
+                    nextStatus = time.monotonic() + STATUS_INTERVAL
+                    pd = round(float(dec.pixDone)/float(totPix) * 100)
+                    self.SetStatus("Receiving data (%d%%)" % pd + self.dd.Dots())
+                
+        except DecodeError: # Not supposed to happen -- unless the format was told wrongly from the start of the data
+            
+            if self.fixedFormat is None and not secondGo: # Have another look at the lot
+                data = bytes(payload) + self.db.PeekCopy(len(self.db))
+                fmt = DetectFormat(data, len(data))
+                if fmt != self.format:
+                    self.ltc.LogWarning("Data isn't %s after all; starting again as %s.\n" % (self.format, fmt))
+                    self.format = fmt
+                    self.redo = bytes(payload)
+                    stats.pixels = stats.batches = 0
+                    return 0 # (Straight back here)
+            self.ltc.LogError("Invalid data received; capture aborted.\n")
+            self.StreamAbort()
+            self.state = self.WaitForHeader
+            return 0
+
+        except serial.SerialException: # Timed out (or perhaps port closed somehow)
+            
+            self.StreamAbort()
+            if self.terminate or self.newPortF: # No, just told to stop or move
+                self.state = self.WaitForHeader
+                return 0
+            self.ltc.LogError("Timed out waiting for data; capture aborted.\n")
+            self.state = self.WaitForHeader
+            return 0
+
+        if self.stream is not None:
+            self.stream.End(self.frame)
+        changed = self.frame.ChangedRows()
+        stats.rows = self.frame.yRes
+        if changed is None:
+            self.ltc.Log("Screen capture finished.\n")
+        else:
+            stats.rowsChanged = int(changed.sum())
+            self.ltc.Log("Screen capture finished (%.1f%% changed, %d of %d rows).\n" % (stats.PercentChanged(),
+                stats.rowsChanged, stats.rows))
+        now = time.perf_counter()
+        stats.AddState("GetData", now - self.stateStart) # This capture's stats are done with, and the run loop
+        self.stateStart = now # counts from here for the next one's
+        stats.highWater = self.db.highWater
+        self.db.highWater = 0
+        self.stats = CaptureStats()
+        # (The frame is handed back to the pool and overwritten by the next capture, maybe before whoever's posted to
+        # gets to it, so they get their own copy of its pixel values -- the frame itself only for its geometry -- along
+        # with which rows changed from the capture before, for the archive and exports)
+        self.Post(self.gui.CaptureDone,self.frame,self.frame.pix.copy(),changed,bytes(payload),stats)
+        self.carryOver = True
+        self.state = self.WaitForHeader
+        return 0
@@ -11,29 +11,32 @@
 # Abstract:     V2.0
 #               Ported from Python 2.x to 3.7.0 with corrected deprecated code
 #               when errors/warnings were found.
+#
+#               Only what's needed to put the window up and start listening is
+#               imported here; help, saving and archiving load on first use.
+#               (python TSCBench.py --startup-only times it.)
 #----------------------------------------------------------------------------
 import wx            # pip install -U wxPython
-import wx.lib.inspection
-import wx.html
-import serial        # pip install -U pySerial     
-import threading     # pip install -U pyThreading
+import collections
+import fractions
+import os
+import threading
 import time          # pip install -U pyTime
+import numpy as np   # pip install -U numpy
 
 from TSC_wdr import *
+from TekFrame import FramePool, DEFAULT_PALETTE, ScaleRect, ScaledSize, FitZoom, TurnChanged
+from TekReplay import ReplayPty
+from SerIface import SerIface
+from TekProbe import ListPorts, Probe
+from TekHistory import FrameHistory
 
 TEK_XRES=552 # Screen resolution of scope, X dimension
 TEK_YRES=704 # Ditto, Y
+HIGHLIGHT = np.array((255,48,48), np.uint8) # Changed rows are blended half and half with this, if they're highlighted
+APP_DIR = os.path.dirname(os.path.abspath(__file__)) # Where the icon and help live, wherever we're run from
 
 
-# Try to convert a string to an integer, returning a specified value if unsuccessful
-def StrToInt(text="",badVal=0):
-    try:
-        i = int(text)
-    except ValueError:
-        i = 0
-        
-    return i
-    
 # Build a solid bitmap of a given size and color
 # For color, pass in something that wx.Brush can use: Either a color name/tuple/etc. or a wx.Colour
 def MakeSolidBmp(width=16, height=16, color='blue'):
@@ -45,307 +48,428 @@ def MakeSolidBmp(width=16, height=16, color='blue'):
     dc.SelectObject(wx.NullBitmap)
     return bmp
 
+# A scaled rendering of a capture: the bitmap, what it's of (a page of a frame), and how far through that it's got
+class ScaledCapture():
+    
+    def __init__(self, size):
+        self.bmp = wx.Bitmap(*size)
+        self.frame = None
+        self.page = None
+        self.pos = 0
+        self.keep = False # Set if what's shown of the last page is kept, and only rows this one changes are drawn
+        self.tinted = None # Which rows (as sent) are drawn highlighted
+        
+# Scaled renderings of a scope's capture, one per (zoom, palette), so going back to a zoom level (or a color) means
+# scaling only the rows that have come in since it was last shown, if any.  The least recently used are dropped once
+# there are more than maxEntries.
+class ZoomCache():
+    
+    def __init__(self, maxEntries=4):
+        self.maxEntries = maxEntries
+        self.entries = collections.OrderedDict() # (zoom, palette) -> ScaledCapture, least recently used first
+        
+    def Get(self, zoom, palette, size):
+        key = (zoom, tuple(palette))
+        entry = self.entries.pop(key, None)
+        if entry is None or entry.bmp.GetSize() != size: # (A frame of another shape since)
+            entry = ScaledCapture(size)
+            while len(self.entries) >= self.maxEntries:
+                self.entries.popitem(last=False)
+        self.entries[key] = entry
+        return entry
+        
 # WDR: classes
 
-# Dancing dots
-class DDots():
-    
-    def __init__(self, min=3, max=13, c='.'):
-        self.min = min
-        self.max = max
-        self.c = c
-        self.num = self.min
-        
-    def Dots(self):
-        dots = self.c*self.num
-        self.num += 1
-        if self.num>self.max:
-            self.num = self.min
-        return dots
+# One scope: its capture window, framebuffer and serial interface thread.  Each lives on a page of the GUI's
+# notebook, and is the "gui" its SerIface reports to.  The serial thread writes pixels into the framebuffer; the
+# GUI's update timer calls UpdateCapture() to bring the window up to date with however far it's got.
+class ScopePage(wx.Panel):
     
-    def Reset(self):
-        self.num = self.min
+    def __init__(self, parent, gui, port="", baud=19200):
+        wx.Panel.__init__(self, parent, -1)
+        self.gui = gui
+        self.port = port
+        self.baud = baud
+        self.status = "---"
+        self.sph = None # No serial interface yet
+        self.stream = None # TekStream channel its captures are served on, if they are
+        
+        # Set up capture panel -- scrolled, for when it's zoomed in past the window
+        self.capWin = wx.ScrolledWindow(self,-1,wx.DefaultPosition,(TEK_XRES,TEK_YRES),wx.NO_BORDER)
+        self.capWin.SetScrollRate(10,10)
+        szr = wx.BoxSizer(wx.VERTICAL)
+        szr.Add(self.capWin, 1, flag=wx.EXPAND|wx.ALL, border=10)
+        self.statsText = wx.StaticText(self,-1,"No captures yet") # The last capture's CaptureStats, if wanted
+        szr.Add(self.statsText, flag=wx.LEFT|wx.RIGHT|wx.BOTTOM, border=10)
+        szr.Show(self.statsText, gui.ShowingStats())
+        self.scrubSizer = wx.BoxSizer(wx.HORIZONTAL) # For stepping back through earlier captures
+        self.scrubber = wx.Slider(self,-1,1,0,1)
+        self.scrubText = wx.StaticText(self,-1,"Live")
+        self.scrubSizer.Add(self.scrubber, 1, flag=wx.ALIGN_CENTER_VERTICAL)
+        self.scrubSizer.Add(self.scrubText, flag=wx.ALIGN_CENTER_VERTICAL|wx.LEFT, border=10)
+        szr.Add(self.scrubSizer, flag=wx.EXPAND|wx.LEFT|wx.RIGHT|wx.BOTTOM, border=10)
+        szr.Show(self.scrubSizer, gui.KeepingHistory())
+        self.scrubber.Enable(False)
+        self.scrubber.Bind(wx.EVT_SLIDER,self.OnScrub)
+        self.SetSizer(szr)
+        self.pool = FramePool(gui.GetPalette()) # Frames for each capture size the scope sends
+        self.history = FrameHistory(gui.HISTORY_BYTES) # Finished captures, packed
+        self.historyPool = FramePool(gui.GetPalette()) # Frames to show them in
+        self.viewing = None # Which of them is shown (None: the live one)
+        self.frame = self.pool.Get(TEK_XRES,TEK_YRES) # Pixel values are kept here...
+        self.zoomSetting = gui.GetZoom() # ...shown at this zoom (None: whatever fits)...
+        self.zooms = ZoomCache() # ...from one of these
+        self.shown = None # The ScaledCapture in the window...
+        self.zoom = fractions.Fraction(1) # ...and its zoom
+        self.rgbKey = None # (frame, page, palette) the frame's RGB was last rendered for...
+        self.rgbPos = 0 # ...and how far
+        self.statsPage = None # (frame, page) the render and paint times are for
+        self.renderTimes = [] # Seconds taken by each render of the page being shown...
+        self.paintTimes = [] # ...and from each render to the paint that shows it
+        self.paintDue = None # When the oldest render not yet painted was done
+        self.UpdateCapture()
+        
+        self.capWin.Bind(wx.EVT_PAINT,self.OnPaintCapWin) # Note that catching self's own EVT_PAINT isn't quite right and doesn't work under Linux
+        self.capWin.Bind(wx.EVT_ERASE_BACKGROUND,self.OnEraseCapWin)
+        self.capWin.Bind(wx.EVT_SIZE,self.OnSizeCapWin)
+        
+    # What to call this scope on its tab and in the log
+    def ScopeName(self):
+        return self.port or "(no port)"
+        
+    # We specifically don't want to erase the background, as doing so causes flickering
+    def OnEraseCapWin(self,event):
+        pass
     
+    # The bitmap goes at the top left (wherever it's scrolled to), and the background around it if the window's bigger.
+    # The DC clips all this to what needs painting, so scrolling only costs what comes into view.
+    def OnPaintCapWin(self,event):
+        dc = wx.PaintDC(self.capWin)
+        self.capWin.DoPrepareDC(dc)
+        bmp = self.shown.bmp
+        (bw, bh) = bmp.GetSize()
+        (cw, ch) = self.capWin.GetClientSize()
+        (vw, vh) = (max(bw, cw), max(bh, ch))
+        dc.DrawBitmap(bmp, 0, 0)
+        if vw > bw or vh > bh:
+            dc.SetPen(wx.TRANSPARENT_PEN)
+            dc.SetBrush(wx.Brush(self.capWin.GetBackgroundColour()))
+            dc.DrawRectangle(bw, 0, vw-bw, vh)
+            dc.DrawRectangle(0, bh, bw, vh-bh)
+        if self.paintDue is not None:
+            self.paintTimes.append(time.perf_counter() - self.paintDue)
+            self.paintDue = None
+        
+#  Serial port stuff
 
-# Serial port interface
-class SerIface(threading.Thread):
-    
-    def __init__(self, gui, port=""):
-        threading.Thread.__init__(self)
+    # Start the serial listener thread running
+    def StartListening(self, recordDir=None):
+        if self.stream is None and self.gui.server is not None:
+            self.stream = self.gui.server.Channel(self.ScopeName(), self.gui.GetPalette())
+        self.sph = SerIface(self,self.port,recordDir,wx.CallAfter,baud=self.baud,pool=self.pool,stream=self.stream)
+        self.sph.start()
         
-        self.connected = False
-        # Set up to "change to" initial port
-        self.newPort = port # We'll switch over to this port if it's not the same as self.port
-        self.newPortF = True # Flag set by GUI when self.newPort has been changed
-        self.gui = gui
-        self.ltc = gui.GetLogTextCtrl()
-        
-    # Update status label in GUI
-    def SetStatus(self, text):
-        wx.CallAfter(self.gui.SetSerStatus,text)
-        
-    # Thread begins here when started
-    def run(self):
-        
-        self.state = self.OpenPort # F points to current function (state machine-like)
-        self.lastState = None
-        self.terminate = False # Exit thread when this becomes true
-        
-        #self.serI = serial.Serial(port=None, baudrate=9600, rtscts=1, timeout=0.25) # Defaults to 8-N-1
-        self.serI = serial.Serial(port=None, baudrate=19200, rtscts=1, timeout=0.25) # Defaults to 8-N-1
-        self.db = DataByter(self.serI)
-        self.dd = DDots()
-        
-        delay = 0
-        while not(self.terminate):
-            if delay!=0:
-                time.sleep(delay) # ...wait specified time before going to next state
-            curState = self.state # Record current state...
-            delay = self.state() # Invoke current state...
-            self.lastState = curState # (...so that states can see where they came from)
+    # Shut down the serial listener thread, if possible
+    def StopListening(self):
+        if self.sph != None:
+            self.sph.Terminate() # Tell serial receiver thread to terminate -- wakes it if it's waiting on the port
+            self.sph.join(2.5) # Wait for thread to terminate
+            self.sph = None
             
-        self.serI.close()
-        return # Exit thread
-    
-    # Try to open or change specified serial port        
-    def OpenPort(self):
-        
-        # Check if serial port has changed (GUI sets, we reset)
-        if self.newPortF:
-            self.newPortF = False;
-            if self.newPort != self.serI.port:
-                wx.CallAfter(self.ltc.Log,"Serial port set to '%s'\n" % self.newPort)
-                try:
-                    self.serI.port = self.newPort
-                except serial.SerialException:
-                    pass # Code below will catch the problem
+    def SetPort(self, port, baud=None):
+        self.port = port
+        self.baud = baud or self.baud
+        if self.stream is not None:
+            self.stream.name = self.ScopeName()
+        if self.sph != None:
+            self.sph.SetPort(port, baud)
             
-        if self.serI.port=="" or self.serI.port==None:
-            self.SetStatus("No serial port specified" + self.dd.Dots())
-            return 0.5
-        
-        # Try to open serial port
-        try:
-            self.serI.open()
+    def SetSerStatus(self, text):
+        self.status = text
+        if self.gui.GetCurrentScope() is self:
+            self.gui.SetSerStatus(text)
             
-#        except serial.SerialException, err:
-        except IOError as e:
-            self.SetStatus("Unable to open specified port" + self.dd.Dots())
-            return 0.5
-        
-        # Port opened successfully
-        self.state = self.WaitForHeader
-        return 0
+    # SerIface logs through us so that, with several scopes open, it's clear which one is talking
+    def GetLogTextCtrl(self):
+        return self
     
-    def WaitForHeader(self):
-
-        # Check if serial port has changed (GUI sets, we reset)
-        if self.newPortF and self.newPort != self.serI.port: # Only attempt re-open if actual port name has changed
-                self.serI.close()
-                self.state = self.OpenPort
-                return 0
-        self.newPortF = False
-        
-        # Check if this is the first time here
-        if self.lastState != self.WaitForHeader: # Yep
-            self.serI.flushInput()
-            self.textLine = ""
-
-        # Just wait around, collecting individual characters until we hit a line feed... at that point, check for
-        # the scope's identifier, and if it looks OK, go with it
-
-        self.SetStatus("Waiting for header" + self.dd.Dots())
-
-        while self.serI.inWaiting() != 0:
-            ch = self.serI.read(1)
-            if ch == '\x0a':
-                break
-            self.textLine = ''.join([self.textLine,ch])
-            if len(self.textLine) > 100: # Don't let line grow forever if we're just getting garbage
-                self.textLine = self.textLine[:-20]
-        else: # No more character waiting
-            return 0.25 # Return quickly
-
-        #if self.textLine.find("DIGITIZING SAMPLING OSCILLOSCOPE") < 0: # Garbage line
-        if  not ((self.textLine.find("CSA803") == 0) or (self.textLine.find("DIGITIZING SAMPLING OSCILLOSCOPE") == 0)): # Garbage        
-            self.textLine = ""
-            return 0.25 # Return quickly
-
-        # We're good to go!
-        self.state = self.GetXRes
-        return 0
+    def LogPrefix(self):
+        return "%s: " % self.ScopeName() if len(self.gui.scopes) > 1 else ""
     
-    def GetXRes(self):
+    def Log(self, data):
+        self.gui.ltc.Log(self.LogPrefix() + data)
         
-        # Everything should be on the up-and-up here, with the scope starting to spew data
-        #self.xRes = StrToInt(self.serI.readline(size=20))
-        self.xRes = StrToInt(self.serI.readline())       
-        if self.xRes<1 or self.xRes>1000: # That's not right...
-            self.state = self.WaitForHeader
-            return 0
+    def LogWarning(self, data):
+        self.gui.ltc.LogWarning(self.LogPrefix() + data)
         
-        self.state = self.GetYRes
-        return 0
-    
-    def GetYRes(self):
+    def LogError(self, data):
+        self.gui.ltc.LogError(self.LogPrefix() + data)
+        
+    def CaptureDone(self, frame, pix, changed, payload, stats):
+        self.UpdateCapture() # (So the render times are complete)
+        stats.render = list(self.renderTimes)
+        stats.paint = list(self.paintTimes)
+        self.statsText.SetLabel(stats.Summary())
+        if self.gui.ShowingStats():
+            self.gui.CaptureResized() # (The text may have changed size)
+        self.gui.CaptureDone(self, frame, pix, changed, payload, stats)
         
-        #self.yRes = StrToInt(self.serI.readline(size=20))
-        self.yRes = StrToInt(self.serI.readline())
-        if self.yRes<1 or self.yRes>1000: # That's not right...
-            self.state = self.WaitForHeader
-            return 0
+# Capture panel-releated items
 
-        if self.xRes!=552 or self.yRes!=704:
-            wx.CallAfter(self.ltc.LogWarning,"Scope attempting to output %dx%d image -- only 552x704 currently supported.\n" % \
-                (self.xRes,self.yRes) )
-            self.state = self.WaitForHeader
-            return 0
-            
-        self.state = self.GetNull
-        return 0
+    # Catch the capture window up with the frame, at the current zoom: a new page (or a new frame, if the scope has
+    # changed resolution or direction) is scaled whole, otherwise only the rows written since the scaled bitmap was
+    # last brought up to date are rendered, scaled and repainted.  Called at a fixed rate, so the cost doesn't depend
+    # on how finely the serial thread happened to chop up the data.
+    def UpdateCapture(self):
+        if self.viewing is None and self.sph != None and self.sph.frame is not self.frame:
+            self.frame = self.sph.frame
+        if (self.frame, self.frame.page) != self.statsPage:
+            self.statsPage = (self.frame, self.frame.page)
+            self.renderTimes = []
+            self.paintTimes = []
+        (w, h) = self.frame.ShownSize()
+        if self.zoomSetting is None:
+            (cw, ch) = self.capWin.GetClientSize()
+            zoom = FitZoom(w, h, cw, ch)
+        else:
+            zoom = self.zoomSetting
+        shown = self.zooms.Get(zoom, self.pool.palette, ScaledSize(w, h, zoom))
+        if shown is not self.shown:
+            self.ShowScaled(shown, zoom)
+            if shown is not self.shown: # The window was resized to suit, and that's already been dealt with
+                return
+        if shown.frame is not self.frame or shown.page != self.frame.page:
+            # If the last page was shown whole, it stays up and only the rows that change get drawn
+            shown.keep = (shown.frame is self.frame and shown.page == self.frame.page - 1 and
+                shown.pos == self.frame.pix.size and self.frame.prevHashes is not None)
+            shown.frame = self.frame
+            shown.page = self.frame.page
+            if shown.keep:
+                shown.pos = 0
+            else:
+                shown.pos = self.frame.pos
+                self.RenderCapture()
+                return
+        (r0, r1, shown.pos) = self.frame.DirtyRows(shown.pos)
+        self.DrawRows(r0,r1)
         
-    def GetNull(self):
+    # Put another scaled bitmap in the window.  The window's smallest size is the capture's own (or the zoomed size,
+    # zoomed out), or half that if it's to fit; it only grows with the zoom if the user makes it.
+    def ShowScaled(self, shown, zoom):
+        self.shown = shown
+        self.zoom = zoom
+        (w, h) = self.frame.ShownSize()
+        minSize = ScaledSize(w, h, fractions.Fraction(1,2) if self.zoomSetting is None else min(zoom, 1))
+        self.capWin.SetVirtualSize(shown.bmp.GetSize())
+        if self.capWin.GetMinSize() != minSize:
+            self.capWin.SetMinSize(minSize)
+            self.gui.CaptureResized()
+        self.capWin.Refresh()
         
-        # After the header block, there's a null terminator before the actual data
-        n = self.serI.read(1)
-        if n != '\x00':
-            self.state = self.WaitForHeader
-            return 0
+    # Bring the frame's RGB up to date with its pixel values, through the current palette
+    def RenderRGB(self):
+        key = (self.frame, self.frame.page, tuple(self.pool.palette))
+        if key != self.rgbKey:
+            self.rgbKey = key
+            self.rgbPos = self.frame.pos
+            self.frame.Render()
+        else:
+            (r0, r1, self.rgbPos) = self.frame.DirtyRows(self.rgbPos)
+            self.frame.RenderRows(r0,r1)
         
-        self.state = self.WaitForData
-        return 0 # Scope pauses for a brief moment after end of title block before startindata -- avoid serial timeout this way
-    
-    def WaitForData(self):
-        # The scope pauses for around a second before beginning the actual data block, so this state just proves a longer
-        # timeout that the standard 250ms timeout we've been using (which is too short)
-
-        self.SetStatus("Header received, waiting for data...")
-        retries = 20
-        while retries>0:
-            if self.serI.inWaiting() > 0:
-                break
-            time.sleep(.100)
-            retries -= 1
+    # Scale the whole frame into the shown bitmap.  The RGB is only rendered where it's out of date, so changing zoom
+    # (or resizing the window, when it's fitting) costs just the scaling.
+    def RenderCapture(self):
+        t = time.perf_counter()
+        self.RenderRGB()
+        (scaled, x, y) = ScaleRect(self.frame.RGBView(), 0, 0, self.zoom)
+        self.shown.bmp.CopyFromBuffer(np.ascontiguousarray(scaled)) # (Only a copy if it's turned and not zoomed)
+        self.shown.tinted = np.zeros(self.frame.yRes, bool)
+        self.Rendered(t)
+        self.capWin.Refresh()
+        self.Retint()
+        
+    # Bring a band of rows up to date in the shown bitmap.  Rows that differ from the last capture are highlighted
+    # if that's wanted, once they're complete; if the last capture is being kept on screen, only those rows (and any
+    # that need their highlight taking off) are drawn at all.
+    def DrawRows(self,r0,r1):
+        if r1 <= r0:
+            return
+        done = max(r0, min(r1, self.shown.pos // self.frame.xRes)) # Rows written in full
+        changed = self.frame.ChangedRows(r0, done)
+        tint = np.zeros(r1-r0, bool)
+        if changed is None:
+            draw = np.ones(r1-r0, bool)
         else:
-            self.state = self.WaitForHeader
-            return 0
-
-        # The data comes next... tell the GUI it's time to start a new page
-        wx.CallAfter(self.gui.NewPage)
+            if self.gui.HighlightingChanges():
+                tint[:done-r0] = changed
+            if self.shown.keep:
+                draw = np.zeros(r1-r0, bool) # (A part-written row comes round again once it's complete)
+                draw[:done-r0] = changed | (tint[:done-r0] != self.shown.tinted[r0:done])
+            else:
+                draw = np.ones(r1-r0, bool)
+        self.DrawRuns(r0, draw, tint)
         
-        self.state = self.GetData
-        return 0
+    # Put the highlights right for the rows written so far (after the highlighting's been turned on or off)
+    def Retint(self):
+        done = self.shown.pos // self.frame.xRes
+        changed = self.frame.ChangedRows(0, done)
+        if changed is None:
+            return
+        tint = changed & self.gui.HighlightingChanges()
+        self.DrawRuns(0, tint != self.shown.tinted[:done], tint)
         
-    def GetData(self):
+    # Draw each run of rows r0+i for which draw[i] is set, highlighting those for which tint[i] is
+    def DrawRuns(self, r0, draw, tint):
+        edges = np.diff(np.concatenate(([0], draw.view(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        if len(starts) == 0:
+            return
+        t = time.perf_counter()
+        for a, b in zip(starts, np.flatnonzero(edges == -1)):
+            self.DrawBand(r0+a, r0+b, tint[a:b])
+        self.shown.tinted[r0:r0+len(draw)][draw] = tint[draw]
+        self.Rendered(t)
         
-        pixLeft = totPix = self.xRes * self.yRes # Total pixels we'll acquire
-        pixList = [] # List of typles with pixel descriptors
-        self.db.Reset()
+    # Render a band of rows from the frame, scale it into the shown bitmap and repaint just that band.  For a turned
+    # frame the band is a band of columns on screen.
+    def DrawBand(self,r0,r1,tint):
+        rows = self.frame.RenderRows(r0,r1)
+        if tint.any():
+            rows = rows.copy()
+            rows[tint] = rows[tint]//2 + HIGHLIGHT//2
+        (x, y, w, h) = self.frame.ShownRect(r0,r1)
+        (scaled, x, y) = ScaleRect(np.rot90(rows, self.frame.turns), x, y, self.zoom)
+        (h, w) = scaled.shape[:2]
+        if w and h: # (Zooming out, a band of one row may come to nothing)
+            band = wx.Bitmap.FromBuffer(w, h, np.ascontiguousarray(scaled))
+            dc = wx.MemoryDC(self.shown.bmp)
+            dc.DrawBitmap(band, x, y)
+            dc.SelectObject(wx.NullBitmap)
+        (x, y) = self.capWin.CalcScrolledPosition(x, y)
+        self.capWin.RefreshRect(wx.Rect(x, y, w, h), eraseBackground=False)
         
-        self.SetStatus("Receiving data (0%)" + self.dd.Dots())
-        wx.CallAfter(self.ltc.Log,"Beginning screen capture.\n")
+    # The capture at its own size, for the clipboard
+    def CaptureBitmap(self):
+        self.RenderRGB()
+        (w, h) = self.frame.ShownSize()
+        return wx.Bitmap.FromBuffer(w, h, np.ascontiguousarray(self.frame.RGBView()))
         
-        try: # Try to get all the pixels
-            
-            while pixLeft > 0:
-                
-                b1 = self.db.GetByte()
-                pix0 = b1 & 0x07
-                pix1 = (b1 >> 3) & 0x07
-                rpt = (b1 >> 6)
-                if rpt == 0: # Repeat count actually in next byte
-                    rpt = self.db.GetByte()
-                    if rpt == 0: # Not supposed to happen
-                        wx.CallAfter(self.ltc.LogError,"Invalid data received; capture aborted.\n")
-                        self.state = self.WaitForHeader
-                        return 0
-                    if rpt < 4: # Repeat count >255, LSB in next byte
-                        rpt = (rpt << 8) + self.db.GetByte()
-                
-                pixList.append((pix0,pix1,rpt))
-                pixLeft -= rpt*2
-                
-                if len(pixList) == 25 or pixLeft == 0: # Send a block over to the GUI
-                    if self.terminate: # Good time to check if we should quit the thread
-                        return 0
-                    
-                    pd = round(float(totPix-pixLeft)/float(totPix) * 100)
-                    self.SetStatus("Receiving data (%d%%)" % pd + self.dd.Dots())
-                    wx.CallAfter(self.gui.DrawPixPairs,pixList)
-                    pixList = []
-                
-        except serial.SerialException: # Timed out (or perhaps port closed somehow)
+    def SetZoom(self, zoom):
+        self.zoomSetting = zoom
+        self.UpdateCapture()
+        
+    # When fitting, a new size may mean a new zoom
+    def OnSizeCapWin(self, event):
+        if self.zoomSetting is None:
+            self.UpdateCapture()
+        event.Skip()
+        
+    # A render that started at t (perf_counter) is done; time it, and start the clock on it being painted
+    def Rendered(self, t):
+        now = time.perf_counter()
+        self.renderTimes.append(now - t)
+        if self.paintDue is None:
+            self.paintDue = now
             
-            wx.CallAfter(self.ltc.LogError,"Timed out waiting for data; capture aborted.\n")
-            self.state = self.WaitForHeader
-            return 0
-
-        wx.CallAfter(self.ltc.Log,"Screen capture finished.\n")
-        self.state = self.WaitForHeader
-        return 0
+    def ShowStats(self, show):
+        self.GetSizer().Show(self.statsText, show)
+        self.Layout()
         
+    # Re-render the capture bitmap from the pixel values through palette.  This is exact -- pixel values that share a
+    # color stay distinct -- and costs the same however many entries changed.  Web viewers only get told about
+    # palettes that aren't just a preview.
+    def RecolorCapture(self,palette,preview=False):
+        self.pool.SetPalette(palette)
+        self.historyPool.SetPalette(palette)
+        if self.stream is not None and not preview:
+            self.stream.SetPalette(palette)
+        self.UpdateCapture()
+        
+# History-related items
 
-# DataByter is used while the serial interface is retrieving bitmap (pixel) data.  It buffers what's
-# coming from the serial port in (hopefully) a semi-efficient manner and returns data one byte at a
-# time.  When the GetByte() method is called, the assumption is that there *should* be a byte available,
-# so if not a SerialException is thrown.
-class DataByter():
-    
-    def __init__(self, serI):
-        self.serI = serI
-
-    def Reset(self):
-        self.idx = 0
-        self.buf = ""
-
-    def GetByte(self):
+    # Keep a finished capture (its pixel values as sent)
+    def AddToHistory(self, pix, palette, spill):
+        if spill is not self.history.spill:
+            self.history.SetSpill(spill)
+        self.history.Add(pix, self.port, palette)
+        self.UpdateScrubber()
         
-        # return 0x47 # For performance testing
-    
-        # Trim off beginning of buffer, if it's getting a bit long
-        if self.idx>=100:
-            self.buf = self.buf[self.idx:]
-            self.idx = 0
-            
-        # Don't bother making the spendy serial port call if already have something
-        if len(self.buf) > self.idx:
-            b = self.buf[self.idx]
-            self.idx += 1
-            return ord(b)
-        
-        # Get whatever's in the serial port, or hang for at least one character if it's empty
-        btg = max(1,self.serI.inWaiting())
-        self.buf = "".join([self.buf,self.serI.read(btg)])
-        
-        # By now there should be something there...
-        if len(self.buf) > self.idx:
-            b = self.buf[self.idx]
-            self.idx += 1
-            return ord(b)
-            
-        # Nothing available
-        raise serial.SerialException
+    # The scrubber runs from the oldest capture still to be had up to the end, which means the live one
+    def UpdateScrubber(self):
+        n = len(self.history)
+        oldest = self.history.Oldest()
+        self.scrubber.SetRange(oldest, max(n, oldest+1))
+        self.scrubber.SetValue(n if self.viewing is None else max(self.viewing, oldest))
+        self.scrubber.Enable(n > oldest)
         
+    def OnScrub(self, event):
+        i = self.scrubber.GetValue()
+        self.ShowHistory(None if i >= len(self.history) else i)
+        
+    # Show capture i from the history, or the live one if i is None
+    def ShowHistory(self, i):
+        got = None if i is None else self.history.Get(i)
+        if got is None:
+            self.viewing = None
+            self.frame = self.sph.frame if self.sph != None else self.pool.Get(TEK_XRES,TEK_YRES)
+            self.scrubText.SetLabel("Live")
+        else:
+            (pix, when) = got
+            (yRes, xRes) = pix.shape
+            self.viewing = i
+            self.frame = self.historyPool.Get(xRes, yRes)
+            self.frame.Reset()
+            self.frame.Write(pix.reshape(-1))
+            self.scrubText.SetLabel("%d of %d, %s" % (i+1, len(self.history), time.strftime("%H:%M:%S", time.localtime(when))))
+        self.scrubSizer.Layout()
+        self.UpdateCapture()
+        
+    def ShowScrubber(self, show):
+        if not show:
+            self.ShowHistory(None)
+        self.GetSizer().Show(self.scrubSizer, show)
+        self.Layout()
+        
+
 # Bring up the GUI
 class GUI(wx.Frame):
     
     ID_PALETTE_BMBS = 9900 # Starting value for color palette bitmapped buttons
     ID_HELP_WIN = 9908 # ID for help window
     COLOR_SS = 16 # Size of (square) palette color swaths
-    defaultPalette = [(0,0,0),(77,77,77),(140,140,140),(160,32,240),(255,255,200),(0,255,0),(0,255,255),(255,255,255)]
+    defaultPalette = DEFAULT_PALETTE
     defaultColors = [wx.Colour(*col) for col in defaultPalette] 
+    saveFormats = [".png", ".npy", ".tif"] # Matches the ID_SAVE_FORMAT choices
+    zoomLevels = [None] + [fractions.Fraction(n, 2) for n in (1, 2, 3, 4, 6)] # Matches the ID_ZOOM choices (None: fit)
+    UPDATE_HZ = 30 # Capture window refresh rate
+    HISTORY_BYTES = 64<<20 # Memory for each scope's capture history (about 450 full screens)
     
     def __init__(self, parent, id, title,
         pos = wx.DefaultPosition, size = wx.DefaultSize, style = wx.DEFAULT_FRAME_STYLE ):
         wx.Frame.__init__(self, parent, id, title, pos, size, style)
         self.panel = wx.Panel(self,-1) # Get a nicer background, etc.
         self.mdSzr = MainDlg(parent=self.panel, call_fit=False, set_sizer=True) # Insert main window
-        self.sph = None # No serial interface yet
         self.ltc = self.GetLogTextCtrl()
+        self.scopes = [] # ScopePages, in notebook order
+        self.recordDir = None
+        self.listening = False # Set once the scopes' serial threads should be running
         
         # Read back user preferences
         cfg = wx.Config.Get()
-        self.GetSerPortCB().SetValue(cfg.Read("SerPort",""))
+        ports = cfg.Read("SerPorts",cfg.Read("SerPort","")).split(";")
+        bauds = [int(b) for b in cfg.Read("SerBauds","").split(";") if b.isdigit()]
+        self.FindWindowById(ID_PAL_PREVIEW).SetValue(cfg.ReadBool("PalPreview",True))
+        self.FindWindowById(ID_AUTOSAVE).SetValue(cfg.ReadBool("AutoSave",False))
+        self.FindWindowById(ID_SAVE_FORMAT).SetSelection(cfg.ReadInt("SaveFormat",0))
+        self.FindWindowById(ID_SAVE_DIR).SetPath(cfg.Read("SaveDir",""))
+        self.FindWindowById(ID_ARCHIVE).SetValue(cfg.ReadBool("Archive",False))
+        self.FindWindowById(ID_SHOW_STATS).SetValue(cfg.ReadBool("ShowStats",False))
+        self.FindWindowById(ID_ZOOM).SetSelection(cfg.ReadInt("Zoom",self.zoomLevels.index(1)))
+        self.FindWindowById(ID_HISTORY).SetValue(cfg.ReadBool("History",False))
+        self.FindWindowById(ID_HIGHLIGHT).SetValue(cfg.ReadBool("Highlight",False))
+        self.historyArchive = None # Where old captures in the history go, once there are too many; opened when needed
+        self.statsFile = None # Each capture's stats are written here as a line of JSON, if it's set
         self.palColors = []
         for i in range(0,8):
             keyName = "Col" + str(i)
@@ -366,13 +490,18 @@ class GUI(wx.Frame):
             ps.AddSpacer(10)
             self.Bind(wx.EVT_BUTTON,self.ChangePalette,source=abb)
 
-        # Set up capture panel
-        self.capWin = wx.Window(self.panel,-1,wx.DefaultPosition,(TEK_XRES,TEK_YRES),wx.NO_BORDER)
-        #self.panel.capSizer.Add(item=self.capWin, flag=wx.ALL, border=10)
-        self.panel.capSizer.Add(self.capWin, flag=wx.ALL, border=10)
-        #self.capBmp = wx.EmptyBitmap(TEK_XRES,TEK_YRES)
-        self.capBmp = wx.Bitmap(TEK_XRES,TEK_YRES)
-        self.NewPage()
+        # Captures are saved by a background thread
+        self.exporter = None # Started when first needed
+        self.saveCount = 0
+        self.archive = None # Opened when first needed
+        self.server = None # TekStream server the captures go out on, if they do
+        
+        # Set up capture panel -- a notebook with a page per scope
+        self.notebook = wx.Notebook(self.panel,-1)
+        self.panel.capSizer.Add(self.notebook, 1, flag=wx.EXPAND|wx.ALL, border=5)
+        for i, port in enumerate(ports):
+            self.AddScope(port, bauds[i] if i < len(bauds) else 19200)
+        self.probing = False
         
         # Tell main sizer to perform layer and then set minimum size of us (frame) to it            
         self.mdSzr.SetSizeHints(self) 
@@ -385,42 +514,59 @@ class GUI(wx.Frame):
         #wx.EVT_BUTTON(self, ID_HELP_BUTTON, self.Help)
         self.Bind(wx.EVT_BUTTON, self.Help,source=None,id=ID_HELP_BUTTON)
 
-        self.Bind(wx.EVT_IDLE,self.OnIdle)
         #wx.EVT_BUTTON(self, ID_CITC_BUTTON, self.OnCopyToClipboard)
         self.Bind(wx.EVT_BUTTON, self.OnCopyToClipboard,source=None,id=ID_CITC_BUTTON)
+        self.Bind(wx.EVT_BUTTON, self.OnAddScope,source=None,id=ID_ADD_SCOPE)
+        self.Bind(wx.EVT_BUTTON, self.OnRemoveScope,source=None,id=ID_REMOVE_SCOPE)
+        self.Bind(wx.EVT_BUTTON, self.OnFindScope,source=None,id=ID_FIND_SCOPE)
+        self.Bind(wx.EVT_CHECKBOX, self.OnShowStats,source=None,id=ID_SHOW_STATS)
+        self.Bind(wx.EVT_CHOICE, self.OnZoom,source=None,id=ID_ZOOM)
+        self.Bind(wx.EVT_CHECKBOX, self.OnHistory,source=None,id=ID_HISTORY)
+        self.Bind(wx.EVT_CHECKBOX, self.OnHighlight,source=None,id=ID_HIGHLIGHT)
+        self.notebook.Bind(wx.EVT_NOTEBOOK_PAGE_CHANGED,self.OnScopeChanged)
+        
+        # Capture windows are brought up to date UPDATE_HZ times a second, however fast the data's coming in
+        self.updateTimer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER,self.OnUpdateTimer,self.updateTimer)
+        self.updateTimer.Start(1000 // self.UPDATE_HZ)
         
-        self.capWin.Bind(wx.EVT_PAINT,self.OnPaintCapWin) # Note that catching self's own EVT_PAINT isn't quite right and doesn't work under Linux
-        self.capWin.Bind(wx.EVT_ERASE_BACKGROUND,self.OnEraseCapWin)
         #self.Bind(wx.EVT_SIZE,self.OnSize) # Not needed now that EVT_PAINT goes to the right place!
         self.GetSerPortCB().Bind(wx.EVT_KILL_FOCUS,self.SerPortChange) # KILL_FOCUS isn't a command event, so need to bind to actual widget
         self.Bind(wx.EVT_COMBOBOX,self.SerPortChange,self.GetSerPortCB())
         self.Bind(wx.EVT_CLOSE,self.OnClose)
         
-    def OnIdle(self,event):
-        if self.needCapPaint:
-            self.needCapPaint = False
-            self.capWin.Refresh() # Will send paint event to window
-
-    # We specifically don't want to erase the background, as doing so causes flickering
-    def OnEraseCapWin(self,event):
-        pass
-    
-    def OnPaintCapWin(self,event):
-        dc = wx.BufferedPaintDC(self.capWin, self.capBmp) # Bitmap will be drawn when DC falls out of scope
-        #event.Skip() # Make sure everything else gets re-painted too
-
     def OnClose(self,event):
-        # Shut down the serial listener thread, if possible
-        if self.sph != None:
-            self.sph.terminate = True # Tell serial receiver thread to terminate
-            i = 1
-            while self.sph.isAlive() and i<=100: # Wait for thread to terminate
-                i += 1
-                time.sleep(0.025)
+        self.updateTimer.Stop()
+        
+        # Shut down the serial listener threads, if possible -- tell them all first so they wind down together
+        for scope in self.scopes:
+            if scope.sph != None:
+                scope.sph.Terminate()
+        for scope in self.scopes:
+            scope.StopListening()
+        if self.server is not None:
+            self.server.Stop()
+        if self.exporter is not None:
+            self.exporter.Stop() # Let any saves in progress finish
+            self.exporter.join(5.0)
+        self.ltc.CloseLogFile() # (After the serial threads, so it gets their last words)
+        if self.statsFile is not None:
+            self.statsFile.close()
                 
         # Save user preferences
         cfg = wx.Config.Get()
-        cfg.Write("SerPort",self.GetSerPortCB().GetValue())
+        if wx.GetApp().replay is None: # Don't remember the replay's pseudo-terminal as a port
+            cfg.Write("SerPorts",";".join([scope.port for scope in self.scopes]))
+            cfg.Write("SerBauds",";".join([str(scope.baud) for scope in self.scopes]))
+        cfg.WriteBool("PalPreview",self.FindWindowById(ID_PAL_PREVIEW).GetValue())
+        cfg.WriteBool("AutoSave",self.FindWindowById(ID_AUTOSAVE).GetValue())
+        cfg.WriteInt("SaveFormat",self.FindWindowById(ID_SAVE_FORMAT).GetSelection())
+        cfg.Write("SaveDir",self.FindWindowById(ID_SAVE_DIR).GetPath())
+        cfg.WriteBool("Archive",self.FindWindowById(ID_ARCHIVE).GetValue())
+        cfg.WriteBool("ShowStats",self.FindWindowById(ID_SHOW_STATS).GetValue())
+        cfg.WriteInt("Zoom",self.FindWindowById(ID_ZOOM).GetSelection())
+        cfg.WriteBool("History",self.FindWindowById(ID_HISTORY).GetValue())
+        cfg.WriteBool("Highlight",self.FindWindowById(ID_HIGHLIGHT).GetValue())
         for i in range(0,8):
             keyName = "Col" + str(i)
             keyVal = self.palColors[i].GetRGB()
@@ -436,90 +582,274 @@ class GUI(wx.Frame):
     # Palette color entry clicked
     def ChangePalette(self, event):
         pIdx = event.GetId()-self.ID_PALETTE_BMBS
-        newColor = wx.GetColourFromUser(None, self.palColors[pIdx])
-        #if newColor.Ok() == False: # Dialog cancelled
-        if newColor.IsOk() == False: # Dialog cancelled
-            return # No
+        data = wx.ColourData()
+        data.SetColour(self.palColors[pIdx])
+        dlg = wx.ColourDialog(self, data)
+        
+        # Recolor the capture as the user moves around the dialog (wxPython 4.1+, and not all platforms send these)
+        preview = self.FindWindowById(ID_PAL_PREVIEW).GetValue() and hasattr(wx, "EVT_COLOUR_CHANGED")
+        if preview:
+            dlg.Bind(wx.EVT_COLOUR_CHANGED, lambda evt: self.PreviewPal(pIdx, evt.GetColour()))
+            
+        ok = dlg.ShowModal() == wx.ID_OK
+        newColor = dlg.GetColourData().GetColour()
+        dlg.Destroy()
+        
+        if not ok or newColor == self.palColors[pIdx]: # Dialog cancelled or nothing changed
+            if preview:
+                self.RecolorCapture(preview=True) # Put back whatever the preview did (the stream never saw it)
+            return
         
         self.ChangePal(pIdx,newColor)
         
-    # Change palette color entry -- also attempts to update capture bitmap colors
-    # id is 0-7, newColor is a wx.Colour
+    # Change palette color entry -- id is 0-7, newColor is a wx.Colour
     def ChangePal(self,id,newColor):
+        self.ChangePals({id:newColor})
+        
+    # Change several palette color entries (a dict of id:wx.Colour) and recolor the capture bitmap once
+    def ChangePals(self,newColors):
 
-        # Do nothing if color didn't actually change
-        if newColor == self.palColors[id]: # Was color actually changed?
-            return
-        self.ltc.Log("Changing color for pixel value %d to %s\n" % (id, newColor.Get()))
-
-        # Change color in bitmap (...hopefully it's unique!)
-        #img = wx.ImageFromBitmap(self.capBmp)
-        #wxPyDeprecationWarning: Call to deprecated item ImageFromBitmap. Use bitmap.ConvertToImage instead.
-        img = wx.Bitmap.ConvertToImage(self.capBmp)
+        changed = False
+        for id, newColor in sorted(newColors.items()):
+            
+            # Skip if color didn't actually change
+            if newColor == self.palColors[id]: # Was color actually changed?
+                continue
+            self.ltc.Log("Changing color for pixel value %d to %s\n" % (id, newColor.Get()))
+            
+            # Update button
+            self.palColors[id] = newColor
+            bmp = MakeSolidBmp(self.COLOR_SS, self.COLOR_SS, newColor)
+            btn = self.FindWindowById(self.ID_PALETTE_BMBS+id)
+            btn.SetBitmapLabel(bmp)
+            changed = True
+            
+        if changed:
+            self.RecolorCapture()
         
-        #img.Replace(*(self.palColors[id].Get() + newColor.Get()))
-        img.Replace(*(newColor.Get()),1,1)
-        #self.capBmp = wx.BitmapFromImage(img)
-        self.capBmp = wx.Bitmap(img)
+    # Show what the capture would look like with palette entry id set to color, without committing to it
+    def PreviewPal(self,id,color):
+        palette = [c.Get(False) for c in self.palColors]
+        palette[id] = color.Get(False)
+        self.RecolorCapture(palette, preview=True)
         
-        # Update button
-        self.palColors[id] = newColor
-        bmp = MakeSolidBmp(self.COLOR_SS, self.COLOR_SS, newColor)
-        btn = self.FindWindowById(self.ID_PALETTE_BMBS+id)
-        btn.SetBitmapLabel(bmp)
+    # Current palette as a list of (r,g,b) tuples
+    def GetPalette(self):
+        return [c.Get(False) for c in self.palColors]
         
-        self.needCapPaint = True # Idle will re-draw
+    # Re-render every scope's capture through the palette (default: the current one); preview if it's not been
+    # settled on yet
+    def RecolorCapture(self,palette=None,preview=False):
+        if palette is None:
+            palette = self.GetPalette()
+        for scope in self.scopes:
+            scope.RecolorCapture(palette, preview)
         
     def OnSetPalDefaults(self, event):
-        for i in range(0,8):
-            self.ChangePal(i,self.defaultColors[i])
-
-# Capture panel-releated items
-
-    # Clear image and setup for beginning of a new page
-    def NewPage(self):
-        self.X = self.Y = 0
-        
-        cpDC = wx.ClientDC(self.capWin) # We'll be drawing into the capture window...
-        dc = wx.BufferedDC(cpDC,self.capBmp) # ...buffer it to avoid flicker/auto-update when falls out of scope
-        dc.SetBackground(wx.Brush(self.palColors[0]))
-        dc.Clear()
-        self.needCapPaint = False # This might be the first time it's actually created
-        
-    # Draw pixel pairs -- just interate through a list of tuples containing pix1, pix2, and repeat
-    def DrawPixPairs(self,pixPairs):
+        self.ChangePals(dict(enumerate(self.defaultColors)))
 
-        dc = wx.MemoryDC(self.capBmp)
-        p = wx.Pen(colour=(0,0,0), width=1, style=wx.USER_DASH)
-        p.SetCap(wx.CAP_BUTT) # Don't mess with the line ends!
-        p.SetDashes([1,1]) # Render a pixel, skip a pixel, repeat
+# Scope-related items
 
-        for pp in pixPairs:
-            
-            (pix1, pix2, rpt) = pp
-            numPix = 2*rpt # Total number of pixels we'll be plotting
+    def GetCurrentScope(self):
+        sel = self.notebook.GetSelection()
+        return self.scopes[sel] if sel >= 0 else None
+    
+    # Add a page for another scope; its serial thread starts right away if the others are already running
+    def AddScope(self, port="", baud=19200):
+        scope = ScopePage(self.notebook, self, port, baud)
+        self.scopes.append(scope)
+        self.notebook.AddPage(scope, scope.ScopeName(), select=True)
+        self.UpdateScopeControls()
+        if self.listening:
+            scope.StartListening(self.recordDir)
+        return scope
+    
+    # A scope's capture window has changed size to suit what it's been sent (or the zoom).  The frame grows if it has
+    # to, but otherwise stays the size the user made it.
+    def CaptureResized(self):
+        minSize = self.mdSzr.GetMinSize()
+        self.SetMinClientSize(minSize)
+        (w, h) = self.GetClientSize()
+        self.SetClientSize((max(w, minSize.width), max(h, minSize.height)))
+        self.panel.Layout()
+        
+    # Zoom level chosen in the settings (None: fit the window)
+    def GetZoom(self):
+        return self.zoomLevels[max(0, self.FindWindowById(ID_ZOOM).GetSelection())]
+        
+    def OnZoom(self, event):
+        for scope in self.scopes:
+            scope.SetZoom(self.GetZoom())
             
-            while numPix>0:
-                pltl = min(numPix,TEK_XRES-self.X) # Pixels left this line
-                numPix -= pltl
-                
-                p.SetColour(self.palColors[pix1])
-                dc.SetPen(p)
-                dc.DrawLine(self.X, self.Y, self.X+pltl, self.Y)
-                p.SetColour(self.palColors[pix2])
-                dc.SetPen(p)
-                dc.DrawLine(self.X+1, self.Y, self.X+1+pltl, self.Y)
+    def KeepingHistory(self):
+        return self.FindWindowById(ID_HISTORY).GetValue()
+        
+    def OnHistory(self, event):
+        for scope in self.scopes:
+            scope.ShowScrubber(event.IsChecked())
+        self.CaptureResized()
+        
+    def HighlightingChanges(self):
+        return self.FindWindowById(ID_HIGHLIGHT).GetValue()
+        
+    def OnHighlight(self, event):
+        for scope in self.scopes:
+            if scope.shown is not None and scope.shown.frame is not None:
+                scope.Retint()
                 
-                self.X += pltl
-                if self.X>=TEK_XRES:
-                    self.X = 0
-                    self.Y += 1
+    # The archive the histories spill to: TSC-history.tsa in the save folder, or None if there's no folder
+    def HistoryArchive(self):
+        saveDir = self.FindWindowById(ID_SAVE_DIR).GetPath()
+        if not os.path.isdir(saveDir):
+            return None
+        fileName = os.path.join(saveDir, "TSC-history.tsa")
+        if self.historyArchive is None or self.historyArchive.dataName != fileName:
+            from TekArchive import TekArchive
+            try:
+                self.historyArchive = TekArchive(fileName)
+            except (IOError, ValueError) as e:
+                self.ltc.LogError("Can't keep old captures in '%s': %s\n" % (fileName, e))
+                return None
+        return self.historyArchive
+        
+    def OnUpdateTimer(self, event):
+        for scope in self.scopes:
+            scope.UpdateCapture()
             
-        dc.SelectObject(wx.NullBitmap)
-        self.needCapPaint = True
+    def ShowingStats(self):
+        return self.FindWindowById(ID_SHOW_STATS).GetValue()
         
+    def OnShowStats(self, event):
+        for scope in self.scopes:
+            scope.ShowStats(event.IsChecked())
+        self.CaptureResized()
+        
+    # Serve captures to viewers (web browsers) on port, as they come in -- for every scope that starts listening from
+    # now on, which means all of them if this is called first
+    def Serve(self, port, host=""):
+        from TekStream import StreamServer
+        try:
+            self.server = StreamServer(port, host)
+        except OSError as e:
+            self.ltc.LogError("Can't serve captures on port %d: %s\n" % (port, e))
+            return
+        self.server.Start()
+        self.ltc.Log("Serving captures at %s\n" % self.server.URL())
+        
+    # Append every capture's stats to fileName as lines of JSON from now on
+    def SetStatsFile(self, fileName):
+        self.statsFile = open(fileName, "a")
+        
+    def OnAddScope(self, event):
+        self.AddScope()
+        
+    def OnRemoveScope(self, event):
+        if len(self.scopes) <= 1: # Always keep one
+            return
+        sel = self.notebook.GetSelection()
+        scope = self.scopes.pop(sel)
+        scope.StopListening()
+        if scope.stream is not None:
+            self.server.RemoveChannel(scope.stream)
+        self.notebook.RemovePage(sel)
+        wx.CallAfter(scope.Destroy) # ...after anything its serial thread already posted
+        self.UpdateScopeControls()
+        
+    def OnScopeChanged(self, event):
+        self.UpdateScopeControls()
+        event.Skip()
+        
+    # Point the serial port box and status line at the current scope
+    def UpdateScopeControls(self):
+        scope = self.GetCurrentScope()
+        if scope is None:
+            return
+        self.GetSerPortCB().SetValue(scope.port)
+        self.SetSerStatus(scope.status)
+        self.FindWindowById(ID_REMOVE_SCOPE).Enable(len(self.scopes) > 1)
+        
+    # Start all the scopes' serial listener threads
+    def StartListening(self, recordDir=None):
+        self.recordDir = recordDir
+        self.listening = True
+        for scope in self.scopes:
+            scope.StartListening(recordDir)
+        
+    # A scope has finished a capture -- keep it, then record its stats (last, so nothing that goes wrong with them can
+    # cost the capture).  pix is the serial thread's copy of the frame's pixel values; the frame itself may already
+    # be taking the next capture.  changed is which of its rows (as sent) differ from the capture before, or None.
+    def CaptureDone(self, scope, frame, pix, changed, payload, stats):
+        self.KeepCapture(scope, frame, pix, changed, payload, stats)
+        if self.statsFile is not None:
+            try:
+                self.statsFile.write(stats.ToJSON(port=scope.port, xRes=frame.xRes, yRes=frame.yRes) + "\n")
+                self.statsFile.flush()
+            except (IOError, TypeError, ValueError) as e:
+                self.ltc.LogError("Couldn't write capture stats: %s\n" % e)
+
+    # Add a capture to the history, and archive the raw data and/or hand its pixel values to the export thread, if
+    # those are turned on
+    def KeepCapture(self, scope, frame, pix, changed, payload, stats):
+        if self.KeepingHistory():
+            scope.AddToHistory(pix, self.GetPalette(), self.HistoryArchive())
+        autoSave = self.FindWindowById(ID_AUTOSAVE).GetValue()
+        archive = self.FindWindowById(ID_ARCHIVE).GetValue()
+        if not autoSave and not archive:
+            return
+        saveDir = self.FindWindowById(ID_SAVE_DIR).GetPath()
+        if not os.path.isdir(saveDir):
+            self.ltc.LogWarning("Capture not saved -- no folder to save it in.\n")
+            return
+        
+        if archive:
+            self.ArchiveCapture(saveDir, scope, frame, payload, changed)
+        if autoSave:
+            if stats.rowsChanged == 0: # (The archive still gets every capture, though it keeps the data only once)
+                self.ltc.Log("Capture same as the last one; not saved again.\n")
+            else:
+                self.SaveCapture(saveDir, scope, np.rot90(pix, frame.turns),
+                    None if changed is None else TurnChanged(changed, frame.turns))
+            
+    # Append a capture's raw data, and which rows changed, to the archive in saveDir -- only a few KB, so it's quick
+    # enough to do here
+    def ArchiveCapture(self, saveDir, scope, frame, payload, changed=None):
+        fileName = os.path.join(saveDir, "TSC-archive.tsa")
+        try:
+            if self.archive is None or self.archive.dataName != fileName:
+                from TekArchive import TekArchive
+                self.archive = TekArchive(fileName)
+            n = self.archive.Append(payload, frame.xRes, frame.yRes, scope.port, self.GetPalette(), changed=changed)
+        except (IOError, ValueError) as e:
+            self.ltc.LogError("Couldn't archive capture: %s\n" % e)
+            self.archive = None
+            return
+        index = self.archive.Index()
+        shared = n > 0 and index[n]["offset"] == index[n-1]["offset"]
+        self.ltc.Log("Archived capture as #%d (%s).\n" % (n, "same data as the last one" if shared else "%d bytes" % len(payload)))
+        
+    # Have the export thread write out a capture's pixel values (the right way up; not to be changed after), noting
+    # what changed (see TekExport.ChangedText()) if that's known
+    def SaveCapture(self, saveDir, scope, pix, changed=None):
+        self.saveCount += 1
+        ext = self.saveFormats[max(0,self.FindWindowById(ID_SAVE_FORMAT).GetSelection())]
+        name = "TSC-%s-%03d-%s%s" % (time.strftime("%Y%m%d-%H%M%S"), self.saveCount, os.path.basename(scope.port), ext)
+        if self.exporter is None:
+            from TekExport import ExportWorker
+            self.exporter = ExportWorker(self.OnCaptureSaved,wx.CallAfter)
+            self.exporter.start()
+        if not self.exporter.Submit(os.path.join(saveDir,name), pix, self.GetPalette(), changed):
+            self.ltc.LogError("Too many captures waiting to be saved; this one was dropped.\n")
+            
+    def OnCaptureSaved(self, fileName, size, seconds, err, xRes, yRes):
+        if err is not None:
+            self.ltc.LogError("Couldn't save '%s': %s\n" % (fileName, err))
+            return
+        rgbSize = xRes*yRes*3
+        self.ltc.Log("Saved '%s' (%d KB, %.0f ms to encode, 1/%.0f the size of 24-bit RGB).\n" % \
+            (os.path.basename(fileName), (size+1023)//1024, seconds*1000, float(rgbSize)/max(size,1)))
+            
     def OnCopyToClipboard(self,event):
-        d = wx.BitmapDataObject(self.capBmp)
+        d = wx.BitmapDataObject(self.GetCurrentScope().CaptureBitmap())
         if wx.TheClipboard.Open():
             wx.TheClipboard.SetData(d)
             wx.TheClipboard.Flush()
@@ -532,17 +862,75 @@ class GUI(wx.Frame):
     def GetSerPortCB(self):
         return self.FindWindowById( ID_SERPORT_COMBO )
 
-    def SetSerPortHandler(self,sph):
-        self.sph = sph
-
     def SerPortChange(self, event):
         np = self.GetSerPortCB().GetValue()
         np = np.strip().rstrip() # Remove extraneous whitespace
-        self.GetSerPortCB().SetValue(np)
-        if self.sph != None:
-            self.sph.newPort = np
-            self.sph.newPortF = True
+        self.SetScopePort(np)
         event.Skip()
+        
+    # Switch the current scope to another serial port
+    def SetScopePort(self, port):
+        self.GetSerPortCB().SetValue(port)
+        scope = self.GetCurrentScope()
+        if scope is not None and port != scope.port:
+            self.AssignPort(scope, port)
+            
+    def AssignPort(self, scope, port, baud=None):
+        scope.SetPort(port, baud)
+        self.notebook.SetPageText(self.scopes.index(scope), scope.ScopeName())
+        if scope is self.GetCurrentScope():
+            self.GetSerPortCB().SetValue(port)
+            
+    def OnFindScope(self, event):
+        self.FindScopes([self.GetCurrentScope()])
+        
+    # Look for scopes on every port not already in use, on a thread of its own, and give what's found to the scopes
+    # in targets (default: the ones whose port doesn't exist -- a port that isn't listed may still be there, a
+    # by-id link or a pty, say).  The port and baud rate found are saved on exit.
+    def FindScopes(self, targets=None):
+        if self.probing:
+            return
+        realPorts = ListPorts()
+        if realPorts: # Offer the ports there really are, rather than the usual suspects
+            cb = self.GetSerPortCB()
+            port = cb.GetValue()
+            cb.Set(realPorts)
+            cb.SetValue(port)
+        if targets is None:
+            targets = [scope for scope in self.scopes if scope.port not in realPorts and not os.path.exists(scope.port)]
+        if not targets or not realPorts:
+            return
+        old = [(scope, scope.port) for scope in targets]
+        released = [] # Serial threads letting go of a port, which has to be closed before it can be probed
+        for scope in targets:
+            if scope.port:
+                if scope.sph != None:
+                    released.append(scope.sph)
+                self.AssignPort(scope, "") # Let go of it, so it can be probed too
+        inUse = [scope.port for scope in self.scopes]
+        candidates = [port for port in realPorts if port not in inUse]
+        self.probing = True
+        self.ltc.Log("Looking for a scope on %s...\n" % ", ".join(candidates))
+        def Search():
+            for sph in released:
+                sph.portClosed.wait(2.0)
+            wx.CallAfter(self.ScopesFound, old, Probe(candidates))
+        threading.Thread(target=Search, daemon=True).start()
+        
+    # old is the (scope, port) for each scope that was looking, so any left without a scope go back to what they had
+    def ScopesFound(self, old, found):
+        self.probing = False
+        if not found:
+            self.ltc.LogWarning("No scope answered -- check the cable and the scope's RS232C settings.\n")
+        for i, (scope, port) in enumerate(old):
+            if scope not in self.scopes: # Removed meanwhile
+                continue
+            if i < len(found):
+                (port, baud, reply) = found[i]
+                self.ltc.Log("Found '%s' on %s at %d baud.\n" % (reply, port, baud))
+                self.AssignPort(scope, port, baud)
+            elif not scope.port:
+                self.AssignPort(scope, port)
 
     def SetSerStatus(self, text):
         self.FindWindowById(ID_SERSTATUS).SetLabel(text)
@@ -551,14 +939,15 @@ class GUI(wx.Frame):
 ###
        
     def Help(self, event):
-        #wx.lib.inspection.InspectionTool().Show()
+        #import wx.lib.inspection; wx.lib.inspection.InspectionTool().Show()
 
         helpWin = self.FindWindowById(self.ID_HELP_WIN)
         if helpWin is None:
+            import wx.html # (Only loaded if help is ever asked for)
             frm = wx.Frame(parent=self, id=self.ID_HELP_WIN, title="Help...", size=wx.Size(800,600))
             frm.SetIcon(wx.GetApp().GetAppIcon())
             htmlWin = wx.html.HtmlWindow(parent=frm)
-            htmlWin.LoadPage("TSC Help.html")
+            htmlWin.LoadPage(os.path.join(APP_DIR, "TSC Help.html"))
             frm.Show()
         else:
             helpWin.Raise()
@@ -575,7 +964,17 @@ class GUI(wx.Frame):
 
 class App(wx.App):
 
-    def __init__(self, redirect=True, filename=None):
+    def __init__(self, redirect=True, filename=None, recordDir=None, replayFile=None, realtime=True, logFile=None, statsFile=None,
+        startupTest=False, serve=None):
+        self.recordDir = recordDir
+        self.startupTest = startupTest # Just start up and close again (for timing)
+        self.icon = None
+        self.logFile = logFile
+        self.statsFile = statsFile
+        self.serve = serve # (host, port) to serve captures on, if any
+        self.replayFile = replayFile
+        self.realtime = realtime
+        self.replay = None
         wx.App.__init__(self, redirect, filename) # Will call OnInit
     
     def OnInit(self):
@@ -585,32 +984,68 @@ class App(wx.App):
         # Bring up the GUI
         self.mainFrame = GUI(parent=None, id=-1, title="Tektronix 1180x Screen Capture Utility")
         self.SetTopWindow(self.mainFrame)
-        self.mainFrame.Show(True)
+        self.mainFrame.SetIcon(self.GetAppIcon())
         
         ltc = self.mainFrame.GetLogTextCtrl()
+        if self.logFile:
+            ltc.SetLogFile(self.logFile)
+        if self.statsFile:
+            self.mainFrame.SetStatsFile(self.statsFile)
         ltc.Log("Tektronix 1180x Screen Capture Utility\n")
         ltc.Log("By Joel Koltner, May, 2010\n\n")
         
-        self.mainFrame.SetIcon(self.GetAppIcon())
+        # Play back a recorded session instead of listening to a scope
+        if self.replayFile:
+            self.replay = ReplayPty(self.replayFile, self.realtime)
+            self.mainFrame.SetScopePort(self.replay.port)
+            ltc.Log("Replaying '%s' through %s\n" % (self.replayFile, self.replay.port))
         
-        # Start the serial listener thread running
-        self.seri = SerIface(self.mainFrame,self.mainFrame.GetSerPortCB().GetValue())
-        self.seri.start()
-        self.mainFrame.SetSerPortHandler(self.seri)
+        if self.serve:
+            self.mainFrame.Serve(self.serve[1], self.serve[0])
+        
+        # Start the serial listener threads running -- before the window's shown, so they're opening their ports
+        # while it's drawn
+        self.mainFrame.StartListening(self.recordDir)
+        self.mainFrame.Show(True)
+        if self.replay is not None:
+            self.replay.Start()
+        elif self.startupTest:
+            wx.CallAfter(self.mainFrame.Close)
+        else:
+            wx.CallAfter(self.mainFrame.FindScopes) # For any scope whose port has gone (or was never set), once we're up
         
         return True
 
     def OnExit(self):
-        #pass
+        if self.replay is not None:
+            self.replay.Close()
         return 0
     
     def GetAppIcon(self):
-        return wx.Icon("TSC Icon.xpm",wx.BITMAP_TYPE_XPM)
+        if self.icon is None:
+            self.icon = wx.Icon(os.path.join(APP_DIR, "TSC Icon.xpm"),wx.BITMAP_TYPE_XPM)
+        return self.icon
     
             
 #----------------------------------------------------------------------------
 
 if __name__ == "__main__":
-    app = App(redirect=False)
+    import argparse
+    parser = argparse.ArgumentParser(description="Tektronix 1180x Screen Capture Utility")
+    parser.add_argument("--record", metavar="DIR", help="save everything read from the serial port to a timestamped session file in DIR")
+    parser.add_argument("--replay", metavar="FILE", help="play back a recorded session through a pseudo-terminal instead of using a real port (Linux)")
+    parser.add_argument("--log", metavar="FILE", help="also write the log to FILE (rotated at 1 MB, three old ones kept)")
+    parser.add_argument("--stats", metavar="FILE", help="append each capture's timings to FILE as a line of JSON")
+    parser.add_argument("--serve", metavar="[HOST:]PORT", help="serve captures to viewers (web browsers) on PORT as they come in")
+    parser.add_argument("--startup-test", action="store_true", help="close again as soon as the window is up (for timing startup)")
+    parser.add_argument("--fast", action="store_true", help="with --replay, send as fast as possible instead of at the recorded timing")
+    args = parser.parse_args()
+    serve = None
+    if args.serve:
+        from TekStream import ParseAddress # (Only loaded if it's wanted)
+        serve = ParseAddress(args.serve)
+    
+    app = App(redirect=False, recordDir=args.record, replayFile=args.replay, realtime=not args.fast, logFile=args.log, statsFile=args.stats,
+        startupTest=args.startup_test, serve=serve)
     app.MainLoop()
     
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+#----------------------------------------------------------------------------
+# Name:         TSCBatch.py
+# Abstract:     Convert whole archives of raw dumps to image files, with a
+#               different palette, format or zoom than they were captured
+#               with, using every core.  Each file written is noted in
+#               TSC-batch.jsonl in the output folder, so an interrupted run
+#               picks up where it left off and a repeated one only does what
+#               has changed.
+#
+#               python TSCBatch.py campaign.tsa -d pngs
+#               python TSCBatch.py archives/ -d tiffs -f tif --palette default --zoom 2
+#----------------------------------------------------------------------------
+import argparse
+import concurrent.futures
+import fractions
+import json
+import os
+import sys
+import time
+import numpy as np   # pip install -U numpy
+
+from TekArchive import TekArchive
+from TekExport import Export, WRITERS
+from TekFrame import DEFAULT_PALETTE, ScaledEdges, ScaleRect, TurnChanged, Turns
+
+MANIFEST = "TSC-batch.jsonl" # One line per file written: its name, the settings it was written with and its size
+CHUNK = 8 # Most captures handed to a worker at a time
+
+
+archives = {} # In each worker: archive name -> TekArchive, opened the first time it's needed
+
+# Convert captures from one archive (run in a worker process).  jobs is a list of (capture number, output file);
+# returns (capture number, output file, size, error) for each one done -- all of them, unless Ctrl+C stops it early.
+# palette None means the one each was captured with.
+def ConvertChunk(archiveName, jobs, palette, zoom):
+    if archiveName not in archives:
+        archives[archiveName] = TekArchive(archiveName)
+    arc = archives[archiveName]
+    results = []
+    for n, fileName in jobs:
+        (root, ext) = os.path.splitext(fileName)
+        partName = root + ".part" + ext # (Written under another name first, so a half-written file is never taken for done)
+        try:
+            pix = arc.View(n)
+            changed = arc.ChangedRows(n)
+            if zoom != 1:
+                pix = ScaleRect(pix, 0, 0, zoom)[0]
+                if changed is not None:
+                    changed = changed.repeat(np.diff(ScaledEdges(0, len(changed), zoom)))
+            if changed is not None:
+                rec = arc.Index()[n]
+                changed = TurnChanged(changed, Turns(int(rec["xRes"]), int(rec["yRes"])))
+            Export(partName, pix, arc.Palette(n) if palette is None else palette, changed)
+            os.replace(partName, fileName)
+            results.append((n, fileName, os.path.getsize(fileName), None))
+        except (IOError, ValueError) as e: # (DecodeError is a ValueError)
+            results.append((n, fileName, 0, str(e)))
+        except KeyboardInterrupt: # Hand back what's done, so it's recorded
+            if os.path.exists(partName):
+                os.remove(partName)
+            break
+    return results
+
+
+# Name an output file goes by in the manifest in outDir: its path relative to outDir, with / between folders
+def ManifestName(fileName, outDir):
+    return os.path.relpath(fileName, outDir).replace(os.sep, "/")
+
+
+# What's recorded in the manifest in outDir, as output file (see ManifestName()) -> (settings, size); the last entry
+# for a file counts
+def ReadManifest(outDir):
+    done = {}
+    try:
+        with open(os.path.join(outDir, MANIFEST)) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    done[rec["file"]] = (rec["settings"], rec["size"])
+                except (ValueError, KeyError): # A line cut short by the last run being killed
+                    pass
+    except IOError:
+        pass
+    return done
+
+
+# {name} for each archive's output files: its path less the .tsa, relative to the folder all of the archives are
+# under -- so just its name if they're all in one folder, and two with the same name in different folders don't
+# write over each other's files
+def OutputNames(archiveNames):
+    paths = [os.path.realpath(name) for name in archiveNames]
+    try:
+        root = os.path.commonpath([os.path.dirname(path) for path in paths]) if paths else ""
+    except ValueError: # (On different drives)
+        root = None
+    names = []
+    for path in paths:
+        rel = os.path.splitdrive(path)[1].lstrip(os.sep) if root is None else os.path.relpath(path, root)
+        names.append(os.path.splitext(rel)[0])
+    return names
+
+
+# Palette from the command line: "archive" (whatever each capture had), "default", or 8 colors as RRGGBB,RRGGBB,...
+def ParsePalette(text):
+    if text == "archive":
+        return None
+    if text == "default":
+        return DEFAULT_PALETTE
+    cols = text.split(",")
+    if len(cols) != 8:
+        raise argparse.ArgumentTypeError("a palette is 8 colors")
+    try:
+        return [tuple(int(col[i:i+2], 16) for i in (0, 2, 4)) for col in cols]
+    except ValueError:
+        raise argparse.ArgumentTypeError("colors are given as RRGGBB")
+
+
+def ParseZoom(text):
+    try:
+        zoom = fractions.Fraction(text).limit_denominator(8)
+    except ValueError:
+        raise argparse.ArgumentTypeError("'%s' isn't a zoom (try 2, 0.5 or 3/2)" % text)
+    if zoom <= 0:
+        raise argparse.ArgumentTypeError("zoom must be more than 0")
+    return zoom
+
+
+def Main():
+    parser = argparse.ArgumentParser(description="Convert TSC archives of raw dumps to image files on every core.")
+    parser.add_argument("inputs", nargs="+", help="archives (.tsa), or folders to do every archive in")
+    parser.add_argument("-d", "--dir", default=".", help="folder to write to (default: the current one)")
+    parser.add_argument("-o", "--output", metavar="TEMPLATE", default="{name}-{n:05d}",
+        help="file name template, without extension; {name} is the archive's name (with its folder, relative to the "
+             "others', if they're not all in one) and {n} the capture number (default: %(default)s)")
+    parser.add_argument("-f", "--format", default="png", choices=sorted(ext[1:] for ext in WRITERS), help="(default: %(default)s)")
+    parser.add_argument("-p", "--palette", default="archive", type=ParsePalette,
+        help="'archive' (each capture's own, the default), 'default', or 8 colors as RRGGBB,RRGGBB,...")
+    parser.add_argument("-z", "--zoom", default="1", type=ParseZoom, help="scale by this much (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes (default: one per core)")
+    parser.add_argument("--force", action="store_true", help="redo files that are already up to date")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no progress reports")
+    args = parser.parse_args()
+
+    archiveNames = []
+    for name in args.inputs:
+        if os.path.isdir(name):
+            archiveNames += [os.path.join(name, n) for n in sorted(os.listdir(name)) if n.lower().endswith(".tsa")]
+        else:
+            archiveNames.append(name)
+    unique = {} # (An archive given twice, or in a folder given too, is only done once)
+    for name in archiveNames:
+        unique.setdefault(os.path.realpath(name), name)
+    archiveNames = list(unique.values())
+    os.makedirs(args.dir, exist_ok=True)
+
+    # A file's up to date if the manifest says it was written with the same settings and it's still the same size
+    settings = json.dumps({"palette": args.palette, "zoom": str(args.zoom)})
+    done = {} if args.force else ReadManifest(args.dir)
+    chunks = [] # (archive name, [(capture number, output file), ...])
+    total = upToDate = 0
+    for archiveName, name in zip(archiveNames, OutputNames(archiveNames)):
+        if not os.path.isfile(archiveName): # (TekArchive would make an empty one)
+            print("Skipping '%s': no such archive" % archiveName, file=sys.stderr)
+            continue
+        try:
+            count = len(TekArchive(archiveName))
+        except (IOError, ValueError) as e:
+            print("Skipping '%s': %s" % (archiveName, e), file=sys.stderr)
+            continue
+        jobs = []
+        for n in range(count):
+            fileName = os.path.join(args.dir, args.output.format(name=name, n=n) + "." + args.format)
+            rec = done.get(ManifestName(fileName, args.dir))
+            if rec is not None and rec[0] == settings and os.path.isfile(fileName) and os.path.getsize(fileName) == rec[1]:
+                upToDate += 1
+                continue
+            jobs.append((n, fileName))
+            os.makedirs(os.path.dirname(fileName), exist_ok=True)
+        total += len(jobs)
+        chunkSize = max(1, min(CHUNK, len(jobs) // (args.jobs * 4))) # (Small enough to keep every worker busy to the end)
+        chunks += [(archiveName, jobs[i:i+chunkSize]) for i in range(0, len(jobs), chunkSize)]
+    if upToDate:
+        print("%d files already up to date." % upToDate, file=sys.stderr)
+
+    failed = finished = 0
+    t0 = lastReport = time.monotonic()
+    with open(os.path.join(args.dir, MANIFEST), "a") as manifest, \
+         concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+
+        # Note down a finished chunk's files (flushed, so they're remembered even if this run is killed)
+        recorded = set()
+        def Record(future):
+            nonlocal finished, failed
+            recorded.add(future)
+            for n, fileName, size, err in future.result():
+                finished += 1
+                if err is not None:
+                    failed += 1
+                    print("\n%s: %s" % (fileName, err), file=sys.stderr)
+                else:
+                    manifest.write(json.dumps({"file": ManifestName(fileName, args.dir), "settings": settings, "size": size}) + "\n")
+            manifest.flush()
+
+        futures = [pool.submit(ConvertChunk, archiveName, jobs, args.palette, args.zoom) for archiveName, jobs in chunks]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                Record(future)
+                now = time.monotonic()
+                if not args.quiet and (now - lastReport >= 1.0 or finished == total):
+                    lastReport = now
+                    rate = finished / (now - t0)
+                    print("\r%d of %d converted, %.0f a second, %.0f s to go " % (finished, total, rate,
+                        (total - finished) / rate if rate else 0), end="", file=sys.stderr)
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            for future in futures: # Chunks already under way still get recorded
+                if not future.cancelled() and future not in recorded:
+                    try:
+                        Record(future)
+                    except BaseException: # Its worker went down with the Ctrl+C
+                        pass
+            print("\nStopped after %d; run again to carry on." % finished, file=sys.stderr)
+            return 1
+    if total and not args.quiet:
+        print("\n%d converted in %.1f s%s." % (finished - failed, time.monotonic() - t0,
+            ", %d failed" % failed if failed else ""), file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(Main())
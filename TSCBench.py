@@ -0,0 +1,518 @@
+#!/usr/bin/env python
+#----------------------------------------------------------------------------
+# Name:         TSCBench.py
+# Abstract:     Benchmarks for the acquisition and rendering paths: decoder
+#               and input buffer throughput, framebuffer rendering, palette
+#               recoloring and end-to-end time-to-last-pixel over a pseudo-
+#               terminal at real baud rates, in any of the scope's data
+#               formats.  Also startup time: importing the wx-free modules
+#               (which mustn't pull wx in) and the GUI from launch to window.
+#               Results are written as JSON so runs from different versions
+#               can be compared.
+#
+#               python TSCBench.py -o results.json
+#               python TSCBench.py --session some.rec --baud 19200
+#               python TSCBench.py --format all --baud 38400
+#               python TSCBench.py --startup-only --max-startup 1.5
+#               python TSCBench.py --check                  (correctness only)
+#----------------------------------------------------------------------------
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np   # pip install -U numpy
+
+from TekDecode import Decode, MakeDecoder, DetectFormat, HeaderParser, FORMATS, DEFAULT_FORMAT, DecodeError, CompactedDecoder
+from TekFrame import IndexedFrame, FramePool, DEFAULT_PALETTE
+from ByteRing import ByteRing
+from TekReplay import SessionWriter, ReadSession, ReplayPty
+from SerIface import SerIface
+from TekTrace import ExtractTraces
+from TekArchive import TekArchive
+from TekExport import Export, ChangedText
+
+TEK_XRES=552 # Screen resolution of scope, X dimension
+TEK_YRES=704 # Ditto, Y
+
+BANNER = b"DIGITIZING SAMPLING OSCILLOSCOPE\r\n"
+HERE = os.path.dirname(os.path.abspath(__file__))
+NO_WX_MODULES = ["TekDecode", "TekFrame", "ByteRing", "SerIface", "TekProbe", "TekExport", "TekArchive", "TekStats",
+                 "TekHistory", "TekTrace", "TSCCapture", "TSCBatch", "TekStream"] # Usable without a display, so importing them mustn't import wx
+
+
+# Synthetic screens of increasing complexity
+def SyntheticFrames(xRes=TEK_XRES, yRes=TEK_YRES, seed=803):
+    frames = {}
+    frames["blank"] = np.zeros((yRes,xRes), np.uint8)
+
+    grid = np.zeros((yRes,xRes), np.uint8)
+    grid[::11, ::2] = 1 # Dotted minor divisions
+    grid[:, ::11][::2] = 1
+    grid[::70, :] = 2 # Major divisions
+    grid[:, ::55] = 2
+    frames["grid"] = grid
+
+    rng = np.random.default_rng(seed)
+    noisy = grid.copy()
+    rows = np.arange(yRes)
+    for level, period, amp in ((4,350,120), (5,90,60), (6,700,30), (7,45,200)):
+        col = xRes//2 + amp*np.sin(2*np.pi*rows/period) + rng.normal(0, 6, yRes)
+        col = np.clip(col.astype(np.intp), 0, xRes-2)
+        noisy[rows, col] = level
+        noisy[rows, col+1] = level
+    frames["noisy"] = noisy
+    return frames
+
+
+# Pull the resolution and data out of a recorded session (the first hardcopy in it)
+def SplitSession(fileName):
+    raw = b"".join(data for t, data in ReadSession(fileName))
+    hdr = HeaderParser()
+    used = hdr.Feed(raw)
+    if not hdr.done:
+        raise ValueError("No hardcopy header found in '%s'" % fileName)
+    return hdr.xRes, hdr.yRes, raw[used:]
+
+
+# Best of repeat runs of f(), in seconds
+def Best(f, repeat=5):
+    best = None
+    for i in range(repeat):
+        t = time.perf_counter()
+        f()
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best
+
+
+def BenchDecode(data, xRes, yRes, fmt=DEFAULT_FORMAT):
+    t = Best(lambda: Decode(data, xRes, yRes, fmt))
+    return {"bytes": len(data), "seconds": t, "bytesPerSec": len(data)/t, "pixelsPerSec": xRes*yRes/t}
+
+
+# Minimal stand-in for a serial port that has data arriving writeSize bytes at a time (pySerial's loop:// queues
+# every byte separately, which would swamp what's being measured)
+class MemSerial():
+
+    def __init__(self, data, writeSize):
+        self.data = memoryview(data)
+        self.writeSize = writeSize
+        self.pos = 0
+        self.avail = 0
+
+    @property
+    def in_waiting(self):
+        if self.avail == 0: # Next lot "arrives"
+            self.avail = min(self.writeSize, len(self.data) - self.pos)
+        return self.avail
+
+    def readinto(self, b):
+        n = min(len(b), self.in_waiting)
+        b[:n] = self.data[self.pos:self.pos+n]
+        self.pos += n
+        self.avail -= n
+        return n
+
+
+# Input buffer plus streaming decoder, the way GetData uses them
+def BenchRingDecode(data, xRes, yRes, fmt=DEFAULT_FORMAT, writeSize=4096):
+    def Run():
+        ring = ByteRing(MemSerial(data, writeSize))
+        dec = MakeDecoder(fmt, xRes, yRes)
+        while not dec.done:
+            pix, used = dec.Feed(ring.Peek())
+            ring.Consume(used)
+    t = Best(Run)
+    return {"bytes": len(data), "writeSize": writeSize, "seconds": t, "bytesPerSec": len(data)/t}
+
+
+# Framebuffer writes and row rendering, in the batches the decoder hands out for chunkSize-byte serial reads
+def BenchRender(data, xRes, yRes, fmt=DEFAULT_FORMAT, chunkSize=256):
+    dec = MakeDecoder(fmt, xRes, yRes)
+    batches = []
+    for pos in range(0, len(data), chunkSize):
+        pix, used = dec.Feed(data[pos:pos+chunkSize])
+        batches.append(pix)
+    frame = IndexedFrame(xRes, yRes, DEFAULT_PALETTE)
+    rows = [0]
+    def Run():
+        frame.Reset()
+        rows[0] = 0
+        for pix in batches:
+            r0, r1 = frame.Write(pix)
+            frame.RenderRows(r0, r1)
+            rows[0] += r1-r0
+    t = Best(Run)
+    return {"batches": len(batches), "rowsRendered": rows[0], "seconds": t, "rowsPerSec": rows[0]/t}
+
+
+def BenchRecolor(frameData):
+    yRes, xRes = frameData.shape
+    frame = IndexedFrame(xRes, yRes, DEFAULT_PALETTE)
+    frame.Write(frameData.reshape(-1))
+    palettes = [DEFAULT_PALETTE, DEFAULT_PALETTE[::-1]]
+    def Run():
+        for pal in palettes:
+            frame.SetPalette(pal)
+            frame.Render()
+    t = Best(Run) / len(palettes)
+    return {"seconds": t}
+
+
+# Trace extraction, graticule finding included (None for a screen with no graticule)
+def BenchTraces(frameData):
+    try:
+        traces = ExtractTraces(frameData)
+    except ValueError:
+        return None
+    t = Best(lambda: ExtractTraces(frameData))
+    return {"traces": len(traces), "seconds": t}
+
+
+# Stand-in for the GUI: renders whatever SerIface has written to the frame updateHz times a second, the way the
+# GUI's update timer does, and notes when the last pixel is rendered
+class BenchGui():
+
+    def __init__(self, xRes, yRes, updateHz=30):
+        self.pool = FramePool(DEFAULT_PALETTE)
+        self.frame = self.pool.Get(xRes, yRes) # (The one SerIface will get for a capture this size)
+        self.done = threading.Event()
+        self.lastPixel = None
+        self.updates = 0
+        self.errors = []
+        self.stats = None # The SerIface's CaptureStats, once it's done
+        self.captures = [] # (pixel values, changed rows, stats) for every capture done
+        self.poller = threading.Thread(target=self.Poll, args=(1.0/updateHz,), daemon=True)
+        self.poller.start()
+
+    def Poll(self, interval):
+        page = pos = 0
+        while not self.done.is_set():
+            time.sleep(interval)
+            if self.frame.page != page:
+                page = self.frame.page
+                pos = 0
+            r0, r1, pos = self.frame.DirtyRows(pos)
+            if r1 > r0:
+                self.frame.RenderRows(r0, r1)
+                self.updates += 1
+            if pos == self.frame.pix.size:
+                self.lastPixel = time.monotonic()
+                self.done.set()
+
+    def GetLogTextCtrl(self):
+        return self
+
+    def Log(self, text):
+        pass
+
+    def LogWarning(self, text):
+        self.errors.append(text.strip())
+
+    LogError = LogWarning
+
+    def SetSerStatus(self, text):
+        pass
+
+    def CaptureDone(self, frame, pix, changed, payload, stats):
+        self.stats = stats
+        self.captures.append((pix, changed, stats))
+
+
+# Play a session through a pseudo-terminal at the given baud rate into a SerIface and time it from the first byte
+# sent to the last pixel rendered
+def BenchEndToEnd(sessionFile, xRes, yRes, baud, fmt=None):
+    total = sum(len(data) for t, data in ReadSession(sessionFile))
+    wire = total * 10.0 / baud
+    replay = ReplayPty(sessionFile, realtime=False, delay=0.5, baud=baud)
+    gui = BenchGui(xRes, yRes)
+    sph = SerIface(gui, replay.port, pool=gui.pool, fmt=fmt)
+    sph.start()
+    replay.Start()
+    ok = gui.done.wait(wire*2 + 10)
+    sph.Terminate()
+    sph.join()
+    gui.done.set() # (Stops the poller if it timed out)
+    replay.Close()
+    res = {"baud": baud, "bytes": total, "wireSeconds": wire, "updates": gui.updates}
+    if gui.stats is not None:
+        res["capture"] = gui.stats.AsDict()
+    if ok:
+        res["timeToLastPixel"] = gui.lastPixel - replay.startTime
+        res["overheadSeconds"] = res["timeToLastPixel"] - wire
+    else:
+        res["error"] = "; ".join(gui.errors) or "timed out"
+    return res
+
+
+# Correctness checks (--check): each returns a list of what went wrong
+
+# Binary compacted decoded a byte at a time, the way the original GetData did it -- what the streaming decoder is
+# checked against.  Returns (pixel values, bytes used, whether the image was finished), or raises DecodeError.
+def ReferenceDecode(data, xRes, yRes):
+    totPix = xRes * yRes
+    pix = []
+    i = 0
+    while len(pix) < totPix:
+        if i >= len(data) or ((data[i] >> 6) == 0 and i+1 >= len(data)) or \
+           ((data[i] >> 6) == 0 and 0 < data[i+1] < 4 and i+2 >= len(data)): # Last token isn't all there
+            return pix, i, False
+        b1 = data[i]
+        rpt = b1 >> 6
+        i += 1
+        if rpt == 0: # Repeat count actually in next byte
+            rpt = data[i]
+            i += 1
+            if rpt == 0: # Not supposed to happen
+                raise DecodeError("Invalid data received at pixel %d" % len(pix))
+            if rpt < 4: # Repeat count >255, LSB in next byte
+                rpt = (rpt << 8) + data[i]
+                i += 1
+        pix += [b1 & 0x07, (b1 >> 3) & 0x07] * rpt
+    return pix[:totPix], i, True
+
+
+# The streaming compacted decoder against ReferenceDecode, on random streams (heavy on the bytes that make for
+# extended and invalid counts) fed in random chunks, and on real screens
+def CheckDecoder(frames, runs=5000, seed=1):
+    rng = np.random.default_rng(seed)
+    failures = []
+    cases = [(FORMATS[DEFAULT_FORMAT][1](frame), frame.shape[1], frame.shape[0]) for frame in frames]
+    for run in range(runs):
+        n = int(rng.integers(1, 200))
+        data = np.where(rng.random(n) < 0.3, rng.integers(0, 4, n), rng.integers(0, 256, n)).astype(np.uint8).tobytes()
+        cases.append((data, int(rng.integers(1, 40)), int(rng.integers(1, 40))))
+    for data, xRes, yRes in cases:
+        try:
+            expect = ReferenceDecode(data, xRes, yRes)
+        except DecodeError:
+            expect = "error"
+        dec = CompactedDecoder(xRes, yRes)
+        pix = []
+        used = pos = 0
+        try:
+            while pos < len(data) and not dec.done:
+                step = int(rng.integers(1, 64))
+                p, u = dec.Feed(data[pos:pos+step])
+                pix.append(p)
+                used += u
+                pos += step
+            got = (np.concatenate(pix).tolist() if pix else [], used if dec.done else len(data), dec.done)
+        except DecodeError:
+            got = "error"
+        if expect != "error" and not expect[2]: # (Unfinished: only what's been decoded so far has to agree)
+            expect = (expect[0], len(data), False)
+        if got != expect:
+            failures.append("decoder: %d bytes at %dx%d (%s...) decoded as %s, should be %s" % (len(data), xRes, yRes,
+                data[:12].hex(), "an error" if got == "error" else "%d pixels" % len(got[0]),
+                "an error" if expect == "error" else "%d pixels" % len(expect[0])))
+            if len(failures) >= 10:
+                break
+    return failures
+
+
+# Hardcopies of frames in format fmt sent back to back, each header hard on the heels of the last image, through a
+# pseudo-terminal into a SerIface that's left to tell the format for itself: every one should arrive intact, saying
+# which rows changed from the one before, with stats that can be written out
+def CheckReplay(name, frames, tmpDir, fmt=DEFAULT_FORMAT, baud=1000000):
+    fileName = os.path.join(tmpDir, "check.rec")
+    w = SessionWriter(fileName)
+    for frame in frames:
+        (yRes, xRes) = frame.shape
+        w.Write(BANNER + b"%d\r\n%d\r\n\x00" % (xRes, yRes) + FORMATS[fmt][1](frame))
+    w.Close()
+    replay = ReplayPty(fileName, realtime=False, delay=0.5, baud=baud)
+    gui = BenchGui(xRes, yRes)
+    sph = SerIface(gui, replay.port, pool=gui.pool)
+    sph.start()
+    replay.Start()
+    deadline = time.monotonic() + 30
+    while len(gui.captures) < len(frames) and sph.is_alive() and time.monotonic() < deadline:
+        time.sleep(0.1)
+    sph.Terminate()
+    sph.join()
+    gui.done.set()
+    replay.Close()
+    failures = []
+    if len(gui.captures) != len(frames):
+        failures.append("%s: %d of %d captures arrived" % (name, len(gui.captures), len(frames)))
+    for i, (pix, changed, stats) in enumerate(gui.captures):
+        if not np.array_equal(pix, frames[i]):
+            failures.append("%s: capture %d isn't what was sent" % (name, i))
+        expect = None if i == 0 else (frames[i] != frames[i-1]).any(axis=1)
+        if (changed is None) != (expect is None) or (changed is not None and not np.array_equal(changed, expect)):
+            failures.append("%s: capture %d's changed rows are wrong" % (name, i))
+        try:
+            stats.ToJSON()
+        except (TypeError, ValueError) as e:
+            failures.append("%s: capture %d's stats can't be written: %s" % (name, i, e))
+    return failures
+
+
+# Captures of the same size archived with which rows changed from the one before, then read back: each should come
+# back the same, a repeat should share the dump before it rather than store it again, and an export should say what
+# changed
+def CheckArchive(frames, tmpDir):
+    failures = []
+    arc = TekArchive(os.path.join(tmpDir, "check.tsa"))
+    changes = [None] + [(frames[i] != frames[i-1]).any(axis=1) for i in range(1, len(frames))]
+    for frame, changed in zip(frames, changes):
+        (yRes, xRes) = frame.shape
+        arc.Append(FORMATS[DEFAULT_FORMAT][1](frame), xRes, yRes, changed=changed)
+    index = arc.Index()
+    for i, (frame, changed) in enumerate(zip(frames, changes)):
+        if not np.array_equal(arc.Frame(i), frame):
+            failures.append("archive: capture %d isn't what was archived" % i)
+        got = arc.ChangedRows(i)
+        if (got is None) != (changed is None) or (got is not None and not np.array_equal(got, changed)):
+            failures.append("archive: capture %d's changed rows are wrong" % i)
+        shared = i > 0 and index[i]["offset"] == index[i-1]["offset"]
+        if shared != (changed is not None and not changed.any()):
+            failures.append("archive: capture %d %s the dump before it" % (i, "shares" if shared else "doesn't share"))
+        if changed is not None:
+            fileName = os.path.join(tmpDir, "check.png")
+            Export(fileName, frame, DEFAULT_PALETTE, changed[:,None])
+            with open(fileName, "rb") as f:
+                if ChangedText(changed[:,None]).encode("latin-1") not in f.read():
+                    failures.append("archive: capture %d's export doesn't say what changed" % i)
+    arc.Close()
+    return failures
+
+
+# Fresh interpreters: how long each of NO_WX_MODULES takes to import (best of runs, less the interpreter's own
+# startup) and whether wx came with it, then TSC.py from launch until its window is up and it's listening (if wx is
+# installed)
+def BenchStartup(runs=5):
+    def Best(cmd):
+        times = []
+        for i in range(runs):
+            t = time.perf_counter()
+            out = subprocess.run(cmd, cwd=HERE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+            times.append(time.perf_counter() - t)
+        return min(times), out
+    bare, out = Best([sys.executable, "-c", "pass"])
+    res = {"interpreterSeconds": bare, "imports": {}}
+    for name in NO_WX_MODULES:
+        code = "import sys, time; t = time.perf_counter(); import %s; print(time.perf_counter() - t, 'wx' in sys.modules)" % name
+        times = []
+        for i in range(runs):
+            out = subprocess.run([sys.executable, "-c", code], cwd=HERE, stdout=subprocess.PIPE, check=True).stdout.split()
+            times.append(float(out[0]))
+        res["imports"][name] = {"seconds": min(times), "importsWx": out[1] == b"True"}
+    if importlib.util.find_spec("wx") is None:
+        res["gui"] = {"error": "wx not installed"}
+    else:
+        try:
+            seconds, out = Best([sys.executable, "TSC.py", "--startup-test"])
+            res["gui"] = {"seconds": seconds, "lessInterpreter": seconds - bare}
+        except subprocess.CalledProcessError as e:
+            res["gui"] = {"error": "TSC.py exited with %d" % e.returncode}
+    return res
+
+
+def RunChecks(tmpDir):
+    frames = SyntheticFrames()
+    print("Checking the decoder against a byte-at-a-time one...", file=sys.stderr)
+    failures = CheckDecoder(list(frames.values()) + [frames["noisy"][300:309,270:277]]) # (And an odd number of pixels)
+    print("Checking back-to-back captures...", file=sys.stderr)
+    failures += CheckReplay("back to back", [frames["blank"], frames["grid"], frames["grid"], frames["noisy"]], tmpDir)
+    print("Checking the archive...", file=sys.stderr)
+    failures += CheckArchive([frames["blank"], frames["grid"], frames["grid"], frames["noisy"]], tmpDir)
+    print("Checking data format detection...", file=sys.stderr)
+    for fmt in FORMATS: # (The grid's top row is all one pair, so the binary formats start out looking compacted)
+        failures += CheckReplay(fmt, [frames["grid"]], tmpDir, fmt)
+    return failures
+
+
+def WriteSession(fileName, data, xRes, yRes):
+    w = SessionWriter(fileName)
+    w.Write(BANNER + b"%d\r\n%d\r\n\x00" % (xRes, yRes))
+    w.Write(data)
+    w.Close()
+
+
+def Main():
+    parser = argparse.ArgumentParser(description="Benchmark TSC's decode, render and capture paths.")
+    parser.add_argument("-o", "--output", metavar="FILE", help="write JSON results here (default: stdout)")
+    parser.add_argument("--session", metavar="FILE", action="append", default=[], help="also benchmark this recorded session (repeatable)")
+    parser.add_argument("--baud", type=int, action="append", help="end-to-end baud rate (repeatable; default 9600, 19200 and 38400)")
+    parser.add_argument("--no-e2e", action="store_true", help="skip the end-to-end pseudo-terminal runs")
+    parser.add_argument("--startup-only", action="store_true", help="only benchmark startup")
+    parser.add_argument("--max-startup", type=float, metavar="SECONDS",
+        help="exit with an error if the GUI takes longer than this to start (less the interpreter's own startup)")
+    parser.add_argument("--check", action="store_true", help="only run the correctness checks, and exit with an error if any fails")
+    parser.add_argument("--format", action="append", choices=list(FORMATS) + ["all"],
+        help="data format for the synthetic screens (repeatable; default '%s')" % DEFAULT_FORMAT)
+    args = parser.parse_args()
+    bauds = args.baud or [9600, 19200, 38400]
+    formats = list(FORMATS) if "all" in (args.format or []) else args.format or [DEFAULT_FORMAT]
+
+    tmpDir = tempfile.mkdtemp(prefix="tscbench")
+    if args.check:
+        failures = RunChecks(tmpDir)
+        for name in os.listdir(tmpDir):
+            os.remove(os.path.join(tmpDir, name))
+        os.rmdir(tmpDir)
+        for failure in failures:
+            print("FAILED: " + failure, file=sys.stderr)
+        print("%s." % ("%d checks failed" % len(failures) if failures else "All checks passed"), file=sys.stderr)
+        return 1 if failures else 0
+    streams = {} # name -> (xRes, yRes, data, format, session file)
+    for name, frame in ([] if args.startup_only else SyntheticFrames().items()):
+        for fmt in formats:
+            data = FORMATS[fmt][1](frame)
+            label = name if fmt == DEFAULT_FORMAT else "%s (%s)" % (name, fmt)
+            fileName = os.path.join(tmpDir, "%s-%d.rec" % (name, len(streams)))
+            WriteSession(fileName, data, TEK_XRES, TEK_YRES)
+            streams[label] = (TEK_XRES, TEK_YRES, data, fmt, fileName)
+    for fileName in ([] if args.startup_only else args.session):
+        xRes, yRes, data = SplitSession(fileName)
+        streams[os.path.basename(fileName)] = (xRes, yRes, data, DetectFormat(data), fileName)
+
+    results = {}
+    for name, (xRes, yRes, data, fmt, fileName) in streams.items():
+        print("Benchmarking '%s' (%d bytes)..." % (name, len(data)), file=sys.stderr)
+        res = {"xRes": xRes, "yRes": yRes, "format": fmt, "bytes": len(data)}
+        res["decode"] = BenchDecode(data, xRes, yRes, fmt)
+        res["ringDecode"] = BenchRingDecode(data, xRes, yRes, fmt)
+        res["render"] = BenchRender(data, xRes, yRes, fmt)
+        res["recolor"] = BenchRecolor(Decode(data, xRes, yRes, fmt))
+        res["traces"] = BenchTraces(Decode(data, xRes, yRes, fmt))
+        if not args.no_e2e:
+            res["endToEnd"] = [BenchEndToEnd(fileName, xRes, yRes, baud, fmt) for baud in bauds]
+        results[name] = res
+
+    for name in os.listdir(tmpDir):
+        os.remove(os.path.join(tmpDir, name))
+    os.rmdir(tmpDir)
+
+    print("Benchmarking startup...", file=sys.stderr)
+    startup = BenchStartup()
+    failures = ["%s imports wx" % name for name, res in startup["imports"].items() if res["importsWx"]]
+    if args.max_startup is not None and startup["gui"].get("lessInterpreter", 0) > args.max_startup:
+        failures.append("GUI took %.2f s to start" % startup["gui"]["lessInterpreter"])
+
+    out = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+           "python": platform.python_version(),
+           "numpy": np.__version__,
+           "platform": platform.platform(),
+           "startup": startup,
+           "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=2)
+    else:
+        json.dump(out, sys.stdout, indent=2)
+        print()
+    for failure in failures:
+        print("FAILED: " + failure, file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(Main())
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+#----------------------------------------------------------------------------
+# Name:         TSCCapture.py
+# Abstract:     Command-line screen capture for unattended use (no display,
+#               no wx).  Listens on a serial port with the same SerIface the
+#               GUI uses and writes every hardcopy straight to disk.
+#
+#               python TSCCapture.py /dev/ttyUSB0 -n 5 -o "scope-{n:03d}.png"
+#----------------------------------------------------------------------------
+import argparse
+import os
+import queue
+import sys
+import time
+import numpy as np   # pip install -U numpy
+
+from SerIface import SerIface
+from TekFrame import DEFAULT_PALETTE, TurnChanged
+from TekDecode import FORMATS
+from TekExport import Export, WRITERS
+from TekArchive import TekArchive
+from TekProbe import Probe
+from TekTrace import ExtractTraces, ExportTraces
+
+# Takes the place of the GUI: queues a copy of each finished capture for the main thread to save
+class CaptureListener():
+
+    def __init__(self, quiet=False, archive=None, port="", statsFile=None, skipUnchanged=False):
+        self.quiet = quiet
+        self.archive = archive
+        self.port = port
+        self.statsFile = statsFile # Each capture's CaptureStats is written here as a line of JSON
+        self.skipUnchanged = skipUnchanged # Don't write a capture out if it's the same as the last one
+        self.captures = queue.Queue()
+
+    def GetLogTextCtrl(self):
+        return self
+
+    def Log(self, text):
+        if not self.quiet:
+            sys.stderr.write(text)
+
+    def LogWarning(self, text):
+        sys.stderr.write("WARNING: " + text)
+
+    def LogError(self, text):
+        sys.stderr.write("ERROR: " + text)
+
+    def SetSerStatus(self, text):
+        pass
+
+    # (Stats last, so nothing that goes wrong with them can cost the capture)
+    def CaptureDone(self, frame, pix, changed, payload, stats):
+        if self.archive is not None:
+            self.archive.Append(payload, frame.xRes, frame.yRes, self.port, DEFAULT_PALETTE, changed=changed)
+        if self.skipUnchanged and stats.rowsChanged == 0:
+            self.Log("Capture same as the last one; not saved again.\n")
+        else:
+            self.captures.put((time.localtime(), np.rot90(pix, frame.turns), # (pix is already a copy of the frame's)
+                None if changed is None else TurnChanged(changed, frame.turns)))
+        if self.statsFile is not None:
+            try:
+                self.statsFile.write(stats.ToJSON(port=self.port, xRes=frame.xRes, yRes=frame.yRes) + "\n")
+                self.statsFile.flush()
+            except (IOError, TypeError, ValueError) as e:
+                self.LogError("Couldn't write capture stats: %s\n" % e)
+
+
+def Main():
+    parser = argparse.ArgumentParser(description="Capture Tektronix 1180x/CSA803 hardcopies to disk without the GUI.")
+    parser.add_argument("port", help="serial port the scope is connected to ('auto' to look for it)")
+    parser.add_argument("-o", "--output", metavar="TEMPLATE", default="tsc-{time}-{n:03d}.png",
+        help="file name template; {n} is the capture number, {time} a timestamp and {port} the port name. "
+             "The extension picks the format: %s (default: %%(default)s)" % ", ".join(sorted(WRITERS)))
+    parser.add_argument("-n", "--count", type=int, help="exit after this many captures")
+    parser.add_argument("-t", "--timeout", type=float, help="exit after this many seconds")
+    parser.add_argument("-b", "--baud", type=int, default=19200, help="baud rate (default: %(default)s; found along with the port if that's 'auto')")
+    parser.add_argument("-f", "--format", choices=list(FORMATS), help="data format the scope's set to (default: tell from the data)")
+    parser.add_argument("-a", "--archive", metavar="FILE", help="also append each raw dump to this archive (.tsa)")
+    parser.add_argument("--record", metavar="DIR", help="also save everything read from the port to a session file in DIR")
+    parser.add_argument("--traces", metavar="TEMPLATE", help="also extract each capture's traces to a .csv or .npy file (same fields as --output)")
+    parser.add_argument("--serve", metavar="[HOST:]PORT", help="also serve captures to viewers (web browsers) as they come in")
+    parser.add_argument("--stats", metavar="FILE", help="append each capture's timings to FILE as a line of JSON")
+    parser.add_argument("-u", "--skip-unchanged", action="store_true", help="don't save a capture that's the same as the one before")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report warnings, errors and saved files")
+    args = parser.parse_args()
+
+    if args.port == "auto":
+        found = Probe()
+        if not found:
+            sys.stderr.write("ERROR: No scope answered on any serial port.\n")
+            return 1
+        (args.port, args.baud, reply) = found[0]
+        sys.stderr.write("Found '%s' on %s at %d baud.\n" % (reply, args.port, args.baud))
+
+    archive = TekArchive(args.archive) if args.archive else None
+    statsFile = open(args.stats, "a") if args.stats else None
+    listener = CaptureListener(args.quiet, archive, args.port, statsFile, args.skip_unchanged)
+    server = stream = None
+    if args.serve:
+        from TekStream import StreamServer, ParseAddress
+        (host, port) = ParseAddress(args.serve)
+        server = StreamServer(port, host)
+        server.Start()
+        stream = server.Channel(os.path.basename(args.port))
+        sys.stderr.write("Serving captures at %s\n" % server.URL())
+    sph = SerIface(listener, args.port, args.record, baud=args.baud, stream=stream, fmt=args.format)
+    sph.daemon = True
+    sph.start()
+
+    deadline = None if args.timeout is None else time.monotonic() + args.timeout
+    n = 0
+    try:
+        while args.count is None or n < args.count:
+            wait = None if deadline is None else deadline - time.monotonic()
+            if wait is not None and wait <= 0:
+                break
+            try:
+                when, pix, changed = listener.captures.get(timeout=wait)
+            except queue.Empty:
+                break
+            n += 1
+            fields = dict(n=n, time=time.strftime("%Y%m%d-%H%M%S", when), port=os.path.basename(args.port))
+            fileName = args.output.format(**fields)
+            Export(fileName, pix, DEFAULT_PALETTE, changed)
+            print(fileName)
+            if args.traces:
+                try:
+                    traces = ExtractTraces(pix)
+                except ValueError as e:
+                    listener.LogWarning("No traces from capture %d: %s\n" % (n, e))
+                else:
+                    fileName = args.traces.format(**fields)
+                    ExportTraces(fileName, traces)
+                    print(fileName)
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sph.Terminate()
+        sph.join(2.0)
+        if server is not None:
+            server.Stop()
+        if statsFile is not None:
+            statsFile.close()
+
+    # Only a shortfall against an explicit count is a failure
+    return 0 if args.count is None or n >= args.count else 1
+
+if __name__ == "__main__":
+    sys.exit(Main())
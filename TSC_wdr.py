@@ -30,6 +30,18 @@ ID_PAL_DEFAULTS = 10003
 ID_CITC_BUTTON = 10004
 ID_HELP_BUTTON = 10005
 ID_LOG_TEXTCTRL = 10006
+ID_PAL_PREVIEW = 10007
+ID_ADD_SCOPE = 10008
+ID_REMOVE_SCOPE = 10009
+ID_AUTOSAVE = 10010
+ID_SAVE_FORMAT = 10011
+ID_SAVE_DIR = 10012
+ID_ARCHIVE = 10013
+ID_FIND_SCOPE = 10014
+ID_SHOW_STATS = 10015
+ID_ZOOM = 10016
+ID_HISTORY = 10017
+ID_HIGHLIGHT = 10018
 
 def MainDlg( parent, call_fit = True, set_sizer = True ):
     item0 = wx.BoxSizer( wx.HORIZONTAL )
@@ -50,8 +62,24 @@ def MainDlg( parent, call_fit = True, set_sizer = True ):
     item6.SetToolTip( wx.ToolTip("Select serial port from drop-down list or enter it directly.") )
     item4.Add( item6, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
 
+    item29 = wx.Button( parent, ID_FIND_SCOPE, "&Find", wx.DefaultPosition, wx.DefaultSize, 0 )
+    item29.SetToolTip( wx.ToolTip("Try every serial port at every likely baud rate and use the first one a scope answers on.") )
+    item4.Add( item29, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
     item2.Add( item4, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5 )
 
+    item21 = wx.BoxSizer( wx.HORIZONTAL )
+    
+    item22 = wx.Button( parent, ID_ADD_SCOPE, "&Add Scope", wx.DefaultPosition, wx.DefaultSize, 0 )
+    item22.SetToolTip( wx.ToolTip("Add a tab for another scope on another serial port.") )
+    item21.Add( item22, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
+    item23 = wx.Button( parent, ID_REMOVE_SCOPE, "&Remove Scope", wx.DefaultPosition, wx.DefaultSize, 0 )
+    item23.SetToolTip( wx.ToolTip("Close the current scope's tab and stop listening on its port.") )
+    item21.Add( item23, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
+    item2.Add( item21, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5 )
+
     item7 = wx.BoxSizer( wx.HORIZONTAL )
     
     item8 = wx.StaticText( parent, ID_TEXT, "Status:", wx.DefaultPosition, wx.DefaultSize, 0 )
@@ -76,12 +104,60 @@ def MainDlg( parent, call_fit = True, set_sizer = True ):
     item12.SetToolTip( wx.ToolTip("Replace all 8 color palette entries with internal default values.") )
     item2.Add( item12, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
 
+    item20 = wx.CheckBox( parent, ID_PAL_PREVIEW, "&Preview colors while choosing", wx.DefaultPosition, wx.DefaultSize, 0 )
+    item20.SetToolTip( wx.ToolTip("Recolor the screen capture live while the color dialog is open.") )
+    item2.Add( item20, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
+    item31 = wx.BoxSizer( wx.HORIZONTAL )
+    
+    item32 = wx.StaticText( parent, ID_TEXT, "&Zoom:", wx.DefaultPosition, wx.DefaultSize, 0 )
+    item31.Add( item32, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
+    item33 = wx.Choice( parent, ID_ZOOM, wx.DefaultPosition, wx.DefaultSize, 
+        ["Fit","50%","100%","150%","200%","300%"] , 0 )
+    item33.SetToolTip( wx.ToolTip("Fit: scale the capture to the window.  Otherwise scroll to see the parts that don't fit.") )
+    item31.Add( item33, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
+    item2.Add( item31, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
     item2.Add( [ 20, 20 ] , 0, wx.ALIGN_CENTER|wx.ALL, 5 )
 
     item13 = wx.Button( parent, ID_CITC_BUTTON, "&Copy Image to Clipboard", wx.DefaultPosition, wx.DefaultSize, 0 )
     item13.SetToolTip( wx.ToolTip("Copy bitmap image to the system clipboard.") )
     item2.Add( item13, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
 
+    item24 = wx.BoxSizer( wx.HORIZONTAL )
+    
+    item25 = wx.CheckBox( parent, ID_AUTOSAVE, "&Save each capture as", wx.DefaultPosition, wx.DefaultSize, 0 )
+    item25.SetToolTip( wx.ToolTip("Write every finished capture to the folder below (in the background).") )
+    item24.Add( item25, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
+    item26 = wx.Choice( parent, ID_SAVE_FORMAT, wx.DefaultPosition, wx.DefaultSize, 
+        ["PNG","NPY","TIFF"] , 0 )
+    item26.SetToolTip( wx.ToolTip("PNG: small palette image.  NPY: raw pixel values for NumPy.  TIFF: palette TIFF.") )
+    item24.Add( item26, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
+    item2.Add( item24, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
+    item27 = wx.DirPickerCtrl( parent, ID_SAVE_DIR, "", "Folder for saved captures", wx.DefaultPosition, [250,-1], wx.DIRP_USE_TEXTCTRL )
+    item2.Add( item27, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
+    item28 = wx.CheckBox( parent, ID_ARCHIVE, "Also &archive raw dumps in that folder", wx.DefaultPosition, wx.DefaultSize, 0 )
+    item28.SetToolTip( wx.ToolTip("Append the scope's compacted data for every capture to TSC-archive.tsa (a few KB each).") )
+    item2.Add( item28, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
+    item30 = wx.CheckBox( parent, ID_SHOW_STATS, "Show capture s&tatistics", wx.DefaultPosition, wx.DefaultSize, 0 )
+    item30.SetToolTip( wx.ToolTip("Show how long the last capture spent on the line, decoding, rendering and painting.") )
+    item2.Add( item30, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
+    item34 = wx.CheckBox( parent, ID_HISTORY, "Keep capture &history", wx.DefaultPosition, wx.DefaultSize, 0 )
+    item34.SetToolTip( wx.ToolTip("Keep recent captures to step back through.  Older ones go to TSC-history.tsa in the save folder, if there is one.") )
+    item2.Add( item34, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
+    item35 = wx.CheckBox( parent, ID_HIGHLIGHT, "Highlight &changed rows", wx.DefaultPosition, wx.DefaultSize, 0 )
+    item35.SetToolTip( wx.ToolTip("Tint the rows of each capture that differ from the one before.") )
+    item2.Add( item35, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+
     item14 = wx.Button( parent, ID_HELP_BUTTON, "&Help", wx.DefaultPosition, wx.DefaultSize, 0 )
     item14.SetToolTip( wx.ToolTip("Display help on setting up your 'scope and using this program.") )
     item2.Add( item14, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
@@ -91,19 +167,19 @@ def MainDlg( parent, call_fit = True, set_sizer = True ):
     item16 = wx.StaticBox( parent, -1, "Log" )
     item15 = wx.StaticBoxSizer( item16, wx.VERTICAL )
     
-    item17 = LogTextCtrl( parent, ID_LOG_TEXTCTRL, "", wx.DefaultPosition, [300,300], wx.TE_MULTILINE|wx.TE_RICH|wx.TE_READONLY )
+    item17 = LogTextCtrl( parent, ID_LOG_TEXTCTRL, wx.DefaultPosition, [300,300], wx.LC_REPORT|wx.LC_VIRTUAL|wx.LC_NO_HEADER|wx.SUNKEN_BORDER )
     item15.Add( item17, 1, wx.GROW|wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5 )
 
     item1.Add( item15, 1, wx.GROW|wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5 )
 
-    item0.Add( item1, 1, wx.GROW|wx.ALIGN_CENTER_HORIZONTAL|wx.ALL, 5 )
+    item0.Add( item1, 0, wx.GROW|wx.ALIGN_CENTER_HORIZONTAL|wx.ALL, 5 )
 
     item19 = wx.StaticBox( parent, -1, "Screen Capture" )
     item18 = wx.StaticBoxSizer( item19, wx.VERTICAL )
 
     parent.capSizer = item18
     
-    item0.Add( item18, 0, wx.ALIGN_CENTER|wx.ALL, 5 )
+    item0.Add( item18, 1, wx.GROW|wx.ALL, 5 )
 
     if set_sizer == True:
         parent.SetSizer( item0 )
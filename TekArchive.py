@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+#----------------------------------------------------------------------------
+# Name:         TekArchive.py
+# Abstract:     Append-only archive of raw hardcopy dumps.  The scope's own
+#               compacted stream is only a few KB, so that's what's kept;
+#               frames are decoded on demand.  (Dumps in the other data
+#               formats are kept as sent, and recognized when decoded.)
+#
+#               An archive is two files: NAME.tsa holds the dumps back to
+#               back and NAME.tsi is a fixed-size record per capture, so the
+#               index can be mapped straight into a NumPy array and any dump
+#               found without reading the others.  The record also says which
+#               rows changed from the capture before, when that's known; a
+#               capture that changed nothing shares the dump before it rather
+#               than storing the same bytes again.
+#
+#               python TekArchive.py campaign.tsa              (list)
+#               python TekArchive.py campaign.tsa 17 cap17.png (extract)
+#----------------------------------------------------------------------------
+import mmap
+import os
+import time
+import numpy as np   # pip install -U numpy
+
+from TekDecode import Decode
+from TekFrame import DEFAULT_PALETTE, TurnChanged, Turns
+
+DATA_MAGIC = b"TSCARC1\n"
+INDEX_MAGIC = b"TSCIDX2\n"
+INDEX_HDR = 16 # INDEX_MAGIC, padded
+MAX_ROWS = 1024 # Most rows a changed-rows mask can cover (the scopes send at most 704)
+
+INDEX_DTYPE_V1 = np.dtype([
+    ("offset", "<u8"), # Where the dump starts in the .tsa file...
+    ("length", "<u4"), # ...and how long it is
+    ("xRes", "<u2"),
+    ("yRes", "<u2"),
+    ("time", "<f8"), # When it was captured (seconds since the epoch)
+    ("port", "S32"), # Serial port it came in on
+    ("palette", "u1", (8,3))]) # Colors in use at the time
+
+INDEX_DTYPE = np.dtype(INDEX_DTYPE_V1.descr + [
+    ("rowsChanged", "<i2"), # How many rows differ from the capture before (-1 if that isn't known)...
+    ("changed", "u1", (MAX_ROWS//8,))]) # ...and which, one bit per row as sent (np.packbits)
+
+# Index versions that can be read, by magic (archives made before there were changed rows are still added to as
+# they are)
+INDEX_DTYPES = {b"TSCIDX1\n": INDEX_DTYPE_V1, INDEX_MAGIC: INDEX_DTYPE}
+
+
+class TekArchive():
+
+    # fileName can be given with or without the .tsa extension; the archive is created if it doesn't exist
+    def __init__(self, fileName):
+        base = fileName[:-4] if fileName.lower().endswith(".tsa") else fileName
+        self.dataName = base + ".tsa"
+        self.indexName = base + ".tsi"
+        if not os.path.exists(self.dataName):
+            with open(self.dataName, "wb") as f:
+                f.write(DATA_MAGIC)
+            with open(self.indexName, "wb") as f:
+                f.write(INDEX_MAGIC.ljust(INDEX_HDR, b"\0"))
+            self.dtype = INDEX_DTYPE
+        else:
+            with open(self.dataName, "rb") as f:
+                ok = f.read(len(DATA_MAGIC)) == DATA_MAGIC
+            with open(self.indexName, "rb") as f:
+                self.dtype = INDEX_DTYPES.get(f.read(len(INDEX_MAGIC)))
+            if not ok or self.dtype is None:
+                raise ValueError("'%s' isn't a TSC archive" % self.dataName)
+
+        self.dataMap = None
+        self.index = None
+
+    def __len__(self):
+        return (os.path.getsize(self.indexName) - INDEX_HDR) // self.dtype.itemsize
+
+    # Add a dump; returns its capture number.  changed is which of its rows differ from the capture before (an array
+    # of bools, as TekFrame.ChangedRows() gives), if that's known.
+    def Append(self, payload, xRes, yRes, port="", palette=DEFAULT_PALETTE, when=None, changed=None):
+        n = len(self)
+        offset = None
+        if changed is not None and not changed.any() and n > 0:
+            last = self.Index()[n-1]
+            if (last["xRes"], last["yRes"]) == (xRes, yRes):
+                prev = self.Payload(n-1)
+                if prev == payload: # (Same pixels can come in different bytes -- then they're stored anyway)
+                    offset = int(last["offset"])
+                prev.release()
+        if offset is None:
+            # Data first, then the index entry that points at it, so the index never refers to anything that isn't
+            # there
+            with open(self.dataName, "ab") as f:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                f.write(payload)
+
+        rec = np.zeros(1, self.dtype)
+        rec["offset"] = offset
+        rec["length"] = len(payload)
+        rec["xRes"] = xRes
+        rec["yRes"] = yRes
+        rec["time"] = time.time() if when is None else when
+        rec["port"] = str(port).encode("utf-8", "replace")[:32]
+        rec["palette"][0,:len(palette)] = palette
+        if "changed" in self.dtype.names:
+            if changed is None or len(changed) > MAX_ROWS:
+                rec["rowsChanged"] = -1
+            else:
+                rec["rowsChanged"] = np.count_nonzero(changed)
+                bits = np.packbits(changed)
+                rec["changed"][0,:len(bits)] = bits
+        with open(self.indexName, "ab") as f:
+            f.write(rec.tobytes())
+        return len(self) - 1
+
+    # The whole index as a structured array (memory-mapped, so this is quick however big the archive is)
+    def Index(self):
+        n = len(self)
+        if self.index is None or len(self.index) != n:
+            if n == 0:
+                self.index = np.zeros(0, self.dtype)
+            else:
+                self.index = np.memmap(self.indexName, self.dtype, "r", INDEX_HDR, (n,))
+        return self.index
+
+    # Raw dump i, as a memoryview into the mapped data file
+    def Payload(self, i):
+        rec = self.Index()[i]
+        end = int(rec["offset"]) + int(rec["length"])
+        if self.dataMap is None or len(self.dataMap) < end: # (Re-)map to take in anything appended since
+            with open(self.dataName, "rb") as f: # (The map keeps its own handle)
+                self.dataMap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # Old map goes when its views do
+        return memoryview(self.dataMap)[int(rec["offset"]):end]
+
+    # Capture i decoded to a yRes x xRes array of pixel values, as sent (see View())
+    def Frame(self, i):
+        rec = self.Index()[i]
+        payload = self.Payload(i)
+        try:
+            return Decode(payload, int(rec["xRes"]), int(rec["yRes"]))
+        finally:
+            payload.release()
+
+    # Capture i the right way up
+    def View(self, i):
+        pix = self.Frame(i)
+        return np.rot90(pix, Turns(pix.shape[1], pix.shape[0]))
+
+    # Palette capture i was taken with, as a list of (r,g,b) tuples
+    def Palette(self, i):
+        return [tuple(int(c) for c in rgb) for rgb in self.Index()[i]["palette"]]
+
+    # Which rows of capture i (as sent) differ from the capture before, as an array of bools; None if that isn't
+    # known
+    def ChangedRows(self, i):
+        rec = self.Index()[i]
+        if "changed" not in self.dtype.names or rec["rowsChanged"] < 0:
+            return None
+        return np.unpackbits(rec["changed"])[:int(rec["yRes"])].astype(bool)
+
+    def Close(self):
+        self.dataMap = None
+        self.index = None
+
+
+def Main():
+    import argparse
+    from TekExport import Export
+    parser = argparse.ArgumentParser(description="List or extract captures in a TSC archive.")
+    parser.add_argument("archive", help="archive (.tsa) file")
+    parser.add_argument("capture", type=int, nargs="?", help="capture number to extract")
+    parser.add_argument("output", nargs="?", help="file to extract it to (.png, .tif or .npy)")
+    args = parser.parse_args()
+
+    arc = TekArchive(args.archive)
+    if args.capture is None:
+        for i, rec in enumerate(arc.Index()):
+            changed = arc.ChangedRows(i)
+            print("%6d  %s  %-12s %dx%d  %d bytes%s" % (i, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(rec["time"])),
+                rec["port"].decode("utf-8", "replace"), rec["xRes"], rec["yRes"], rec["length"],
+                "" if changed is None else "  %d rows changed" % changed.sum()))
+    else:
+        i = args.capture
+        rec = arc.Index()[i]
+        changed = arc.ChangedRows(i)
+        if changed is not None:
+            changed = TurnChanged(changed, Turns(int(rec["xRes"]), int(rec["yRes"])))
+        Export(args.output or "capture-%d.png" % i, arc.View(i), arc.Palette(i), changed)
+    arc.Close()
+
+if __name__ == "__main__":
+    Main()
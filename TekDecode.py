@@ -0,0 +1,405 @@
+#----------------------------------------------------------------------------
+# Name:         TekDecode.py
+# Abstract:     Headless decoders for the scope's hardcopy data formats
+#               ("binary compacted" being the one to use) and the header in
+#               front of them.  No wx or pySerial in here, so the GUI, scripts
+#               and anything else that has a dump of the data can share it.
+#----------------------------------------------------------------------------
+import collections
+import numpy as np   # pip install -U numpy
+
+# The "binary compacted" format is a sequence of run tokens, each describing a pair of pixels (pix0, pix1) that
+# is repeated rpt times (so 2*rpt pixels in raster order, alternating pix0, pix1, pix0, pix1...):
+#
+#   b1 = [rr 111 000] -- pix0 is bits 0-2, pix1 is bits 3-5, rr is the repeat count
+#   rr == 0 -- repeat count is in the next byte (1-255); if that's < 4 it's actually the MSB of a 10-bit
+#              count and the LSB follows in a third byte.  A count byte of 0 is invalid.
+#
+# Token boundaries depend on the bytes before them, which is what forced the original code to walk the stream a
+# byte at a time.  Here every position's "token length if a token started here" is worked out at once, and the
+# actual token starts are found by pointer doubling along that chain -- so everything stays in NumPy.
+
+
+class DecodeError(ValueError):
+    pass
+
+
+# Find where each token starts in b (a uint8 array that begins on a token boundary).  Returns (starts, lengths)
+# where lengths[i] is the byte length of the token that would start at position i.  The last start may describe a
+# token that runs past the end of b (i.e., it's incomplete).
+def TokenStarts(b):
+    n = len(b)
+    lengths = np.ones(n, np.intp)
+    if n == 0:
+        return np.zeros(0, np.intp), lengths
+
+    ext = np.flatnonzero((b >> 6) == 0) # Tokens with the repeat count in following byte(s)
+    nxt = np.full(n, 0xff, np.uint8) # Byte after each position (0xff -- i.e., a "short" count -- if unknown)
+    nxt[:-1] = b[1:]
+    lengths[ext] = np.where((nxt[ext] < 4) & (nxt[ext] > 0), 3, 2) # (A 0 is bad data, which FeedRuns catches)
+
+    # jump[i] is where the next token starts if one starts at i; n is a sink that everything past the end goes to
+    jump = np.minimum(np.arange(n, dtype=np.intp) + lengths, n)
+    jump = np.append(jump, n)
+    jumps = [jump]
+    while (1 << len(jumps)) < n:
+        jump = jump[jump]
+        jumps.append(jump)
+
+    # Starting from {0}, each level down interleaves the starts found so far with those half as many steps along
+    starts = np.zeros(1, np.intp)
+    for jump in reversed(jumps):
+        both = np.empty(2*len(starts), np.intp)
+        both[0::2] = starts
+        both[1::2] = jump[starts]
+        starts = both[both < n]
+
+    return starts, lengths
+
+
+# Stream decoder.  Feed it data as it arrives -- token fragments at the end of one chunk are carried over to the
+# next -- and it hands back pixels until the xRes*yRes image is complete.
+class CompactedDecoder():
+
+    def __init__(self, xRes, yRes):
+        self.xRes = xRes
+        self.yRes = yRes
+        self.Reset()
+
+    def Reset(self):
+        self.totPix = self.xRes * self.yRes
+        self.pixDone = 0
+        self.done = False
+        self.tail = np.zeros(0, np.uint8) # Partial token left over from previous chunk
+
+    # Decode as much of data as possible into runs.  Returns (pairs, rpt, used): pairs is an (N,2) uint8 array of
+    # (pix0,pix1), rpt the matching repeat counts and used the number of bytes of data that belong to the image
+    # (anything after that is whatever the scope sent next).  The last run is clipped so the runs never exceed the
+    # image by a whole pair (so only by one pixel, if it has an odd number of them).
+    def FeedRuns(self, data):
+        if self.done:
+            return np.zeros((0,2), np.uint8), np.zeros(0, np.intp), 0
+
+        carried = len(self.tail)
+        b = np.frombuffer(data, np.uint8)
+        if carried:
+            b = np.concatenate((self.tail, b))
+        n = len(b)
+
+        starts, lengths = TokenStarts(b)
+        if len(starts) and starts[-1] + lengths[starts[-1]] > n: # Last token isn't all here yet
+            self.tail = b[starts[-1]:].copy()
+            starts = starts[:-1]
+        else:
+            self.tail = np.zeros(0, np.uint8)
+
+        b1 = b[starts]
+        rpt = (b1 >> 6).astype(np.intp)
+        ext = np.flatnonzero(rpt == 0)
+        if len(ext):
+            cnt = b[starts[ext]+1].astype(np.intp)
+            big = np.flatnonzero((cnt < 4) & (cnt > 0)) # (A 0 stays a 0, to be caught below)
+            cnt[big] = (cnt[big] << 8) + b[starts[ext[big]]+2]
+            rpt[ext] = cnt
+
+        # Stop at the token that completes the image
+        cum = np.cumsum(rpt) * 2
+        pixLeft = self.totPix - self.pixDone
+        last = np.searchsorted(cum, pixLeft)
+        if last < len(rpt): # Image completes in this chunk
+            starts = starts[:last+1]
+            b1 = b1[:last+1]
+            rpt = rpt[:last+1]
+            rpt[-1] -= (cum[last] - pixLeft) // 2
+            used = int(starts[-1] + lengths[starts[-1]] - carried)
+            self.tail = np.zeros(0, np.uint8)
+            self.done = True
+        else:
+            used = len(b) - carried
+
+        bad = np.flatnonzero(rpt == 0)
+        if len(bad): # Not supposed to happen
+            raise DecodeError("Invalid data received at pixel %d" % (self.pixDone + 2*int(rpt[:bad[0]].sum())))
+
+        pairs = np.empty((len(b1),2), np.uint8)
+        pairs[:,0] = b1 & 0x07
+        pairs[:,1] = (b1 >> 3) & 0x07
+        self.pixDone = min(self.totPix, self.pixDone + 2*int(rpt.sum()))
+        return pairs, rpt, used
+
+    # Same as FeedRuns, but returns (pix, used) with the runs expanded to a flat array of pixel values
+    def Feed(self, data):
+        pixStart = self.pixDone
+        pairs, rpt, used = self.FeedRuns(data)
+        pix = np.repeat(pairs, rpt, axis=0).ravel()
+        return pix[:self.pixDone-pixStart], used
+
+
+# Decode a complete dump (bytes, bytearray, memoryview...) to a yRes x xRes array of pixel values (0-7)
+def DecodeCompacted(data, xRes, yRes):
+    dec = CompactedDecoder(xRes, yRes)
+    pix, used = dec.Feed(data)
+    if not dec.done:
+        raise DecodeError("Data ended after %d of %d pixels" % (dec.pixDone, dec.totPix))
+    return pix.reshape(yRes, xRes)
+
+
+# The reverse: encode a yRes x xRes array of pixel values (0-7) as a "binary compacted" stream, using the shortest
+# token for every run.  Handy for synthesizing test data.  An odd number of pixels gets a 0 on the end to make up
+# the last pair (the decoders stop at the image's last pixel).
+def EncodeCompacted(frame):
+    flat = np.asarray(frame, np.uint8).reshape(-1)
+    if flat.size % 2:
+        flat = np.append(flat, np.uint8(0))
+    codes = (flat[0::2] & 0x07) | ((flat[1::2] & 0x07) << 3) # One code per pixel pair
+
+    # Run-length encode the codes, then split runs too long for a single token (max 1023 pairs)
+    edges = np.flatnonzero(np.diff(codes)) + 1
+    first = np.concatenate(([0], edges))
+    lens = np.diff(np.append(first, len(codes)))
+    pieces = (lens + 1022) // 1023
+    code = np.repeat(codes[first], pieces)
+    rpt = np.full(len(code), 1023, np.intp)
+    ends = np.cumsum(pieces) - 1
+    rpt[ends] = lens - (pieces-1)*1023
+
+    # 1 byte for repeats 1-3, 2 for 4-255, 3 for 256-1023
+    size = np.where(rpt < 4, 1, np.where(rpt < 256, 2, 3))
+    pos = np.cumsum(size) - size
+    out = np.zeros(int(size.sum()), np.uint8)
+    short = size == 1
+    out[pos[short]] = code[short] | (rpt[short] << 6)
+    out[pos[~short]] = code[~short]
+    mid = size == 2
+    out[pos[mid]+1] = rpt[mid]
+    big = size == 3
+    out[pos[big]+1] = rpt[big] >> 8
+    out[pos[big]+2] = rpt[big] & 0xff
+    return out.tobytes()
+
+
+# The scope's other data formats.  These layouts are inferred rather than documented -- binary compacted is the only
+# one that's been checked against a real scope -- so treat them as best guesses:
+#
+#   Binary           -- one byte per pixel pair, as a compacted token with its repeat bits clear (so always 0-63)
+#   BinHex           -- the Binary bytes written as pairs of hex digits, in lines
+#   BinHex Compacted -- likewise for the binary compacted stream
+#
+# The BinHex line ends come through as odd characters (see the "Trivia" in the help file), so anything that isn't a
+# hex digit is skipped.
+
+class BinaryDecoder():
+
+    def __init__(self, xRes, yRes):
+        self.xRes = xRes
+        self.yRes = yRes
+        self.Reset()
+
+    def Reset(self):
+        self.totPix = self.xRes * self.yRes
+        self.pixDone = 0
+        self.done = False
+
+    def Feed(self, data):
+        if self.done:
+            return np.zeros(0, np.uint8), 0
+        b = np.frombuffer(data, np.uint8)[:(self.totPix - self.pixDone + 1) // 2]
+        if (b >> 6).any(): # Not supposed to happen
+            raise DecodeError("Invalid data received at pixel %d" % (self.pixDone + 2*int(np.argmax(b >> 6))))
+        pix = np.empty(2*len(b), np.uint8)
+        pix[0::2] = b & 0x07
+        pix[1::2] = (b >> 3) & 0x07
+        pix = pix[:self.totPix - self.pixDone]
+        self.pixDone += len(pix)
+        self.done = self.pixDone == self.totPix
+        return pix, len(b)
+
+
+HEX_VALUES = np.full(256, 255, np.uint8) # Byte -> hex digit value (255: not a hex digit)
+for i, c in enumerate(b"0123456789ABCDEF"):
+    HEX_VALUES[c] = HEX_VALUES[ord(chr(c).lower())] = i
+
+# Turn hex text (a uint8 array) into the bytes it spells, ignoring anything that isn't a hex digit
+def HexToBytes(b):
+    nib = HEX_VALUES[b]
+    nib = nib[nib != 255]
+    n = len(nib) // 2
+    return (nib[0:2*n:2] << 4) | nib[1:2*n:2]
+
+# Wraps another stream decoder to take its data as hex text.  used counts characters of text, so whatever follows
+# the image is left alone, the same as with the inner decoder.
+class HexDecoder():
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.Reset()
+
+    def Reset(self):
+        self.inner.Reset()
+        self.nibble = None # Odd hex digit left over from the previous chunk
+
+    @property
+    def totPix(self):
+        return self.inner.totPix
+
+    @property
+    def pixDone(self):
+        return self.inner.pixDone
+
+    @property
+    def done(self):
+        return self.inner.done
+
+    def Feed(self, data):
+        b = np.frombuffer(data, np.uint8)
+        pos = np.flatnonzero(HEX_VALUES[b] != 255) # Where the digits are...
+        nib = HEX_VALUES[b[pos]] # ...and what they are
+        if self.nibble is not None:
+            pos = np.concatenate(([-1], pos))
+            nib = np.concatenate(([self.nibble], nib))
+        n = len(nib) // 2
+        pix, used = self.inner.Feed((nib[0:2*n:2] << 4) | nib[1:2*n:2])
+        if self.inner.done:
+            self.nibble = None
+            return pix, int(pos[2*used-1]) + 1 if used else 0 # Up to the second digit of the last byte used
+        self.nibble = nib[-1] if len(nib) % 2 else None
+        return pix, len(b)
+
+
+# The reverse again, for test data (an odd last pixel paired with a 0, as for EncodeCompacted)
+def EncodeBinary(frame):
+    flat = np.asarray(frame, np.uint8).reshape(-1)
+    if flat.size % 2:
+        flat = np.append(flat, np.uint8(0))
+    return ((flat[0::2] & 0x07) | ((flat[1::2] & 0x07) << 3)).tobytes()
+
+# Hex text, lineLen digits to a line, ending each with what the scope sends for a CR/LF
+def EncodeHex(data, lineLen=80, eol=b"\x83\xc4"):
+    text = bytes(data).hex().upper().encode("ascii")
+    return eol.join(text[i:i+lineLen] for i in range(0, len(text), lineLen)) + eol
+
+
+# Format registry: name (as on the scope's Hardcopy menu) -> (decoder class or factory taking (xRes, yRes), encoder,
+# detector).  A detector is given up to DETECT_BYTES from the start of the data and says whether it's in its format.
+# DetectFormat tries them in order, and whatever none of them claims is taken to be binary compacted -- the format
+# to use, and so the one that costs nothing to pick.  It's also the only one known for sure to be what the scope
+# sends, so the Binary detector only claims what fails to decode as compacted, and the BinHex ones only what decodes
+# once the hex is undone.  The start of a Binary dump may well decode as compacted, so a capture that turns out not
+# to be should be looked at again, with all the data there is (or the format given explicitly).
+FORMATS = collections.OrderedDict()
+DEFAULT_FORMAT = "Binary Compacted"
+DETECT_BYTES = 64
+
+def RegisterFormat(name, decoder, encoder=None, detect=None):
+    FORMATS[name] = (decoder, encoder, detect)
+
+# Which format data is in, going by the first n bytes of it
+def DetectFormat(data, n=DETECT_BYTES):
+    b = np.frombuffer(data, np.uint8)[:n]
+    for name, (decoder, encoder, detect) in FORMATS.items():
+        if detect is not None and detect(b):
+            return name
+    return DEFAULT_FORMAT
+
+# Stream decoder for the named format
+def MakeDecoder(fmt, xRes, yRes):
+    return FORMATS[fmt][0](xRes, yRes)
+
+# Decode a complete dump in any format (detected if not given) to a yRes x xRes array of pixel values
+def Decode(data, xRes, yRes, fmt=None):
+    dec = MakeDecoder(fmt or DetectFormat(data), xRes, yRes)
+    pix, used = dec.Feed(data)
+    if not dec.done:
+        raise DecodeError("Data ended after %d of %d pixels" % (dec.pixDone, dec.totPix))
+    return pix.reshape(yRes, xRes)
+
+def IsHex(b): # Allowing for line ends
+    return len(b) >= 8 and np.count_nonzero(HEX_VALUES[b] != 255) >= len(b) - len(b)//16
+
+# Whether b (the start of a dump) decodes as binary compacted data
+def IsCompacted(b):
+    dec = CompactedDecoder(2048, len(b) + 1) # (Too big to be finished by b -- no token is over 2046 pixels)
+    try:
+        dec.FeedRuns(b)
+    except DecodeError:
+        return False
+    return True
+
+def IsBinary(b): # Every byte a pixel pair, with no repeat bits -- and not something that decodes as compacted
+    return len(b) >= 16 and not (b >> 6).any() and not IsCompacted(b)
+
+RegisterFormat("BinHex", lambda xRes, yRes: HexDecoder(BinaryDecoder(xRes, yRes)),
+    lambda frame: EncodeHex(EncodeBinary(frame)), lambda b: IsHex(b) and IsBinary(HexToBytes(b)))
+RegisterFormat("BinHex Compacted", lambda xRes, yRes: HexDecoder(CompactedDecoder(xRes, yRes)),
+    lambda frame: EncodeHex(EncodeCompacted(frame)), lambda b: IsHex(b) and IsCompacted(HexToBytes(b)))
+RegisterFormat("Binary", BinaryDecoder, EncodeBinary, IsBinary)
+RegisterFormat("Binary Compacted", CompactedDecoder, EncodeCompacted)
+
+
+# A hardcopy starts with a banner line naming the scope, the X and Y resolutions on lines of their own and then a
+# null, after which the image data follows immediately:
+#
+#   DIGITIZING SAMPLING OSCILLOSCOPE\r\n552\r\n704\r\n\0<data...>
+#
+# HeaderParser picks that out of whatever chunks of input it's fed, scanning each one for line ends in bulk rather
+# than a byte at a time, and stops on the null so the rest of the chunk can go straight to the image decoder.
+# Anything that doesn't fit the pattern sends it back to looking for a banner.
+HEADER_BANNERS = (b"CSA803", b"DIGITIZING SAMPLING OSCILLOSCOPE")
+MAX_HEADER_LINE = 100 # Longer lines can't be header lines, so only this much of one is kept
+
+class HeaderParser():
+
+    def __init__(self, banners=HEADER_BANNERS):
+        self.banners = tuple(banners)
+        self.Reset()
+
+    def Reset(self):
+        self.line = bytearray() # Partial line carried over from the last chunk
+        self.expect = "banner" # Then "xRes", "yRes" and "null"
+        self.xRes = self.yRes = 0
+        self.done = False
+
+    # Scan a chunk of input (anything that supports the buffer protocol).  Returns how many bytes of it were used --
+    # all of them unless the header finished part way through, in which case the rest is image data.
+    def Feed(self, data):
+        data = bytes(data)
+        pos = 0
+        while pos < len(data) and not self.done:
+            if self.expect == "null":
+                if data[pos] == 0:
+                    self.done = True
+                    pos += 1
+                else:
+                    self.expect = "banner" # (And that byte might start one)
+                continue
+
+            end = data.find(b"\n", pos)
+            if end < 0: # Line continues in the next chunk
+                self.line += data[pos:pos+max(0, MAX_HEADER_LINE-len(self.line))]
+                return len(data)
+            self.line += data[pos:pos+max(0, min(end-pos, MAX_HEADER_LINE-len(self.line)))]
+            pos = end + 1
+            line = bytes(self.line)
+            self.line = bytearray()
+            self.Line(line)
+        return pos
+
+    # A whole line (without its line feed) has arrived
+    def Line(self, line):
+        if self.expect == "banner":
+            if line.startswith(self.banners):
+                self.expect = "xRes"
+            return
+        try:
+            n = int(line.strip())
+        except ValueError:
+            n = 0
+        if n < 1 or n > 1000: # That's not right...
+            self.expect = "banner"
+            self.Line(line) # (...but it might be the start of another header)
+        elif self.expect == "xRes":
+            self.xRes = n
+            self.expect = "yRes"
+        else:
+            self.yRes = n
+            self.expect = "null"
@@ -0,0 +1,169 @@
+#----------------------------------------------------------------------------
+# Name:         TekExport.py
+# Abstract:     Write captures (2-D arrays of pixel values plus a palette) to
+#               image files.  Standard library + NumPy only -- no wx, no PIL.
+#
+#               Which rows (or, for a capture that's been turned, columns)
+#               changed from the capture before can go along with it; PNG and
+#               TIFF files note them in a text field.
+#----------------------------------------------------------------------------
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+import numpy as np   # pip install -U numpy
+
+CHANGED_KEY = "Changed since last capture" # (PNG text keyword)
+
+
+# What changed mask (bools that broadcast against the image: a column for rows, a row for columns) says, as text
+# like "rows 0-15, 300-340"
+def ChangedText(changed):
+    kind = "rows" if changed.shape[1] == 1 else "columns"
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], changed.reshape(-1).view(np.int8), [0]))))
+    bands = ["%d" % a if a == b-1 else "%d-%d" % (a, b-1) for a, b in zip(edges[::2], edges[1::2])]
+    return "%s %s" % (kind, ", ".join(bands)) if bands else "nothing"
+
+
+# Palette PNG, at the smallest bit depth that holds every palette entry -- 4 bits per pixel for the scope's 8 levels
+def WritePNG(fileName, pix, palette, changed=None):
+    yRes, xRes = pix.shape
+    depth = 1
+    while (1 << depth) < len(palette):
+        depth *= 2 # PNG only allows 1, 2, 4 or 8
+    perByte = 8 // depth
+
+    # Pack perByte pixels into each byte, leftmost in the high bits
+    padded = np.zeros((yRes, -(-xRes // perByte) * perByte), np.uint8)
+    padded[:, :xRes] = pix
+    packed = np.zeros((yRes, padded.shape[1] // perByte), np.uint8)
+    for i in range(perByte):
+        packed |= padded[:, i::perByte] << (8 - depth*(i+1))
+    raw = np.zeros((yRes, packed.shape[1]+1), np.uint8) # Each scanline is preceded by a filter type byte (0: none)
+    raw[:,1:] = packed
+    pal = np.asarray(palette, np.uint8).reshape(-1)
+
+    def Chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    with open(fileName, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(Chunk(b"IHDR", struct.pack(">IIBBBBB", xRes, yRes, depth, 3, 0, 0, 0)))
+        f.write(Chunk(b"PLTE", pal.tobytes()))
+        if changed is not None:
+            f.write(Chunk(b"tEXt", (CHANGED_KEY + "\0" + ChangedText(changed)).encode("latin-1")))
+        f.write(Chunk(b"IDAT", zlib.compress(raw.tobytes(), 9)))
+        f.write(Chunk(b"IEND", b""))
+
+
+# Palette TIFF, 8 bits per pixel, uncompressed, one strip
+def WriteTIFF(fileName, pix, palette, changed=None):
+    yRes, xRes = pix.shape
+    cmap = np.zeros((3,256), "<u2")
+    pal = np.asarray(palette, np.uint16)
+    cmap[:, :len(pal)] = pal.T * 257 # TIFF color maps are 16 bits per component
+    desc = b"" if changed is None else (CHANGED_KEY + ": " + ChangedText(changed)).encode("ascii") + b"\0"
+
+    entries = [ # (tag, type, count, value) -- type 2 is ASCII, 3 is SHORT, 4 is LONG
+        (256, 4, 1, xRes), # ImageWidth
+        (257, 4, 1, yRes), # ImageLength
+        (258, 3, 1, 8), # BitsPerSample
+        (259, 3, 1, 1), # Compression: none
+        (262, 3, 1, 3), # PhotometricInterpretation: palette
+        (270, 2, len(desc), None), # ImageDescription (filled in below; dropped if there's nothing to say)
+        (273, 4, 1, None), # StripOffsets (filled in below)
+        (277, 3, 1, 1), # SamplesPerPixel
+        (278, 4, 1, yRes), # RowsPerStrip
+        (279, 4, 1, xRes*yRes), # StripByteCounts
+        (320, 3, cmap.size, None)] # ColorMap (filled in below)
+    entries = [e for e in entries if e[0] != 270 or desc]
+
+    ifdSize = 2 + 12*len(entries) + 4
+    cmapOffset = 8 + ifdSize
+    descOffset = cmapOffset + cmap.nbytes
+    dataOffset = descOffset + len(desc)
+    ifd = struct.pack("<H", len(entries))
+    for tag, kind, count, value in entries:
+        if tag == 270:
+            value = descOffset
+        elif tag == 273:
+            value = dataOffset
+        elif tag == 320:
+            value = cmapOffset
+        fmt = "<HHIH2x" if kind == 3 and count == 1 else "<HHII"
+        ifd += struct.pack(fmt, tag, kind, count, value)
+    ifd += struct.pack("<I", 0) # No more IFDs
+
+    with open(fileName, "wb") as f:
+        f.write(struct.pack("<2sHI", b"II", 42, 8))
+        f.write(ifd)
+        f.write(cmap.tobytes())
+        f.write(desc)
+        f.write(np.ascontiguousarray(pix, np.uint8).tobytes())
+
+
+# Raw pixel values; the palette isn't needed (and there's nowhere to note what changed)
+def WriteNPY(fileName, pix, palette=None, changed=None):
+    np.save(fileName, pix)
+
+
+WRITERS = {".png": WritePNG, ".tif": WriteTIFF, ".tiff": WriteTIFF, ".npy": WriteNPY}
+
+
+# Write pix in the format implied by fileName's extension, noting which parts changed from the capture before if
+# changed (see ChangedText()) is given
+def Export(fileName, pix, palette, changed=None):
+    ext = os.path.splitext(fileName)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError("Don't know how to write '%s' files (try %s)" % (ext, ", ".join(sorted(WRITERS))))
+    WRITERS[ext](fileName, pix, palette, changed)
+
+
+# Writes captures in the background so neither the GUI nor the next acquisition waits on encoding.  Submit() never
+# blocks: if maxQueue captures are already waiting the new one is refused.  When each file is done,
+# done(fileName, bytes, seconds, error, xRes, yRes) is called through post (wx.CallAfter in the GUI; None calls it
+# directly on the writer thread), xRes and yRes being the size of the image written.
+class ExportWorker(threading.Thread):
+
+    def __init__(self, done=None, post=None, maxQueue=32):
+        threading.Thread.__init__(self, daemon=True)
+        self.done = done
+        self.post = post
+        self.jobs = queue.Queue(maxQueue)
+
+    # Queue pix (which must not change afterwards -- hand over a copy), and what changed, to be written to fileName.
+    # Returns False if the queue is full.
+    def Submit(self, fileName, pix, palette, changed=None):
+        try:
+            self.jobs.put_nowait((fileName, pix, list(palette), changed))
+        except queue.Full:
+            return False
+        return True
+
+    # Finish what's queued, then exit
+    def Stop(self):
+        self.jobs.put(None)
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            fileName, pix, palette, changed = job
+            t = time.perf_counter()
+            try:
+                Export(fileName, pix, palette, changed)
+                err = None
+                size = os.path.getsize(fileName)
+            except (IOError, ValueError) as e:
+                err = str(e)
+                size = 0
+            t = time.perf_counter() - t
+            (yRes, xRes) = pix.shape
+            if self.done is not None:
+                if self.post is None:
+                    self.done(fileName, size, t, err, xRes, yRes)
+                else:
+                    self.post(self.done, fileName, size, t, err, xRes, yRes)
@@ -0,0 +1,196 @@
+#----------------------------------------------------------------------------
+# Name:         TekFrame.py
+# Abstract:     Indexed framebuffer for screen captures.  The pixel values
+#               (palette indices) are the source of truth; RGB is produced
+#               from them through a lookup table, a band of rows at a time.
+#
+#               The acquisition thread Write()s while the GUI renders: pos is
+#               only moved on once the pixels behind it are in place, so it
+#               serves as a "pixels completed" watermark, and page changes on
+#               every Reset() so a reader can tell a new capture has begun.
+#
+#               Pixels are stored in the order they arrive; a frame that has
+#               to be turned to be seen the right way up (a "vertical"
+#               hardcopy) is shown and saved through a rotated view of them.
+#
+#               Zoomed views are scaled from the RGB a band at a time, by
+#               repeating pixels, so they stay pixel-perfect.
+#
+#               Each row has a hash, and Reset() keeps the hashes of the
+#               capture it throws away, so which rows a capture changed from
+#               the one before can be told without keeping that one.
+#----------------------------------------------------------------------------
+import collections
+import fractions
+import threading
+import numpy as np   # pip install -U numpy
+
+# Default colors for pixel values 0-7
+DEFAULT_PALETTE = [(0,0,0),(77,77,77),(140,140,140),(160,32,240),(255,255,200),(0,255,0),(0,255,255),(255,255,255)]
+
+# A "horizontal" hardcopy comes out taller than it is wide (552x704 on the 11801/CSA803) and is shown as sent.  A
+# "vertical" one is the same picture on its side, so it comes out wider than tall and is turned this many quarter
+# turns counter-clockwise to match.
+VERTICAL_TURNS = 1
+
+# Quarter turns needed to show an xRes x yRes hardcopy the right way up
+def Turns(xRes, yRes):
+    return VERTICAL_TURNS if xRes > yRes else 0
+
+# Which rows changed (as sent; see IndexedFrame.ChangedRows()) turned the same way as the picture: a column of bools
+# if they're still rows, a row of them if they've become columns, so either way it broadcasts against the picture
+def TurnChanged(changed, turns):
+    return np.rot90(changed[:,None], turns)
+
+# Odd 64-bit multipliers for RowHashes(), one per 8 pixels of row
+HASH_KEYS = np.random.default_rng(11801).integers(1, 1<<63, 1024, np.uint64) | np.uint64(1)
+
+# A 64-bit hash of each row of pix: its pixels 8 at a time as 64-bit words, times a different odd number each, summed
+def RowHashes(pix):
+    (h, w) = pix.shape
+    words = -(-w // 8)
+    if w % 8:
+        padded = np.zeros((h, words*8), np.uint8)
+        padded[:, :w] = pix
+        pix = padded
+    return (np.ascontiguousarray(pix).view("<u8") * HASH_KEYS[:words]).sum(axis=1, dtype=np.uint64)
+
+
+class IndexedFrame():
+
+    def __init__(self, xRes, yRes, palette, turns=0):
+        self.xRes = xRes
+        self.yRes = yRes
+        self.turns = turns % 4 # Quarter turns counter-clockwise from how it's sent to how it's shown
+        self.pix = np.zeros((yRes,xRes), np.uint8) # Palette index of every pixel
+        self.rgb = np.zeros((yRes,xRes,3), np.uint8) # What that looks like
+        self.lut = np.zeros((256,3), np.uint8) # Palette index -> RGB
+        self.page = 0 # Bumped by every Reset()
+        self.pos = 0
+        self.prevHashes = None # Row hashes of the last whole capture, for ChangedRows()
+        self.SetPalette(palette)
+        self.Reset()
+
+    # Palette is a sequence of (r,g,b) tuples, entry 0 being the background color
+    def SetPalette(self, palette):
+        self.lut[:len(palette)] = palette
+
+    # Blank the frame and rewind the write position to the top left.  Only the pixel values are touched; whoever
+    # renders notices the new page and re-renders the lot.  The row hashes of what was here are kept for
+    # ChangedRows() if it was a whole capture; one cut short doesn't count as the last capture.
+    def Reset(self):
+        if self.pos == self.pix.size:
+            self.prevHashes = RowHashes(self.pix)
+        self.pos = 0
+        self.pix[:] = 0
+        self.page += 1
+
+    # Append pixel values (a flat array in raster order) at the write position.  Returns the band of rows touched
+    # as (firstRow, lastRow+1).
+    def Write(self, pix):
+        flat = self.pix.reshape(-1)
+        n = min(len(pix), flat.size - self.pos)
+        r0 = self.pos // self.xRes
+        flat[self.pos:self.pos+n] = pix[:n]
+        self.pos += n # (Only now, so readers never see the watermark ahead of the data)
+        r1 = (self.pos + self.xRes - 1) // self.xRes
+        return r0, max(r0, r1)
+
+    # Band of rows written since pixel position since (what the last call returned), as (firstRow, lastRow+1, pos).
+    # The last row may only be partly written, in which case it comes round again next time.
+    def DirtyRows(self, since):
+        pos = self.pos
+        r0 = since // self.xRes
+        r1 = (pos + self.xRes - 1) // self.xRes
+        return r0, max(r0, r1), pos
+
+    # Which of rows r0 to r1-1 differ from the last capture, as an array of bools (None if there wasn't one).  Only
+    # rows that have been written (in full) mean anything.
+    def ChangedRows(self, r0=0, r1=None):
+        if self.prevHashes is None:
+            return None
+        r1 = self.yRes if r1 is None else r1
+        return RowHashes(self.pix[r0:r1]) != self.prevHashes[r0:r1]
+
+    # Map the whole frame to RGB -- one pass no matter how many palette entries changed; returns self.rgb
+    def Render(self):
+        return self.RenderRows(0, self.yRes)
+
+    # Map a band of rows from palette indices to RGB; returns that part of self.rgb
+    def RenderRows(self, r0, r1):
+        np.take(self.lut, self.pix[r0:r1], axis=0, out=self.rgb[r0:r1])
+        return self.rgb[r0:r1]
+
+    # The pixel values the right way up -- a view, not a copy
+    def View(self):
+        return np.rot90(self.pix, self.turns)
+
+    # Likewise the RGB
+    def RGBView(self):
+        return np.rot90(self.rgb, self.turns)
+
+    # (width, height) as shown
+    def ShownSize(self):
+        return (self.yRes, self.xRes) if self.turns % 2 else (self.xRes, self.yRes)
+
+    # Where rows r0 to r1-1 (as sent) end up when shown, as (x, y, width, height)
+    def ShownRect(self, r0, r1):
+        n = r1 - r0
+        return [(0, r0, self.xRes, n), (r0, 0, n, self.xRes),
+                (0, self.yRes-r1, self.xRes, n), (self.yRes-r1, 0, n, self.xRes)][self.turns]
+
+
+# Zoom levels are Fractions, so scaled coordinates come out exact: pixel (or row) i starts at ceil(i*zoom) once
+# scaled.  Scaling repeats each pixel as many times as there are scaled pixels between its start and the next one's
+# (none, for some, zooming out), which is nearest-neighbour at any zoom and lets a band be scaled on its own.
+def ScaledEdges(i0, i1, zoom):
+    i = np.arange(i0, i1+1)
+    return -((-i * zoom.numerator) // zoom.denominator)
+
+# (width, height) once scaled
+def ScaledSize(w, h, zoom):
+    return tuple(int(-((-n * zoom.numerator) // zoom.denominator)) for n in (w, h))
+
+# Scale rgb, the part of a picture whose top left corner is at (x, y), by zoom; returns (scaled, x, y) with x and y
+# scaled too
+def ScaleRect(rgb, x, y, zoom):
+    if zoom == 1:
+        return rgb, x, y
+    if zoom.denominator == 1: # Whole zoom: every pixel the same size
+        z = zoom.numerator
+        return rgb.repeat(z, axis=0).repeat(z, axis=1), x*z, y*z
+    rows = ScaledEdges(y, y+rgb.shape[0], zoom)
+    cols = ScaledEdges(x, x+rgb.shape[1], zoom)
+    return rgb.repeat(np.diff(rows), axis=0).repeat(np.diff(cols), axis=1), int(cols[0]), int(rows[0])
+
+# Biggest zoom, in steps of 1/steps, at which a w x h picture fits in availW x availH (never less than one step)
+def FitZoom(w, h, availW, availH, steps=8):
+    return fractions.Fraction(max(1, min(availW*steps // w, availH*steps // h)), steps)
+
+
+# Frames to decode into, one per geometry, so a capture of the same size (nearly always) reuses the last one's
+# buffers and an unusual one only costs an allocation the first time.  At most maxFrames are kept.
+class FramePool():
+
+    def __init__(self, palette, maxFrames=4):
+        self.palette = list(palette)
+        self.maxFrames = maxFrames
+        self.frames = collections.OrderedDict() # (xRes, yRes) -> IndexedFrame, least recently used first
+        self.lock = threading.Lock() # (Frames are fetched on the serial thread, recolored on the GUI's)
+
+    def Get(self, xRes, yRes):
+        with self.lock:
+            frame = self.frames.pop((xRes, yRes), None)
+            if frame is None:
+                frame = IndexedFrame(xRes, yRes, self.palette, Turns(xRes, yRes))
+                while len(self.frames) >= self.maxFrames:
+                    self.frames.popitem(last=False)
+            self.frames[(xRes, yRes)] = frame
+            return frame
+
+    # Set the palette of every frame in the pool, and of any made later
+    def SetPalette(self, palette):
+        with self.lock:
+            self.palette = list(palette)
+            for frame in self.frames.values():
+                frame.SetPalette(palette)
@@ -0,0 +1,141 @@
+#----------------------------------------------------------------------------
+# Name:         TekHistory.py
+# Abstract:     The last few hundred captures, for stepping back through a
+#               run of hardcopies.  Pixel values only go up to 7, so frames
+#               are kept packed at 3 bits per pixel (about 140 KB for a full
+#               screen, against 1.1 MB as a 24-bit bitmap); once they take
+#               more than the memory allowed, the oldest are spilled to a
+#               TekArchive on disk (as the scope's compacted stream, which is
+#               smaller still) or, if there's nowhere to put them, dropped.
+#               A capture that differs from the last full one kept in only a
+#               few rows is stored as just those rows.
+#----------------------------------------------------------------------------
+import collections
+import time
+import numpy as np   # pip install -U numpy
+
+from TekDecode import EncodeCompacted
+from TekFrame import DEFAULT_PALETTE, RowHashes
+
+BITS = 3 # Per pixel; 8 pixels pack into 3 bytes
+KEY_INTERVAL = 16 # Most captures kept as changed rows against one full capture...
+KEY_CHANGED = 0.5 # ...and most of its rows that may have changed
+
+
+# Pack pixel values (0-7) 8 to every 3 bytes, the first pixel in the low bits
+def PackPixels(pix):
+    flat = np.asarray(pix, np.uint8).reshape(-1)
+    groups = np.zeros((-(-len(flat) // 8), 8), np.uint32)
+    groups.reshape(-1)[:len(flat)] = flat & 0x07
+    word = np.zeros(len(groups), "<u4")
+    for i in range(8):
+        word |= groups[:,i] << (BITS*i)
+    return word.view(np.uint8).reshape(-1,4)[:,:3].tobytes()
+
+# The first n pixel values from PackPixels()'s output
+def UnpackPixels(data, n):
+    raw = np.frombuffer(data, np.uint8).reshape(-1,3)
+    word = np.zeros((len(raw),4), np.uint8)
+    word[:,:3] = raw
+    word = word.view("<u4").reshape(-1)
+    groups = np.empty((len(word),8), np.uint8)
+    for i in range(8):
+        groups[:,i] = (word >> (BITS*i)) & 0x07
+    return groups.reshape(-1)[:n]
+
+
+# A capture as kept in memory.  A full one (a key) has its row hashes and rows=None; otherwise packed is only the
+# rows listed in rows, and the rest are as they are in key.
+HistoryEntry = collections.namedtuple("HistoryEntry", "packed xRes yRes when port palette hashes rows key")
+
+
+# Captures, oldest first, numbered from 0 for as long as the history lasts.  Those still in memory are at the end;
+# the ones before them are in the spill archive (if there is one -- otherwise they're gone, and Get() returns None).
+class FrameHistory():
+
+    def __init__(self, maxBytes=64<<20, spill=None):
+        self.maxBytes = maxBytes
+        self.entries = collections.deque() # HistoryEntry for each capture still in memory
+        self.key = None # The newest full one...
+        self.sinceKey = 0 # ...and how many have been kept against it
+        self.bytes = 0 # What they take up
+        self.first = 0 # Number of the oldest of them
+        self.spill = None # TekArchive to spill to...
+        self.spillFrom = 0 # ...from this capture on...
+        self.spilled = [] # ...where each of them went in it (other histories may be spilling to the same one)
+        self.SetSpill(spill)
+
+    def __len__(self):
+        return self.first + len(self.entries)
+
+    # Spill old captures to the TekArchive spill (None: drop them) from now on.  Anything already gone stays gone.
+    def SetSpill(self, spill):
+        self.spill = spill
+        self.spillFrom = self.first
+        self.spilled = []
+
+    # Add a capture (pixel values as sent, yRes x xRes); returns its number
+    def Add(self, pix, port="", palette=None, when=None):
+        (yRes, xRes) = pix.shape
+        hashes = RowHashes(pix)
+        key = self.key
+        rows = None
+        if key is not None and (key.xRes, key.yRes) == (xRes, yRes) and self.sinceKey < KEY_INTERVAL:
+            rows = np.flatnonzero(hashes != key.hashes)
+            if len(rows) > KEY_CHANGED * yRes:
+                rows = None
+        when = time.time() if when is None else when
+        palette = None if palette is None else [tuple(c) for c in palette]
+        if rows is None:
+            entry = self.key = HistoryEntry(PackPixels(pix), xRes, yRes, when, port, palette, hashes, None, None)
+            self.sinceKey = 0
+        else:
+            entry = HistoryEntry(PackPixels(pix[rows]), xRes, yRes, when, port, palette, None, rows.astype(np.uint16), key)
+            self.sinceKey += 1
+        self.entries.append(entry)
+        self.bytes += self.Size(entry)
+        while self.bytes > self.maxBytes and self.entries[0] is not self.key: # (The newest key's lot always stay)
+            self.Evict()
+        return len(self) - 1
+
+    @staticmethod
+    def Size(entry):
+        return len(entry.packed) + (entry.hashes.nbytes if entry.rows is None else entry.rows.nbytes)
+
+    # Move the oldest full capture in memory, and those kept against it, out to the spill archive, or drop them
+    def Evict(self):
+        key = self.entries[0]
+        while self.entries and (self.entries[0] is key or self.entries[0].key is key):
+            entry = self.entries[0]
+            if self.spill is not None:
+                pix = self.Pixels(entry)
+                self.spilled.append(self.spill.Append(EncodeCompacted(pix.reshape(-1)), entry.xRes, entry.yRes, entry.port,
+                    entry.palette or DEFAULT_PALETTE, entry.when))
+            self.entries.popleft()
+            self.bytes -= self.Size(entry)
+            self.first += 1
+        if key is self.key:
+            self.key = None
+
+    # An entry's pixel values (yRes x xRes)
+    @staticmethod
+    def Pixels(entry):
+        if entry.rows is None:
+            return UnpackPixels(entry.packed, entry.xRes * entry.yRes).reshape(entry.yRes, entry.xRes)
+        pix = FrameHistory.Pixels(entry.key) # (A fresh array each time, so it can be written over)
+        pix[entry.rows] = UnpackPixels(entry.packed, len(entry.rows) * entry.xRes).reshape(-1, entry.xRes)
+        return pix
+
+    # Oldest capture that can still be had
+    def Oldest(self):
+        return self.spillFrom if self.spill is not None else self.first
+
+    # Capture i as (pixel values as sent, when), or None if it's been dropped
+    def Get(self, i):
+        if i >= self.first:
+            entry = self.entries[i - self.first]
+            return self.Pixels(entry), entry.when
+        if self.spill is None or i < self.spillFrom:
+            return None
+        n = self.spilled[i - self.spillFrom]
+        return self.spill.Frame(n), float(self.spill.Index()[n]["time"])
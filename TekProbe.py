@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#----------------------------------------------------------------------------
+# Name:         TekProbe.py
+# Abstract:     Find scopes: list the serial ports that actually exist and ask
+#               each one, at each likely baud rate, whether there's a
+#               Tektronix scope on the end.  Ports are tried all at once (a
+#               thread each), so a probe takes about as long as one port does.
+#
+#               python TekProbe.py              (probe every port)
+#               python TekProbe.py /dev/ttyUSB0 (just that one)
+#----------------------------------------------------------------------------
+import concurrent.futures
+import serial        # pip install -U pySerial
+import serial.tools.list_ports
+
+from TekDecode import HEADER_BANNERS
+
+PROBE_BAUDS = (38400, 19200, 9600, 4800, 2400, 1200) # Fastest first, so that's what's found if more than one works
+QUERY = b"ID?\n" # The scope answers "ID TEK/11801,..." (or whichever model it is)
+IDENT = b"TEK/"
+
+
+# Names of the serial ports this machine has
+def ListPorts():
+    return sorted(p.device for p in serial.tools.list_ports.comports())
+
+
+# Try one port at each baud rate in turn; returns (port, baud, reply) for the first one a scope answers on, or None.
+# A hardcopy that happens to be coming in counts as an answer too.
+def ProbePort(port, bauds=PROBE_BAUDS, timeout=0.4):
+    for baud in bauds:
+        try:
+            with serial.Serial(port, baud, rtscts=1, timeout=timeout, write_timeout=timeout) as serI:
+                serI.reset_input_buffer()
+                serI.write(QUERY)
+                reply = serI.read_until(b"\n", 200)
+        except serial.SerialTimeoutException: # Nothing's taking what we send (no CTS) at this rate
+            continue
+        except (serial.SerialException, OSError, ValueError): # Port can't be used at all
+            return None
+        if IDENT in reply or any(banner in reply for banner in HEADER_BANNERS):
+            return (port, baud, reply.strip().decode("ascii", "replace"))
+    return None
+
+
+# Probe ports (all of them if not given) concurrently; returns a (port, baud, reply) for each one a scope answered on
+def Probe(ports=None, bauds=PROBE_BAUDS, timeout=0.4):
+    ports = ListPorts() if ports is None else list(ports)
+    if not ports:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(ports)) as pool:
+        results = list(pool.map(lambda port: ProbePort(port, bauds, timeout), ports))
+    return [res for res in results if res is not None]
+
+
+def Main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Look for Tektronix scopes on this machine's serial ports.")
+    parser.add_argument("ports", nargs="*", help="ports to try (default: all of them)")
+    args = parser.parse_args()
+
+    found = Probe(args.ports or None)
+    for port, baud, reply in found:
+        print("%s  %d baud  %s" % (port, baud, reply))
+    return 0 if found else 1
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(Main())
@@ -0,0 +1,120 @@
+#----------------------------------------------------------------------------
+# Name:         TekReplay.py
+# Abstract:     Record raw serial sessions to disk and play them back through
+#               a pseudo-terminal, so the acquisition code can be exercised
+#               (and profiled) without a scope attached.
+#----------------------------------------------------------------------------
+import os
+import struct
+import threading
+import time
+import serial        # pip install -U pySerial
+
+# A session file is MAGIC followed by one record per serial read: REC_HDR (seconds since recording started, byte
+# count) and then the bytes themselves.
+MAGIC = b"TSCREC1\n"
+REC_HDR = struct.Struct("<dI")
+
+
+class SessionWriter():
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.f = open(fileName, "wb")
+        self.f.write(MAGIC)
+        self.t0 = time.monotonic()
+
+    def Write(self, data):
+        if len(data):
+            self.f.write(REC_HDR.pack(time.monotonic()-self.t0, len(data)))
+            self.f.write(data)
+
+    def Close(self):
+        self.f.close()
+
+
+# Read back a session file, yielding (time, data) for each record
+def ReadSession(fileName):
+    with open(fileName, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("'%s' isn't a TSC session recording" % fileName)
+        while True:
+            hdr = f.read(REC_HDR.size)
+            if len(hdr) < REC_HDR.size:
+                return
+            t, n = REC_HDR.unpack(hdr)
+            yield t, f.read(n)
+
+
+# serial.Serial that tees everything it reads to a new, timestamped session file in recordDir each time the port is
+# opened.  read() is what readinto(), readline() and friends all end up calling, so this catches every byte.
+class RecordingSerial(serial.Serial):
+
+    def __init__(self, recordDir, *args, **kwargs):
+        self.recordDir = recordDir
+        self.session = None
+        serial.Serial.__init__(self, *args, **kwargs)
+
+    def open(self):
+        serial.Serial.open(self)
+        name = "TSC-%s-%s.rec" % (time.strftime("%Y%m%d-%H%M%S"), os.path.basename(str(self.port)))
+        self.session = SessionWriter(os.path.join(self.recordDir, name))
+
+    def close(self):
+        serial.Serial.close(self)
+        if self.session is not None:
+            self.session.Close()
+            self.session = None
+
+    def read(self, size=1):
+        data = serial.Serial.read(self, size)
+        if self.session is not None:
+            self.session.Write(data)
+        return data
+
+
+# Plays a session file into the master side of a pseudo-terminal; open self.port (the slave side) like any other
+# serial port.  Playback starts delay seconds after Start() to give the reader time to open the port and flush it,
+# then either follows the recorded timing or (realtime=False) sends everything as fast as the reader takes it.  If
+# baud is given, bytes are also paced to what an 8-N-1 line at that rate could carry.  POSIX only.
+class ReplayPty(threading.Thread):
+
+    def __init__(self, fileName, realtime=True, delay=1.0, baud=None):
+        threading.Thread.__init__(self, daemon=True)
+        import pty, tty
+        self.fileName = fileName
+        self.realtime = realtime
+        self.delay = delay
+        self.baud = baud
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave) # No line discipline games before the reader sets the port up
+        self.port = os.ttyname(self.slave)
+        self.bytesSent = 0
+        self.startTime = None # When the first byte went out
+        self.finished = threading.Event()
+
+    def Start(self):
+        self.start()
+
+    def run(self):
+        time.sleep(self.delay)
+        self.startTime = t0 = due = time.monotonic()
+        step = max(1, self.baud // 1000) if self.baud else None # ~10ms worth of characters at a time
+        for t, data in ReadSession(self.fileName):
+            if self.realtime:
+                due = max(due, t0 + t)
+            mv = memoryview(data)
+            while len(mv):
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                n = os.write(self.master, mv[:step])
+                mv = mv[n:]
+                self.bytesSent += n
+                if self.baud:
+                    due += n * 10.0 / self.baud # Start + 8 data + stop bits
+        self.finished.set()
+
+    def Close(self):
+        os.close(self.master)
+        os.close(self.slave)
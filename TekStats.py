@@ -0,0 +1,93 @@
+#----------------------------------------------------------------------------
+# Name:         TekStats.py
+# Abstract:     Per-capture timing, so a slow capture can be pinned on the
+#               line, the decoder or the GUI.  SerIface fills in the serial
+#               side, the GUI adds what rendering and painting cost, and the
+#               result goes out as one JSON object per line.
+#----------------------------------------------------------------------------
+import collections
+import json
+import time
+
+
+class CaptureStats():
+
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        self.time = time.time() # When collection started (the end of the previous capture)
+        self.states = collections.defaultdict(float) # SerIface state name -> seconds spent in it
+        self.bytes = 0 # Image data received...
+        self.firstByte = None # ...between these times (perf_counter)
+        self.lastByte = None
+        self.pixels = 0
+        self.decodeSeconds = 0.0 # Time in the decoder...
+        self.writeSeconds = 0.0 # ...and writing its output to the frame
+        self.batches = 0
+        self.highWater = 0 # Most bytes waiting in the input buffer at once
+        self.maxBacklog = 0 # Most calls waiting to be run on the GUI's thread at once
+        self.render = [] # Seconds for each band of rows rendered
+        self.paint = [] # Seconds from each band being rendered to it being painted
+        self.rows = 0 # Rows in the capture...
+        self.rowsChanged = None # ...and how many differ from the last one (None: there wasn't one)
+
+    def AddState(self, name, seconds):
+        self.states[name] += seconds
+
+    # n bytes of image data have arrived
+    def AddBytes(self, n):
+        now = time.perf_counter()
+        if self.firstByte is None:
+            self.firstByte = now
+        self.lastByte = now
+        self.bytes += int(n) # (Decoders may count in NumPy integers)
+
+    # Everything as a dict of plain values (rates are per second; seconds are seconds).  Counts go through int(), in
+    # case a NumPy integer found its way into one.
+    def AsDict(self):
+        wire = (self.lastByte - self.firstByte) if self.bytes else 0.0
+        d = {"time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.time)),
+             "states": dict(self.states),
+             "bytes": self.bytes,
+             "pixels": int(self.pixels),
+             "wireSeconds": wire,
+             "wireBytesPerSec": self.bytes / wire if wire > 0 else None,
+             "decodeSeconds": self.decodeSeconds,
+             "decodePixelsPerSec": self.pixels / self.decodeSeconds if self.decodeSeconds > 0 else None,
+             "writeSeconds": self.writeSeconds,
+             "batches": int(self.batches),
+             "bufferHighWater": int(self.highWater),
+             "guiBacklogMax": int(self.maxBacklog),
+             "rows": int(self.rows),
+             "rowsChanged": None if self.rowsChanged is None else int(self.rowsChanged),
+             "percentChanged": self.PercentChanged()}
+        for name, times in (("render", self.render), ("paint", self.paint)):
+            d[name] = {"count": len(times), "totalSeconds": sum(times),
+                       "meanSeconds": sum(times) / len(times) if times else None,
+                       "maxSeconds": max(times) if times else None}
+        return d
+
+    def PercentChanged(self):
+        return None if self.rowsChanged is None or not self.rows else 100.0 * self.rowsChanged / self.rows
+
+    def ToJSON(self, **extra):
+        d = self.AsDict()
+        d.update(extra)
+        return json.dumps(d)
+
+    # A few lines for the stats panel
+    def Summary(self):
+        d = self.AsDict()
+        lines = ["Line: %s bytes/s  Decode: %s pixels/s" % (
+                    "%.0f" % d["wireBytesPerSec"] if d["wireBytesPerSec"] else "?",
+                    "%.3gM" % (d["decodePixelsPerSec"] / 1e6) if d["decodePixelsPerSec"] else "?"),
+                 "Input buffer peak: %d bytes  GUI backlog peak: %d calls" % (self.highWater, self.maxBacklog)]
+        if self.rowsChanged is not None:
+            lines.append("Changed: %d of %d rows (%.1f%%)" % (self.rowsChanged, self.rows, self.PercentChanged()))
+        if self.render:
+            line = "Render: %d x %.2f ms" % (len(self.render), d["render"]["meanSeconds"] * 1000)
+            if self.paint:
+                line += "  Paint latency: %.0f ms (max %.0f)" % (d["paint"]["meanSeconds"] * 1000, d["paint"]["maxSeconds"] * 1000)
+            lines.append(line)
+        return "\n".join(lines)
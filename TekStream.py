@@ -0,0 +1,480 @@
+#!/usr/bin/env python
+#----------------------------------------------------------------------------
+# Name:         TekStream.py
+# Abstract:     Let other people watch captures come in: a small HTTP server
+#               with a viewer page, sending each capture over a WebSocket as
+#               it's decoded.  Completed bands of rows go out as 4-bit pixel
+#               values, deflated; the palette only when it changes.  Every
+#               message is encoded (and framed) once, whoever it's going to,
+#               and kept for the rest of the capture so anyone joining late
+#               gets the same messages to catch up with.  The serial thread
+#               only ever queues rows; a viewer that falls too far behind
+#               skips ahead to where things are now.  Standard library and
+#               NumPy only.
+#
+#               python TekStream.py localhost:8803 -o "seen-{n:03d}.png"
+#               (a viewer that saves what it's sent, for testing)
+#----------------------------------------------------------------------------
+import base64
+import collections
+import hashlib
+import http.server
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import urllib.parse
+import zlib
+import numpy as np   # pip install -U numpy
+
+from TekFrame import DEFAULT_PALETTE
+
+DEFAULT_PORT = 8803
+BAND_ROWS = 16 # Rows go out once this many more are complete (and at the end of a capture)
+MAX_QUEUE = 2<<20 # Bytes a viewer can fall behind by before it's started again from where things are now
+PING_SECONDS = 15 # A quiet connection is pinged this often, so dead ones are noticed
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC11B85"
+ROWS_HDR = struct.Struct("<HH") # First row and row count, ahead of each band's pixel values
+
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+
+
+# A complete, unmasked WebSocket frame (as a server sends them)
+def WSFrame(payload, opcode=OP_BINARY):
+    n = len(payload)
+    if n < 126:
+        hdr = struct.pack(">BB", 0x80 | opcode, n)
+    elif n < 1<<16:
+        hdr = struct.pack(">BBH", 0x80 | opcode, 126, n)
+    else:
+        hdr = struct.pack(">BBQ", 0x80 | opcode, 127, n)
+    return hdr + payload
+
+def JSONFrame(**msg):
+    return WSFrame(json.dumps(msg).encode("utf-8"), OP_TEXT)
+
+
+# Pixel values (0-15) two to a byte, the first in the high bits, then deflated.  Rows are an even number of pixels
+# wide on every scope there is, but an odd one would work too.
+def PackRows(pix):
+    flat = np.asarray(pix, np.uint8).reshape(-1)
+    if len(flat) % 2:
+        flat = np.append(flat, np.uint8(0))
+    return zlib.compress(((flat[0::2] << 4) | (flat[1::2] & 0x0f)).tobytes(), 1)
+
+# n pixel values from PackRows()'s output
+def UnpackRows(data, n):
+    packed = np.frombuffer(zlib.decompress(data), np.uint8)
+    flat = np.empty(len(packed)*2, np.uint8)
+    flat[0::2] = packed >> 4
+    flat[1::2] = packed & 0x0f
+    return flat[:n]
+
+
+# One scope's captures.  Begin(), Rows(), End(), Abort() and SetPalette() can be called from any thread and never wait --
+# they just queue the pixels for the server's broadcast thread, which does the rest.
+class StreamChannel():
+
+    def __init__(self, server, name, palette=DEFAULT_PALETTE):
+        self.server = server
+        self.name = name
+        self.sent = 0 # Rows of the capture in progress queued so far (only used by the thread calling Rows())
+        self.viewers = set() # Viewer for each connection watching this channel...
+        self.paletteMsg = None # ...what they're all sent first...
+        self.pageMsgs = [] # ...and every message so far for the capture in progress, or the last one
+        self.SetPalette(palette)
+
+    def SetPalette(self, palette):
+        self.server.incoming.put((self, "palette", [list(map(int, c)) for c in palette]))
+
+    # A new capture is starting in frame
+    def Begin(self, frame):
+        self.sent = 0
+        self.server.incoming.put((self, "begin", dict(xRes=frame.xRes, yRes=frame.yRes, turns=frame.turns, page=frame.page)))
+
+    # More of frame has been written; rows that are complete go out in bands of BAND_ROWS or more
+    def Rows(self, frame, final=False):
+        done = frame.pos // frame.xRes
+        if done - self.sent >= (1 if final else BAND_ROWS):
+            self.server.incoming.put((self, "rows", (self.sent, frame.pix[self.sent:done].copy())))
+            self.sent = done
+
+    # The capture in frame is finished
+    def End(self, frame):
+        self.Rows(frame, True)
+        self.server.incoming.put((self, "end", None))
+
+    # The capture in progress has been cut short, and that's all there'll be of it
+    def Abort(self):
+        self.server.incoming.put((self, "abort", None))
+
+    # What a viewer that's just joined (or fallen behind) needs to be sent (call with the server's lock held)
+    def Snapshot(self):
+        return ([] if self.paletteMsg is None else [self.paletteMsg]) + self.pageMsgs
+
+
+# A connection that's watching a channel.  Messages are queued by the broadcast thread and sent by the
+# connection's own thread, so a slow network only ever holds up that one viewer.
+class Viewer():
+
+    def __init__(self, sock, channel):
+        self.sock = sock
+        self.channel = channel
+        self.msgs = collections.deque() # Frames waiting to be sent...
+        self.bytes = 0 # ...and how big they are
+        self.cond = threading.Condition()
+        self.closed = False
+        self.restarts = 0 # How many times it's fallen behind
+
+    # Queue msg (on the broadcast thread, with the server's lock held).  If that puts the viewer too far behind, it's
+    # given the channel's snapshot instead -- which already has msg in it.
+    def Queue(self, msg):
+        with self.cond:
+            if self.bytes + len(msg) > MAX_QUEUE:
+                self.msgs.clear()
+                self.bytes = 0
+                self.restarts += 1
+                for m in self.channel.Snapshot():
+                    self.msgs.append(m)
+                    self.bytes += len(m)
+            else:
+                self.msgs.append(msg)
+                self.bytes += len(msg)
+            self.cond.notify()
+
+    def Close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    # Send what's queued until the connection closes (on the connection's thread)
+    def Run(self):
+        while True:
+            with self.cond:
+                if not self.msgs and not self.closed:
+                    self.cond.wait(PING_SECONDS)
+                if self.closed:
+                    return
+                if self.msgs:
+                    msg = self.msgs.popleft()
+                    self.bytes -= len(msg)
+                else:
+                    msg = WSFrame(b"", OP_PING)
+            try:
+                self.sock.sendall(msg)
+            except OSError:
+                return
+
+    # Read from the viewer until it goes away or asks to (on a thread of its own) -- nothing it sends matters
+    def Listen(self):
+        try:
+            while True:
+                data = self.sock.recv(4096)
+                if not data or data[0] & 0x0f == OP_CLOSE: # (Viewers only send tiny frames, so this is a frame start)
+                    break
+        except OSError:
+            pass
+        self.Close()
+
+
+class StreamHandler(http.server.BaseHTTPRequestHandler):
+
+    server_version = "TSC/1"
+    protocol_version = "HTTP/1.1" # (Browsers want it for the WebSocket handshake)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        stream = self.server.stream
+        if url.path == "/":
+            self.Reply(200, "text/html; charset=utf-8", VIEWER_HTML.encode("utf-8"))
+        elif url.path == "/channels":
+            with stream.lock:
+                names = [ch.name for ch in stream.channels]
+            self.Reply(200, "application/json", json.dumps(names).encode("utf-8"))
+        elif url.path == "/ws":
+            name = urllib.parse.parse_qs(url.query).get("ch", [None])[0]
+            channel = stream.FindChannel(name)
+            key = self.headers.get("Sec-WebSocket-Key")
+            if "websocket" not in self.headers.get("Upgrade", "").lower() or not key:
+                self.Reply(400, "text/plain", b"WebSocket connections only\n")
+            elif channel is None:
+                self.Reply(404, "text/plain", b"No such channel\n")
+            else:
+                self.Watch(channel, key)
+        else:
+            self.Reply(404, "text/plain", b"Not found\n")
+
+    def Reply(self, code, contentType, body):
+        self.send_response(code)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Hand the connection over to the WebSocket and send it the channel until it closes
+    def Watch(self, channel, key):
+        accept = base64.b64encode(hashlib.sha1(key.strip().encode("ascii") + WS_GUID).digest()).decode("ascii")
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.connection.settimeout(None)
+        viewer = Viewer(self.connection, channel)
+        stream = self.server.stream
+        with stream.lock:
+            for msg in channel.Snapshot():
+                viewer.Queue(msg)
+            channel.viewers.add(viewer)
+        threading.Thread(target=viewer.Listen, daemon=True).start()
+        try:
+            viewer.Run()
+        finally:
+            with stream.lock:
+                channel.viewers.discard(viewer)
+            self.close_connection = True
+
+    def log_message(self, format, *args): # (Not every page fetch in the log)
+        pass
+
+
+# The server: an HTTP thread (plus one per connection) and the broadcast thread.  port 0 picks a free one.
+class StreamServer():
+
+    def __init__(self, port=DEFAULT_PORT, host=""):
+        self.lock = threading.Lock() # Guards the channels, their viewers and their messages
+        self.channels = []
+        self.incoming = queue.SimpleQueue() # (channel, kind, data) from whoever's capturing; None to stop
+        self.httpd = http.server.ThreadingHTTPServer((host, port), StreamHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stream = self
+        self.port = self.httpd.server_address[1]
+        self.threads = []
+
+    def Start(self):
+        self.threads = [threading.Thread(target=self.httpd.serve_forever, daemon=True),
+                        threading.Thread(target=self.Broadcast, daemon=True)]
+        for t in self.threads:
+            t.start()
+
+    def Stop(self):
+        self.incoming.put(None)
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        with self.lock:
+            for channel in self.channels:
+                for viewer in channel.viewers:
+                    viewer.Close()
+
+    # Address to give people (this machine's name if it's listening on every interface)
+    def URL(self):
+        host = self.httpd.server_address[0]
+        return "http://%s:%d/" % (socket.gethostname() if host in ("", "0.0.0.0") else host, self.port)
+
+    def Channel(self, name, palette=DEFAULT_PALETTE):
+        channel = StreamChannel(self, name, palette)
+        with self.lock:
+            self.channels.append(channel)
+        return channel
+
+    def RemoveChannel(self, channel):
+        with self.lock:
+            self.channels.remove(channel)
+            for viewer in channel.viewers:
+                viewer.Close()
+
+    # Channel called name, or the first if name is None
+    def FindChannel(self, name):
+        with self.lock:
+            for channel in self.channels:
+                if name is None or channel.name == name:
+                    return channel
+        return None
+
+    # Encode what's queued, once, and queue it for everyone watching (the broadcast thread)
+    def Broadcast(self):
+        while True:
+            item = self.incoming.get()
+            if item is None:
+                return
+            (channel, kind, data) = item
+            if kind == "rows":
+                (r0, rows) = data
+                msg = WSFrame(ROWS_HDR.pack(r0, len(rows)) + PackRows(rows))
+            elif kind == "palette":
+                msg = JSONFrame(type="palette", colors=data)
+            else:
+                msg = JSONFrame(type=kind, **(data or {}))
+            with self.lock:
+                if kind == "palette":
+                    channel.paletteMsg = msg
+                elif kind == "begin":
+                    channel.pageMsgs = [msg]
+                else:
+                    channel.pageMsgs.append(msg)
+                for viewer in channel.viewers:
+                    viewer.Queue(msg)
+
+
+# "[HOST:]PORT" as (host, port); no host means every interface
+def ParseAddress(text, host=""):
+    if ":" in text:
+        (host, text) = text.rsplit(":", 1)
+    return (host, int(text))
+
+
+# Watch a channel from Python: connects to host:port and calls done(pix, palette) with the pixel values (as sent)
+# of each capture that finishes.  Mostly for testing.  Returns when the server closes the connection.
+def Watch(host, port, done, channel=None):
+    sock = socket.create_connection((host, port))
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    sock.sendall(("GET /ws%s HTTP/1.1\r\nHost: %s:%d\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+        "Sec-WebSocket-Key: %s\r\nSec-WebSocket-Version: 13\r\n\r\n" % (
+        "?ch=" + urllib.parse.quote(channel) if channel else "", host, port, key)).encode("ascii"))
+    f = sock.makefile("rb")
+    status = f.readline()
+    if b" 101 " not in status:
+        raise IOError("Server said: %s" % status.decode("latin-1").strip())
+    while f.readline() not in (b"\r\n", b""):
+        pass
+
+    palette = DEFAULT_PALETTE
+    pix = None
+    while True:
+        hdr = f.read(2)
+        if len(hdr) < 2:
+            return
+        opcode = hdr[0] & 0x0f
+        n = hdr[1] & 0x7f
+        if n == 126:
+            n = struct.unpack(">H", f.read(2))[0]
+        elif n == 127:
+            n = struct.unpack(">Q", f.read(8))[0]
+        payload = f.read(n)
+        if opcode == OP_CLOSE:
+            return
+        if opcode == OP_TEXT:
+            msg = json.loads(payload)
+            if msg["type"] == "palette":
+                palette = [tuple(c) for c in msg["colors"]]
+            elif msg["type"] == "begin":
+                pix = np.zeros((msg["yRes"], msg["xRes"]), np.uint8)
+            elif msg["type"] == "end" and pix is not None:
+                done(pix, palette)
+            elif msg["type"] == "abort":
+                pix = None
+        elif opcode == OP_BINARY and pix is not None:
+            (r0, rows) = ROWS_HDR.unpack_from(payload)
+            pix[r0:r0+rows] = UnpackRows(payload[ROWS_HDR.size:], rows * pix.shape[1]).reshape(rows, -1)
+
+
+def Main():
+    import argparse
+    from TekExport import Export
+    from TekFrame import Turns
+    parser = argparse.ArgumentParser(description="Watch a TSC capture stream and save what's sent.")
+    parser.add_argument("server", help="HOST:PORT of the TSC that's serving")
+    parser.add_argument("-c", "--channel", help="scope to watch (default: the first)")
+    parser.add_argument("-o", "--output", metavar="TEMPLATE", default="seen-{n:03d}.png",
+        help="file name template for each capture; {n} is its number (default: %(default)s)")
+    args = parser.parse_args()
+
+    (host, port) = ParseAddress(args.server) if ":" in args.server else (args.server, DEFAULT_PORT)
+    count = [0]
+    def Done(pix, palette):
+        count[0] += 1
+        fileName = args.output.format(n=count[0])
+        Export(fileName, np.rot90(pix, Turns(pix.shape[1], pix.shape[0])), palette)
+        print(fileName)
+        sys.stdout.flush()
+    try:
+        Watch(host, port, Done, args.channel)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+# The page viewers get.  Messages are handled strictly in order, bands being inflated as they arrive.
+VIEWER_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Tek Screen Capture</title>
+<style>body{background:#222;color:#ccc;font-family:sans-serif}canvas{image-rendering:pixelated;display:block;margin-top:8px}</style>
+</head><body>
+<div><span id="chans"></span> <span id="status">Connecting...</span></div>
+<canvas id="cap"></canvas>
+<script>
+var canvas = document.getElementById("cap"), ctx = canvas.getContext("2d"), status = document.getElementById("status");
+var ch = new URLSearchParams(location.search).get("ch");
+var palette = [], cap = null, img = null, vals = null, rowsDone = 0, chain = Promise.resolve();
+fetch("/channels").then(r => r.json()).then(names => {
+  document.getElementById("chans").innerHTML = names.map(n =>
+    "<a href='?ch=" + encodeURIComponent(n) + "'>" + n.replace(/</g, "&lt;") + "</a>").join(" | ");
+});
+function Inflate(data) {
+  return new Response(new Blob([data]).stream().pipeThrough(new DecompressionStream("deflate"))).arrayBuffer();
+}
+// Where pixel (r, c) as sent ends up once turned counter-clockwise the right number of quarter turns
+function Place(r, c) {
+  var w = cap.xRes, h = cap.yRes;
+  switch (cap.turns) {
+    case 1: return (w-1-c) * h + r;
+    case 2: return (h-1-r) * w + (w-1-c);
+    case 3: return c * h + (h-1-r);
+    default: return r * w + c;
+  }
+}
+// Color rows r0 to r1-1 (as sent) from their pixel values, through the current palette
+function Paint(r0, r1) {
+  var px = img.data;
+  for (var r = r0, i = r0 * cap.xRes; r < r1; r++)
+    for (var c = 0; c < cap.xRes; c++, i++) {
+      var col = palette[vals[i]] || [0,0,0], o = Place(r, c) * 4;
+      px[o] = col[0]; px[o+1] = col[1]; px[o+2] = col[2]; px[o+3] = 255;
+    }
+  ctx.putImageData(img, 0, 0);
+}
+function Rows(buf) {
+  var hdr = new DataView(buf), r0 = hdr.getUint16(0, true), n = hdr.getUint16(2, true);
+  return Inflate(buf.slice(4)).then(packed => {
+    var p = new Uint8Array(packed), i0 = r0 * cap.xRes, count = n * cap.xRes;
+    for (var i = 0; i < count; i++)
+      vals[i0 + i] = (i & 1) ? p[i >> 1] & 15 : p[i >> 1] >> 4;
+    rowsDone = Math.max(rowsDone, r0 + n);
+    Paint(r0, r0 + n);
+    status.textContent = "Receiving (" + Math.round(100 * (r0 + n) / cap.yRes) + "%)";
+  });
+}
+function Handle(data) {
+  if (typeof data !== "string") return cap ? Rows(data) : null;
+  var msg = JSON.parse(data);
+  if (msg.type === "palette") {
+    palette = msg.colors;
+    if (cap) Paint(0, rowsDone); // (What's already on screen changes color too)
+  } else if (msg.type === "begin") {
+    cap = msg;
+    canvas.width = cap.turns % 2 ? cap.yRes : cap.xRes;
+    canvas.height = cap.turns % 2 ? cap.xRes : cap.yRes;
+    img = ctx.createImageData(canvas.width, canvas.height);
+    vals = new Uint8Array(cap.xRes * cap.yRes);
+    rowsDone = 0;
+    status.textContent = "Receiving";
+  } else if (msg.type === "end") status.textContent = "Capture finished " + new Date().toLocaleTimeString();
+  else if (msg.type === "abort") status.textContent = "Capture cut short " + new Date().toLocaleTimeString();
+}
+var ws = new WebSocket((location.protocol === "https:" ? "wss://" : "ws://") + location.host + "/ws" + (ch ? "?ch=" + encodeURIComponent(ch) : ""));
+ws.binaryType = "arraybuffer";
+ws.onopen = () => status.textContent = "Waiting for a capture";
+ws.onmessage = e => { chain = chain.then(() => Handle(e.data)); };
+ws.onclose = () => status.textContent = "Disconnected";
+</script></body></html>
+"""
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(Main())
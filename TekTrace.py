@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+#----------------------------------------------------------------------------
+# Name:         TekTrace.py
+# Abstract:     Get waveform data back out of a hardcopy.  The scope draws
+#               each trace in its own palette level, so a trace is just the
+#               pixels at that level inside the graticule; for every column
+#               we take the lowest, highest and mean of them, in divisions
+#               from the centre of the graticule (or volts and seconds, given
+#               the scope's settings).  A few milliseconds a frame.
+#
+#               python TekTrace.py capture.npy               (one saved capture)
+#               python TekTrace.py TSC-archive.tsa -o {name}-{n:03d}.csv
+#----------------------------------------------------------------------------
+import collections
+import os
+import numpy as np   # pip install -U numpy
+
+GRATICULE_LEVELS = (1, 2) # Palette levels the graticule is drawn in...
+TRACE_LEVELS = (3, 4, 5, 6, 7) # ...and the ones traces can be
+DIVISIONS = (10, 8) # Graticule divisions across and down
+LINE_FILL = 0.5 # A row or column is a graticule line if it's at least this full, relative to the fullest one
+
+
+# The graticule's edges in pixels (x0, y0 the top left line; x1, y1 the bottom right one) and its divisions
+class Graticule(collections.namedtuple("Graticule", "x0 y0 x1 y1 xDivs yDivs")):
+
+    # Pixels per division across and down
+    def PixelsPerDiv(self):
+        return ((self.x1 - self.x0) / self.xDivs, (self.y1 - self.y0) / self.yDivs)
+
+
+# Find the graticule in a capture (pixel values, the right way up) from its outermost lines.  Returns None if there
+# don't seem to be any.
+def FindGraticule(pix, levels=GRATICULE_LEVELS, divisions=DIVISIONS):
+    lut = np.zeros(256, bool)
+    lut[list(levels)] = True
+    grat = np.take(lut, pix).view(np.uint8) # (Much quicker than np.isin)
+    rows = grat.sum(1, dtype=np.int32)
+    cols = grat.sum(0, dtype=np.int32)
+    if not rows.any():
+        return None
+    rows = np.flatnonzero(rows >= LINE_FILL * rows.max())
+    cols = np.flatnonzero(cols >= LINE_FILL * cols.max())
+    if rows[-1] == rows[0] or cols[-1] == cols[0]:
+        return None
+    return Graticule(int(cols[0]), int(rows[0]), int(cols[-1]), int(rows[-1]), *divisions)
+
+
+# One trace: for each column of the graticule, x and the lowest, highest and mean y of the trace's pixels there
+# (NaN where it has none), in divisions from the centre or in units from Scale()
+Trace = collections.namedtuple("Trace", "level x lo hi mean count")
+
+
+# Pull the traces at each of levels out of pix (pixel values, the right way up) inside graticule grat (found if
+# not given).  Returns a list of Trace, leaving out levels with nothing inside the graticule.
+def ExtractTraces(pix, levels=TRACE_LEVELS, grat=None):
+    if grat is None:
+        grat = FindGraticule(pix)
+        if grat is None:
+            raise ValueError("Can't find the graticule")
+    # Columns are worked on as rows of a transposed copy (and a flipped one, to search from the bottom), which keeps
+    # every reduction running along contiguous memory
+    cols = np.ascontiguousarray(pix[grat.y0:grat.y1+1, grat.x0:grat.x1+1].T)
+    colsUp = np.ascontiguousarray(cols[:,::-1])
+    (xPerDiv, yPerDiv) = grat.PixelsPerDiv()
+    x = np.arange(cols.shape[0]) / xPerDiv
+    rowDivs = ((grat.y1 - grat.y0) / 2 - np.arange(cols.shape[1])) / yPerDiv # Up from the centre line
+    traces = []
+    for level in levels:
+        hit = cols == level
+        count = hit.view(np.uint8).sum(1, dtype=np.int32)
+        if not count.any():
+            continue
+        with np.errstate(invalid="ignore", divide="ignore"):
+            top = np.where(count, rowDivs[hit.argmax(1)], np.nan) # (argmax finds the first hit in each column)
+            bottom = np.where(count, rowDivs[::-1][(colsUp == level).argmax(1)], np.nan)
+            mean = (hit.astype(np.float32) @ rowDivs.astype(np.float32)) / count
+        traces.append(Trace(level, x, bottom, top, mean, count))
+    return traces
+
+
+# A trace in real units: voltsPerDiv and secsPerDiv from the scope's settings, the left edge of the graticule
+# being time 0 and its centre line 0 V
+def Scale(trace, voltsPerDiv=1.0, secsPerDiv=1.0):
+    return trace._replace(x=trace.x * secsPerDiv, lo=trace.lo * voltsPerDiv, hi=trace.hi * voltsPerDiv,
+        mean=trace.mean * voltsPerDiv)
+
+
+# Traces (all the same length) as one table: x, then min, max and mean for each one
+def TraceTable(traces):
+    cols = [traces[0].x] if traces else []
+    for trace in traces:
+        cols += [trace.lo, trace.hi, trace.mean]
+    return np.column_stack(cols) if cols else np.zeros((0,1))
+
+
+def WriteTraceCSV(fileName, traces, xUnit="div", yUnit="div"):
+    header = ",".join(["x_" + xUnit] + ["level%d_%s_%s" % (t.level, what, yUnit) for t in traces for what in ("min", "max", "mean")])
+    np.savetxt(fileName, TraceTable(traces), "%.6g", ",", header=header, comments="")
+
+
+# Same table as the CSV, without the header -- the columns are x, then min, max and mean for each level in turn
+def WriteTraceNPY(fileName, traces, xUnit=None, yUnit=None):
+    np.save(fileName, TraceTable(traces))
+
+
+TRACE_WRITERS = {".csv": WriteTraceCSV, ".npy": WriteTraceNPY}
+
+
+# Write traces in the format implied by fileName's extension, labelled with the units they're in
+def ExportTraces(fileName, traces, xUnit="div", yUnit="div"):
+    ext = os.path.splitext(fileName)[1].lower()
+    if ext not in TRACE_WRITERS:
+        raise ValueError("Don't know how to write traces to '%s' files (try %s)" % (ext, ", ".join(sorted(TRACE_WRITERS))))
+    TRACE_WRITERS[ext](fileName, traces, xUnit, yUnit)
+
+
+# Levels as "5,6" or "all"
+def ParseLevels(text):
+    return TRACE_LEVELS if text == "all" else tuple(int(v) for v in text.split(","))
+
+
+def Main():
+    import argparse
+    import functools
+    import time
+    parser = argparse.ArgumentParser(description="Extract waveform traces from saved Tektronix hardcopies.")
+    parser.add_argument("inputs", nargs="+", help="captures saved as .npy, or archives (.tsa) to do every capture in")
+    parser.add_argument("-o", "--output", metavar="TEMPLATE", default="{name}-traces.csv",
+        help="output file name template; {name} is the input's name without extension and {n} the capture number "
+             "in an archive.  The extension picks the format: %s (default: %%(default)s)" % ", ".join(sorted(TRACE_WRITERS)))
+    parser.add_argument("-l", "--levels", default="all", type=ParseLevels, help="palette levels to extract, e.g. 5,6 (default: all)")
+    parser.add_argument("-g", "--graticule", metavar="X0,Y0,X1,Y1", help="graticule's edges in pixels (default: found from its lines)")
+    parser.add_argument("--divisions", metavar="XxY", default="%dx%d" % DIVISIONS, help="graticule divisions (default: %(default)s)")
+    parser.add_argument("--volts-div", type=float, help="vertical scale, to output volts rather than divisions")
+    parser.add_argument("--time-div", type=float, help="horizontal scale, to output seconds rather than divisions")
+    args = parser.parse_args()
+
+    divisions = tuple(int(v) for v in args.divisions.lower().split("x"))
+    grat = None
+    if args.graticule:
+        grat = Graticule(*(int(v) for v in args.graticule.split(",")), *divisions)
+    xUnit = "div" if args.time_div is None else "s"
+    yUnit = "div" if args.volts_div is None else "V"
+
+    # (capture number, function that loads it) for each capture in an input file
+    def Captures(inputName):
+        if inputName.lower().endswith(".tsa"):
+            from TekArchive import TekArchive
+            archive = TekArchive(inputName)
+            return [(n, functools.partial(archive.View, n)) for n in range(len(archive))]
+        return [(0, functools.partial(np.load, inputName))]
+
+    failed = 0
+    for inputName in args.inputs:
+        name = os.path.splitext(inputName)[0]
+        for n, Load in Captures(inputName):
+            try:
+                pix = Load()
+                t = time.perf_counter()
+                traces = ExtractTraces(pix, args.levels, grat or FindGraticule(pix, divisions=divisions))
+            except (IOError, ValueError) as e: # (DecodeError is a ValueError)
+                print("%s #%d: %s" % (inputName, n, e))
+                failed += 1
+                continue
+            if not traces:
+                print("%s #%d: no traces" % (inputName, n))
+                continue
+            if args.volts_div is not None or args.time_div is not None:
+                traces = [Scale(trace, args.volts_div or 1.0, args.time_div or 1.0) for trace in traces]
+            t = time.perf_counter() - t
+            fileName = args.output.format(name=name, n=n)
+            ExportTraces(fileName, traces, xUnit, yUnit)
+            print("%s  (levels %s, %.1f ms)" % (fileName, ",".join(str(tr.level) for tr in traces), t * 1000))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(Main())